@@ -1,16 +1,67 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, send_file
+from werkzeug.utils import secure_filename
 import os
+import tempfile
 
 app = Flask(__name__)
 DATA_DIR = '/app/data'
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
+# Uploads and downloads move through the volume in fixed-size chunks so
+# memory stays constant no matter how large the file is
+CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', 1024 * 1024))
+
+
+def atomic_write(path, chunks):
+    """Write chunks to a temp file next to path, fsync it, then rename over path.
+
+    Readers either see the old file or the complete new one, never a partial
+    write. Returns the number of bytes written.
+    """
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+    written = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                written += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+    # Persist the rename itself
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+    return written
+
+
+def read_request_chunks(stream):
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def data_file_path(name):
+    filename = secure_filename(name)
+    if not filename or filename.startswith('.upload-'):
+        return None
+    return os.path.join(DATA_DIR, filename)
+
+
 @app.route('/write', methods=['POST'])
 def write_data():
     content = request.json.get('content')
-    with open(os.path.join(DATA_DIR, 'message.txt'), 'w') as f:
-        f.write(content)
+    atomic_write(os.path.join(DATA_DIR, 'message.txt'), [content.encode('utf-8')])
     return jsonify({'status': 'written', 'content': content})
 
 @app.route('/read')
@@ -22,6 +73,32 @@ def read_data():
     except FileNotFoundError:
         return jsonify({'status': 'error', 'message': 'No data found'}), 404
 
+@app.route('/files/<name>', methods=['PUT'])
+def upload_file(name):
+    path = data_file_path(name)
+    if path is None:
+        return jsonify({'status': 'error', 'message': 'Invalid file name'}), 400
+
+    size = atomic_write(path, read_request_chunks(request.stream))
+    return jsonify({'status': 'uploaded', 'file': os.path.basename(path), 'bytes': size}), 201
+
+@app.route('/files/<name>')
+def download_file(name):
+    path = data_file_path(name)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'status': 'error', 'message': 'File not found'}), 404
+
+    # conditional=True enables Range requests (206 Partial Content) and ETags
+    return send_file(path, as_attachment=True, conditional=True)
+
+@app.route('/files')
+def list_files():
+    files = []
+    for entry in os.scandir(DATA_DIR):
+        if entry.is_file() and not entry.name.startswith('.upload-'):
+            files.append({'name': entry.name, 'bytes': entry.stat().st_size})
+    return jsonify({'status': 'listed', 'files': sorted(files, key=lambda f: f['name'])})
+
 @app.route('/')
 def home():
     return '''
@@ -31,6 +108,9 @@ def home():
     <ul>
         <li><code>POST /write</code> - Write data to a file in the volume</li>
         <li><code>GET /read</code> - Read data from the file in the volume</li>
+        <li><code>PUT /files/&lt;name&gt;</code> - Stream a file of any size into the volume</li>
+        <li><code>GET /files/&lt;name&gt;</code> - Download a file from the volume (supports Range)</li>
+        <li><code>GET /files</code> - List files stored in the volume</li>
     </ul>
     '''
 
@@ -38,4 +118,4 @@ if __name__ == '__main__':
     print("Starting Flask application...")
     print(f"Data directory: {DATA_DIR}")
     print("This app will store and retrieve data from this directory.")
-    app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,277 @@
+"""
+Volume I/O benchmark for the data-persistence labs.
+
+Runs a set of storage workloads inside DATA_DIR (the directory the volume is
+mounted on) and prints the results as JSON, so runs against bind mounts,
+named volumes, tmpfs mounts and different storage drivers can be compared
+side by side.
+
+Usage:
+    python volume_bench.py [--dir /app/data] [--label named-volume] [--size-mb 256]
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+DATA_DIR = os.environ.get('DATA_DIR', '/app/data')
+BLOCK_SIZE = 1024 * 1024
+RANDOM_BLOCK_SIZE = 4096
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def latency_summary(samples):
+    """Summarise a list of latencies (seconds) in milliseconds."""
+    return {
+        'count': len(samples),
+        'mean_ms': round(statistics.mean(samples) * 1000, 4),
+        'p50_ms': round(percentile(samples, 50) * 1000, 4),
+        'p99_ms': round(percentile(samples, 99) * 1000, 4),
+        'max_ms': round(max(samples) * 1000, 4),
+    }
+
+
+def throughput(num_bytes, elapsed):
+    return round(num_bytes / elapsed / (1024 * 1024), 2) if elapsed > 0 else None
+
+
+def drop_page_cache(path):
+    """Ask the kernel to forget cached pages of path so reads hit the storage."""
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def describe_mount(path):
+    """Return the filesystem type and source of the mount holding path (Linux only)."""
+    path = os.path.realpath(path)
+    best = None
+    try:
+        with open('/proc/self/mountinfo') as f:
+            for line in f:
+                fields = line.split()
+                mount_point = fields[4]
+                separator = fields.index('-')
+                fs_type, source = fields[separator + 1], fields[separator + 2]
+                if path == mount_point or path.startswith(mount_point.rstrip('/') + '/'):
+                    if best is None or len(mount_point) > len(best['mount_point']):
+                        best = {'mount_point': mount_point, 'fs_type': fs_type, 'source': source}
+    except (OSError, ValueError, IndexError):
+        pass
+    return best
+
+
+def bench_sequential_write(work_dir, size_mb):
+    path = os.path.join(work_dir, 'sequential.bin')
+    block = os.urandom(BLOCK_SIZE)
+    start = time.perf_counter()
+    with open(path, 'wb') as f:
+        for _ in range(size_mb):
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+    elapsed = time.perf_counter() - start
+    return path, {'bytes': size_mb * BLOCK_SIZE, 'seconds': round(elapsed, 4),
+                  'mb_per_s': throughput(size_mb * BLOCK_SIZE, elapsed)}
+
+
+def bench_sequential_read(path):
+    drop_page_cache(path)
+    total = 0
+    start = time.perf_counter()
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            chunk = f.read(BLOCK_SIZE)
+            if not chunk:
+                break
+            total += len(chunk)
+    elapsed = time.perf_counter() - start
+    return {'bytes': total, 'seconds': round(elapsed, 4), 'mb_per_s': throughput(total, elapsed)}
+
+
+def bench_random_read(path, operations):
+    drop_page_cache(path)
+    blocks = os.path.getsize(path) // RANDOM_BLOCK_SIZE
+    offsets = [random.randrange(blocks) * RANDOM_BLOCK_SIZE for _ in range(operations)]
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        start = time.perf_counter()
+        for offset in offsets:
+            os.pread(fd, RANDOM_BLOCK_SIZE, offset)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(fd)
+    return {'operations': operations, 'block_size': RANDOM_BLOCK_SIZE, 'seconds': round(elapsed, 4),
+            'iops': round(operations / elapsed, 1), 'mb_per_s': throughput(operations * RANDOM_BLOCK_SIZE, elapsed)}
+
+
+def bench_random_write(path, operations):
+    blocks = os.path.getsize(path) // RANDOM_BLOCK_SIZE
+    offsets = [random.randrange(blocks) * RANDOM_BLOCK_SIZE for _ in range(operations)]
+    block = os.urandom(RANDOM_BLOCK_SIZE)
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        start = time.perf_counter()
+        for offset in offsets:
+            os.pwrite(fd, block, offset)
+        os.fsync(fd)
+        elapsed = time.perf_counter() - start
+    finally:
+        os.close(fd)
+    return {'operations': operations, 'block_size': RANDOM_BLOCK_SIZE, 'seconds': round(elapsed, 4),
+            'iops': round(operations / elapsed, 1), 'mb_per_s': throughput(operations * RANDOM_BLOCK_SIZE, elapsed)}
+
+
+def bench_fsync_latency(work_dir, operations):
+    path = os.path.join(work_dir, 'fsync.log')
+    record = b'x' * 512
+    samples = []
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND)
+    try:
+        for _ in range(operations):
+            os.write(fd, record)
+            start = time.perf_counter()
+            os.fsync(fd)
+            samples.append(time.perf_counter() - start)
+    finally:
+        os.close(fd)
+    return latency_summary(samples)
+
+
+def bench_small_files(work_dir, count):
+    small_dir = os.path.join(work_dir, 'small')
+    os.mkdir(small_dir)
+    payload = os.urandom(1024)
+
+    start = time.perf_counter()
+    for i in range(count):
+        with open(os.path.join(small_dir, f'file-{i}.dat'), 'wb') as f:
+            f.write(payload)
+    create_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(count):
+        os.unlink(os.path.join(small_dir, f'file-{i}.dat'))
+    delete_elapsed = time.perf_counter() - start
+
+    os.rmdir(small_dir)
+    return {
+        'files': count,
+        'file_size': len(payload),
+        'creates_per_s': round(count / create_elapsed, 1),
+        'deletes_per_s': round(count / delete_elapsed, 1),
+    }
+
+
+def bench_metadata(work_dir, count):
+    """stat / rename / listdir / mkdir-heavy workload, typical of package installs and git checkouts."""
+    meta_dir = os.path.join(work_dir, 'meta')
+    os.mkdir(meta_dir)
+    for i in range(count):
+        open(os.path.join(meta_dir, f'entry-{i}'), 'wb').close()
+
+    start = time.perf_counter()
+    for i in range(count):
+        os.stat(os.path.join(meta_dir, f'entry-{i}'))
+    stat_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(count):
+        os.rename(os.path.join(meta_dir, f'entry-{i}'), os.path.join(meta_dir, f'renamed-{i}'))
+    rename_elapsed = time.perf_counter() - start
+
+    rounds = 20
+    start = time.perf_counter()
+    for _ in range(rounds):
+        with os.scandir(meta_dir) as entries:
+            for _entry in entries:
+                pass
+    listdir_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(count):
+        os.mkdir(os.path.join(meta_dir, f'dir-{i}'))
+    mkdir_elapsed = time.perf_counter() - start
+
+    shutil.rmtree(meta_dir)
+    return {
+        'entries': count,
+        'stats_per_s': round(count / stat_elapsed, 1),
+        'renames_per_s': round(count / rename_elapsed, 1),
+        'mkdirs_per_s': round(count / mkdir_elapsed, 1),
+        'listdir_ms': round(listdir_elapsed / rounds * 1000, 4),
+    }
+
+
+def run_benchmarks(data_dir, label=None, size_mb=256, random_ops=5000, fsync_ops=200, file_count=2000):
+    work_dir = tempfile.mkdtemp(prefix='volume-bench-', dir=data_dir)
+    try:
+        results = {}
+        seq_path, results['sequential_write'] = bench_sequential_write(work_dir, size_mb)
+        results['sequential_read'] = bench_sequential_read(seq_path)
+        results['random_read'] = bench_random_read(seq_path, random_ops)
+        results['random_write'] = bench_random_write(seq_path, random_ops)
+        results['fsync_latency'] = bench_fsync_latency(work_dir, fsync_ops)
+        results['small_files'] = bench_small_files(work_dir, file_count)
+        results['metadata'] = bench_metadata(work_dir, file_count)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'label': label,
+        'data_dir': data_dir,
+        'mount': describe_mount(data_dir),
+        'host': platform.node(),
+        'kernel': platform.release(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'parameters': {'size_mb': size_mb, 'random_ops': random_ops,
+                       'fsync_ops': fsync_ops, 'file_count': file_count},
+        'results': results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark I/O performance of a mounted Docker volume')
+    parser.add_argument('--dir', default=DATA_DIR, help='Directory to benchmark (default: DATA_DIR or /app/data)')
+    parser.add_argument('--label', help='Name for this run, e.g. bind-mount, named-volume, tmpfs')
+    parser.add_argument('--size-mb', type=int, default=256, help='Size of the sequential test file in MB')
+    parser.add_argument('--random-ops', type=int, default=5000, help='Number of random 4 KB reads and writes')
+    parser.add_argument('--fsync-ops', type=int, default=200, help='Number of fsync calls to time')
+    parser.add_argument('--files', type=int, default=2000, help='Number of files for small-file and metadata tests')
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.dir):
+        print(f"Error: {args.dir} is not a directory", file=sys.stderr)
+        sys.exit(1)
+
+    report = run_benchmarks(args.dir, label=args.label, size_mb=args.size_mb, random_ops=args.random_ops,
+                            fsync_ops=args.fsync_ops, file_count=args.files)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
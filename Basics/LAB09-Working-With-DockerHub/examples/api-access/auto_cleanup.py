@@ -4,15 +4,26 @@ DockerHub Tag Cleanup Utility
 
 This script helps manage Docker Hub repositories by automatically deleting old or unused tags
 based on age, count limits, or naming patterns.
+
+Tag pages are fetched concurrently once the total count is known, and deletions run through a
+bounded worker pool behind a token-bucket rate limiter. Progress is checkpointed to disk so an
+interrupted run can be resumed.
 """
 
 import requests
 import os
 import sys
+import json
+import time
+import random
 import argparse
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 
+from dockerhub_api import DockerHubClient, PAGE_SIZE
+
 # Load environment variables from .env file if present
 load_dotenv()
 
@@ -20,8 +31,10 @@ load_dotenv()
 DOCKER_HUB_USERNAME = os.environ.get('DOCKER_HUB_USERNAME')
 DOCKER_HUB_TOKEN = os.environ.get('DOCKER_HUB_TOKEN')
 
-# Base API URL
-API_URL = "https://hub.docker.com/v2"
+# Deletion engine defaults
+DEFAULT_WORKERS = 8
+DEFAULT_RATE = 5.0  # deletions per second
+DEFAULT_DELETE_RETRIES = 4
 
 # Check if credentials are set
 if not DOCKER_HUB_USERNAME or not DOCKER_HUB_TOKEN:
@@ -29,231 +42,396 @@ if not DOCKER_HUB_USERNAME or not DOCKER_HUB_TOKEN:
     print("Please set DOCKER_HUB_USERNAME and DOCKER_HUB_TOKEN environment variables")
     sys.exit(1)
 
-# Headers for authentication
-headers = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {DOCKER_HUB_TOKEN}"
-}
+class TokenBucket:
+    """Thread-safe token bucket: allows `rate` operations per second with bursts up to `capacity`"""
 
-def call_api(method, endpoint, data=None, params=None):
-    """Generic function to call the Docker Hub API with error handling"""
-    url = f"{API_URL}{endpoint}"
-    
-    try:
-        if method.lower() == 'get':
-            response = requests.get(url, headers=headers, params=params)
-        elif method.lower() == 'delete':
-            response = requests.delete(url, headers=headers)
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class Checkpoint:
+    """Append-only progress file recording the deletion plan and every completed deletion
+
+    The first line holds the planned tag names and the key of the run that made
+    them (e.g. the policy); each following line records one deleted tag. Appends
+    are flushed and fsynced so a crash loses at most the deletion in flight.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    def load(self):
+        """Return (key, plan, deleted) from an existing checkpoint, or (None, None, set()) if there is none"""
+        if not os.path.exists(self.path):
+            return None, None, set()
+
+        key, plan, deleted = None, None, set()
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from an interrupted write
+                    continue
+                if 'plan' in record:
+                    key, plan = record.get('key'), record['plan']
+                elif 'deleted' in record:
+                    deleted.add(record['deleted'])
+        return key, plan, deleted
+
+    def start(self, repository_name, key, plan):
+        self.file = open(self.path, 'w')
+        self._write({'repository': repository_name, 'key': key, 'plan': plan,
+                     'created': datetime.datetime.now(datetime.timezone.utc).isoformat()})
+
+    def resume(self):
+        self.file = open(self.path, 'a')
+
+    def record(self, tag_name):
+        self._write({'deleted': tag_name})
+
+    def _write(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self, completed):
+        if self.file:
+            self.file.close()
+            self.file = None
+        if completed and os.path.exists(self.path):
+            os.remove(self.path)
+
+class CleanupEngine:
+    """Fetches tags and deletes them in parallel with rate limiting, retries and checkpoints"""
+
+    def __init__(self, client, workers=DEFAULT_WORKERS, rate=DEFAULT_RATE,
+                 max_retries=DEFAULT_DELETE_RETRIES, checkpoint_dir='.', resume=True, dry_run=False):
+        self.client = client
+        self.workers = workers
+        self.limiter = TokenBucket(rate)
+        self.max_retries = max_retries
+        self.checkpoint_dir = checkpoint_dir
+        self.resume = resume
+        self.dry_run = dry_run
+
+    def checkpoint_path(self, repository_name):
+        return os.path.join(self.checkpoint_dir, f".cleanup-{DOCKER_HUB_USERNAME}-{repository_name}.checkpoint")
+
+    def pending_plan(self, repository_name, key):
+        """Return (tags still to delete, already deleted count) from an interrupted run, or None
+
+        Only a checkpoint written with the same key (the same policy or plan) is
+        resumed; one left by a different run is ignored and replaced.
+        """
+        if not self.resume or self.dry_run:
+            return None
+        checkpoint_key, plan, deleted = Checkpoint(self.checkpoint_path(repository_name)).load()
+        if plan is None:
+            return None
+        if checkpoint_key != key:
+            print(f"Ignoring checkpoint for {repository_name} left by a different run ({checkpoint_key})")
+            return None
+        return [name for name in plan if name not in deleted], len(deleted)
+
+    def get_repository_tags(self, repository_name):
+        """Fetch the first page to learn the total count, then fetch the remaining pages concurrently"""
+        endpoint = f"/repositories/{DOCKER_HUB_USERNAME}/{repository_name}/tags"
+        first = self.client.request('get', endpoint, params={'page': 1, 'page_size': PAGE_SIZE})
+        tags = list(first.get('results', []))
+
+        page_count = -(-first.get('count', 0) // PAGE_SIZE)
+        if page_count > 1:
+            fetch_page = lambda page: self.client.request(
+                'get', endpoint, params={'page': page, 'page_size': PAGE_SIZE}).get('results', [])
+            for results in self.client.map_concurrent(fetch_page, range(2, page_count + 1), self.workers):
+                tags.extend(results)
+
+        return tags
+
+    def delete_tag(self, repository_name, tag_name):
+        """Delete one tag, retrying transient failures with exponential backoff and jitter
+
+        Every attempt, retries included, goes through the rate limiter, so the
+        client's own retries are turned off here.
+        """
+        endpoint = f"/repositories/{DOCKER_HUB_USERNAME}/{repository_name}/tags/{tag_name}"
+
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                self.client.send('delete', endpoint, max_retries=0)
+                return True
+            except requests.exceptions.HTTPError as e:
+                status = e.response.status_code if e.response is not None else None
+                if status == 404:
+                    # Already gone, e.g. deleted by an earlier interrupted run
+                    return True
+                if status is not None and status < 500 and status != 429:
+                    print(f"Failed to delete {repository_name}:{tag_name}: {e}")
+                    return False
+                error = e
+            except requests.exceptions.RequestException as e:
+                status, error = None, e
+
+            # After a 429 the client pauses every thread until Retry-After
+            if attempt < self.max_retries and status != 429:
+                time.sleep(min(2 ** attempt, 30) * random.uniform(0.5, 1.5))
+
+        print(f"Failed to delete {repository_name}:{tag_name} after {self.max_retries + 1} attempts: {error}")
+        return False
+
+    def delete_tags(self, repository_name, key, tag_names, already_deleted=0):
+        """Delete tag_names through the worker pool and return the number deleted
+
+        key identifies the run in the checkpoint, see pending_plan().
+        """
+        if self.dry_run:
+            for tag_name in tag_names:
+                print(f"Would delete tag {repository_name}:{tag_name}")
+            return 0
+
+        checkpoint = Checkpoint(self.checkpoint_path(repository_name))
+        if already_deleted:
+            checkpoint.resume()
         else:
-            raise ValueError(f"Unsupported method: {method}")
-        
-        response.raise_for_status()
-        return response.json() if response.text else {}
-    
-    except requests.exceptions.HTTPError as e:
-        print(f"HTTP Error: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"Response: {e.response.text}")
-        return None
-    except Exception as e:
-        print(f"Error: {e}")
-        return None
-
-def get_repository_tags(repository_name):
-    """Get all tags for a repository with pagination support"""
-    all_tags = []
-    page = 1
-    page_size = 100  # Maximum allowed by Docker Hub API
-    
-    while True:
-        params = {
-            'page': page,
-            'page_size': page_size
-        }
-        
-        response = call_api('get', f"/repositories/{DOCKER_HUB_USERNAME}/{repository_name}/tags", params=params)
-        
-        if not response or not response.get('results'):
-            break
-            
-        all_tags.extend(response['results'])
-        
-        # Check if there are more pages
-        if page * page_size >= response.get('count', 0):
-            break
-            
-        page += 1
-    
-    return all_tags
-
-def delete_tag(repository_name, tag_name):
-    """Delete a tag from a repository"""
-    print(f"Deleting tag {repository_name}:{tag_name}...")
-    
-    response = call_api('delete', f"/repositories/{DOCKER_HUB_USERNAME}/{repository_name}/tags/{tag_name}")
-    
-    if response is not None:  # Could be empty dict for successful delete
-        print(f"Tag {repository_name}:{tag_name} deleted successfully")
-        return True
-    
-    return False
-
-def cleanup_by_age(repository_name, days_old):
-    """Delete tags older than specified days"""
-    print(f"Cleaning up tags older than {days_old} days from {repository_name}...")
-    
-    tags = get_repository_tags(repository_name)
+            checkpoint.start(repository_name, key, tag_names)
+
+        deleted_count = 0
+        failed = []
+        total = len(tag_names) + already_deleted
+        completed = False
+        handled = set()
+
+        def handle(future):
+            nonlocal deleted_count
+            handled.add(future)
+            tag_name = futures[future]
+            if future.result():
+                checkpoint.record(tag_name)
+                deleted_count += 1
+                print(f"[{already_deleted + deleted_count}/{total}] Deleted {repository_name}:{tag_name}")
+            else:
+                failed.append(tag_name)
+
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = {executor.submit(self.delete_tag, repository_name, name): name for name in tag_names}
+            try:
+                for future in as_completed(futures):
+                    handle(future)
+            except KeyboardInterrupt:
+                # Drop the queued deletions, let the running ones finish and checkpoint them
+                print("Interrupted; waiting for deletions in progress to finish")
+                executor.shutdown(wait=True, cancel_futures=True)
+                for future in futures:
+                    if future not in handled and not future.cancelled() and future.exception() is None:
+                        handle(future)
+                raise
+            completed = not failed
+        finally:
+            executor.shutdown(wait=True)
+            checkpoint.close(completed)
+
+        if failed:
+            print(f"{len(failed)} deletions failed; rerun the same command to retry them")
+        return deleted_count
+
+def run_cleanup(engine, repository_name, policy, select_tags):
+    """Resume an interrupted run of the same policy if one exists, otherwise fetch tags, select them and delete"""
+    key = json.dumps(policy, sort_keys=True)
+    pending = engine.pending_plan(repository_name, key)
+    if pending is not None:
+        tag_names, already_deleted = pending
+        print(f"Resuming interrupted cleanup of {repository_name}: "
+              f"{already_deleted} already deleted, {len(tag_names)} remaining")
+        deleted_count = engine.delete_tags(repository_name, key, tag_names, already_deleted)
+        print(f"Cleanup complete. Deleted {deleted_count} tags from {repository_name}")
+        return
+
+    try:
+        tags = engine.get_repository_tags(repository_name)
+    except requests.exceptions.RequestException as e:
+        print(f"Error fetching tags for {repository_name}: {e}")
+        return
     if not tags:
         print(f"No tags found in repository {repository_name}")
         return
-    
-    # Calculate the cutoff date
-    cutoff_date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days_old)
-    
-    deleted_count = 0
-    protected_tags = ['latest']  # Add any tags you want to protect
-    
-    for tag in tags:
-        tag_name = tag.get('name')
-        
-        # Skip protected tags
-        if tag_name in protected_tags:
-            print(f"Skipping protected tag: {tag_name}")
-            continue
-        
-        # Parse the last_updated date
-        last_updated_str = tag.get('last_updated')
-        if not last_updated_str:
-            print(f"No last_updated information for tag {tag_name}, skipping")
-            continue
-        
-        # Convert to datetime object
-        try:
-            last_updated = datetime.datetime.fromisoformat(last_updated_str.replace('Z', '+00:00'))
-        except ValueError:
-            print(f"Could not parse date for tag {tag_name}: {last_updated_str}")
-            continue
-        
-        # Check if older than cutoff
-        if last_updated < cutoff_date:
-            print(f"Tag {tag_name} is older than {days_old} days (last updated: {last_updated_str})")
-            if delete_tag(repository_name, tag_name):
-                deleted_count += 1
-    
+
+    tag_names = select_tags(tags)
+    deleted_count = engine.delete_tags(repository_name, key, tag_names)
     print(f"Cleanup complete. Deleted {deleted_count} tags from {repository_name}")
 
-def cleanup_by_count(repository_name, keep_count):
+def cleanup_by_age(engine, repository_name, days_old):
+    """Delete tags older than specified days"""
+    print(f"Cleaning up tags older than {days_old} days from {repository_name}...")
+
+    def select_tags(tags):
+        # Calculate the cutoff date
+        cutoff_date = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days_old)
+        protected_tags = ['latest']  # Add any tags you want to protect
+        selected = []
+
+        for tag in tags:
+            tag_name = tag.get('name')
+
+            # Skip protected tags
+            if tag_name in protected_tags:
+                print(f"Skipping protected tag: {tag_name}")
+                continue
+
+            # Parse the last_updated date
+            last_updated_str = tag.get('last_updated')
+            if not last_updated_str:
+                print(f"No last_updated information for tag {tag_name}, skipping")
+                continue
+
+            # Convert to datetime object
+            try:
+                last_updated = datetime.datetime.fromisoformat(last_updated_str.replace('Z', '+00:00'))
+            except ValueError:
+                print(f"Could not parse date for tag {tag_name}: {last_updated_str}")
+                continue
+
+            # Check if older than cutoff
+            if last_updated < cutoff_date:
+                print(f"Tag {tag_name} is older than {days_old} days (last updated: {last_updated_str})")
+                selected.append(tag_name)
+
+        return selected
+
+    run_cleanup(engine, repository_name, {'age': days_old}, select_tags)
+
+def cleanup_by_count(engine, repository_name, keep_count):
     """Keep only the specified number of most recent tags"""
     print(f"Cleaning up repository {repository_name}, keeping {keep_count} most recent tags...")
-    
-    tags = get_repository_tags(repository_name)
-    if not tags:
-        print(f"No tags found in repository {repository_name}")
-        return
-    
-    # Sort tags by last_updated (most recent first)
-    sorted_tags = sorted(
-        tags, 
-        key=lambda x: x.get('last_updated', '1970-01-01T00:00:00.000000Z'), 
-        reverse=True
-    )
-    
-    # Keep the specified number of most recent tags
-    tags_to_keep = sorted_tags[:keep_count]
-    tags_to_delete = sorted_tags[keep_count:]
-    
-    # Get names of tags to keep for reporting
-    keep_names = [tag.get('name') for tag in tags_to_keep]
-    print(f"Keeping these tags: {', '.join(keep_names)}")
-    
-    # Delete older tags
-    deleted_count = 0
-    protected_tags = ['latest']  # Add any tags you want to protect
-    
-    for tag in tags_to_delete:
-        tag_name = tag.get('name')
-        
-        # Skip protected tags
-        if tag_name in protected_tags:
-            print(f"Skipping protected tag: {tag_name}")
-            continue
-            
-        if delete_tag(repository_name, tag_name):
-            deleted_count += 1
-    
-    print(f"Cleanup complete. Deleted {deleted_count} tags from {repository_name}")
 
-def cleanup_by_pattern(repository_name, pattern):
+    def select_tags(tags):
+        # Sort tags by last_updated (most recent first)
+        sorted_tags = sorted(
+            tags,
+            key=lambda x: x.get('last_updated') or '1970-01-01T00:00:00.000000Z',
+            reverse=True
+        )
+
+        # Keep the specified number of most recent tags
+        tags_to_keep = sorted_tags[:keep_count]
+        tags_to_delete = sorted_tags[keep_count:]
+
+        # Get names of tags to keep for reporting
+        keep_names = [tag.get('name') for tag in tags_to_keep]
+        print(f"Keeping these tags: {', '.join(keep_names)}")
+
+        protected_tags = ['latest']  # Add any tags you want to protect
+        selected = []
+        for tag in tags_to_delete:
+            tag_name = tag.get('name')
+
+            # Skip protected tags
+            if tag_name in protected_tags:
+                print(f"Skipping protected tag: {tag_name}")
+                continue
+
+            selected.append(tag_name)
+
+        return selected
+
+    run_cleanup(engine, repository_name, {'keep': keep_count}, select_tags)
+
+def cleanup_by_pattern(engine, repository_name, pattern):
     """Delete tags matching the specified pattern"""
     import re
-    
+
     print(f"Cleaning up tags matching pattern '{pattern}' from {repository_name}...")
-    
+
     try:
         regex = re.compile(pattern)
     except re.error as e:
         print(f"Invalid regular expression: {e}")
         return
-    
-    tags = get_repository_tags(repository_name)
-    if not tags:
-        print(f"No tags found in repository {repository_name}")
-        return
-    
-    deleted_count = 0
-    protected_tags = ['latest']  # Add any tags you want to protect
-    
-    for tag in tags:
-        tag_name = tag.get('name')
-        
-        # Skip protected tags
-        if tag_name in protected_tags:
-            continue
-            
-        # Check if tag matches pattern
-        if regex.search(tag_name):
-            print(f"Tag {tag_name} matches pattern '{pattern}'")
-            if delete_tag(repository_name, tag_name):
-                deleted_count += 1
-    
-    print(f"Cleanup complete. Deleted {deleted_count} tags from {repository_name}")
+
+    def select_tags(tags):
+        protected_tags = ['latest']  # Add any tags you want to protect
+        selected = []
+
+        for tag in tags:
+            tag_name = tag.get('name')
+
+            # Skip protected tags
+            if tag_name in protected_tags:
+                continue
+
+            # Check if tag matches pattern
+            if regex.search(tag_name):
+                print(f"Tag {tag_name} matches pattern '{pattern}'")
+                selected.append(tag_name)
+
+        return selected
+
+    run_cleanup(engine, repository_name, {'pattern': pattern}, select_tags)
 
 def main():
     """Main function to parse arguments and execute commands"""
     parser = argparse.ArgumentParser(description='Docker Hub Tag Cleanup Utility')
     parser.add_argument('repository', help='Repository name to clean up')
-    
+
     # Create a group for cleanup methods (mutually exclusive)
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument('--age', type=int, help='Delete tags older than specified days')
     group.add_argument('--keep', type=int, help='Keep only the specified number of most recent tags')
     group.add_argument('--pattern', help='Delete tags matching the specified regex pattern')
-    
+
     # Add dry-run option
     parser.add_argument('--dry-run', action='store_true', help='Simulate the cleanup without actually deleting tags')
-    
+
+    # Deletion engine options
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Number of concurrent page fetches and deletions (default: {DEFAULT_WORKERS})')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'Maximum deletions per second (default: {DEFAULT_RATE})')
+    parser.add_argument('--retries', type=int, default=DEFAULT_DELETE_RETRIES,
+                        help=f'Retries per failed deletion (default: {DEFAULT_DELETE_RETRIES})')
+    parser.add_argument('--checkpoint-dir', default='.', help='Directory for progress checkpoints (default: .)')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='Ignore any checkpoint left by an interrupted run and start over')
+
     args = parser.parse_args()
-    
+
     # Handle dry run mode
-    global delete_tag
     if args.dry_run:
         print("DRY RUN MODE: No tags will be actually deleted")
-        # Save the original function
-        original_delete_tag = delete_tag
-        # Replace with a version that just logs
-        delete_tag = lambda repo, tag: print(f"Would delete tag {repo}:{tag}")
-    
+
+    client = DockerHubClient(DOCKER_HUB_USERNAME, DOCKER_HUB_TOKEN, pool_size=args.workers)
+    engine = CleanupEngine(client, workers=args.workers, rate=args.rate, max_retries=args.retries,
+                           checkpoint_dir=args.checkpoint_dir, resume=not args.no_resume,
+                           dry_run=args.dry_run)
+
     # Execute the requested cleanup method
-    if args.age:
-        cleanup_by_age(args.repository, args.age)
-    elif args.keep:
-        cleanup_by_count(args.repository, args.keep)
-    elif args.pattern:
-        cleanup_by_pattern(args.repository, args.pattern)
-    
-    # Restore original function if in dry-run mode
-    if args.dry_run:
-        delete_tag = original_delete_tag
+    with client:
+        if args.age:
+            cleanup_by_age(engine, args.repository, args.age)
+        elif args.keep:
+            cleanup_by_count(engine, args.repository, args.keep)
+        elif args.pattern:
+            cleanup_by_pattern(engine, args.repository, args.pattern)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+"""
+DockerHub Cleanup Planner
+
+Plans tag cleanups across every repository in a namespace in one pass, using combined
+retention policies such as "keep the last 10 tags AND anything newer than 30 days AND
+all semver releases". Tags are read from a local inventory cache that is refreshed
+incrementally, and the result is a deterministic deletion plan that can be reviewed
+before it is executed in bulk.
+
+Usage:
+    python cleanup_planner.py refresh
+    python cleanup_planner.py plan --keep-last 10 --keep-newer-than 30 --protect-semver -o plan.json
+    python cleanup_planner.py execute plan.json
+"""
+
+import requests
+import os
+import re
+import sys
+import json
+import hashlib
+import argparse
+import datetime
+from dotenv import load_dotenv
+
+from dockerhub_api import DockerHubClient, PAGE_SIZE
+from auto_cleanup import CleanupEngine, DEFAULT_WORKERS, DEFAULT_RATE, DEFAULT_DELETE_RETRIES
+
+# Load environment variables from .env file if present
+load_dotenv()
+
+# Configuration
+DOCKER_HUB_USERNAME = os.environ.get('DOCKER_HUB_USERNAME')
+DOCKER_HUB_TOKEN = os.environ.get('DOCKER_HUB_TOKEN')
+
+INVENTORY_FILE = os.environ.get('DOCKER_HUB_INVENTORY', '.dockerhub-inventory.json')
+
+# Tags that are never deleted, whatever the policy says
+PROTECTED_TAGS = ['latest']
+
+# Release tags such as 1.2.3 or v1.2.3 (pre-release and build suffixes are not releases)
+SEMVER_PATTERN = re.compile(r'^v?\d+\.\d+\.\d+$')
+
+DEFAULT_POLICY = {
+    'keep_last': None,
+    'keep_newer_than_days': None,
+    'protect_semver': False,
+    'protect_patterns': [],
+    'delete_pattern': None
+}
+
+# Tag fields kept in the inventory cache and in plans
+TAG_FIELDS = ('name', 'last_updated', 'digest', 'full_size')
+
+def utc_now():
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+# ---------------------------------------------------------------------------
+# Inventory cache
+# ---------------------------------------------------------------------------
+
+def load_inventory(path=INVENTORY_FILE):
+    if not os.path.exists(path):
+        return {'namespace': DOCKER_HUB_USERNAME, 'refreshed_at': None, 'repositories': {}}
+    with open(path) as f:
+        inventory = json.load(f)
+    if inventory.get('namespace') != DOCKER_HUB_USERNAME:
+        print(f"Inventory {path} belongs to {inventory.get('namespace')}, starting a new one")
+        return {'namespace': DOCKER_HUB_USERNAME, 'refreshed_at': None, 'repositories': {}}
+    return inventory
+
+def save_inventory(inventory, path=INVENTORY_FILE):
+    """Write the inventory atomically so an interrupted save never leaves a truncated cache"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(inventory, f, indent=2, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def fetch_tags(client, repository_name, etag=None):
+    """Fetch all tags of a repository, or return None if the ETag shows nothing changed
+
+    Returns (tags, etag).
+    """
+    endpoint = f"/repositories/{DOCKER_HUB_USERNAME}/{repository_name}/tags"
+    headers = {'If-None-Match': etag} if etag else None
+    response = client.send('get', endpoint, params={'page': 1, 'page_size': PAGE_SIZE}, headers=headers)
+    if response.status_code == 304:
+        return None, etag
+
+    page = response.json()
+    tags = list(page.get('results', []))
+    while page.get('next'):
+        page = client.request('get', page['next'])
+        tags.extend(page.get('results', []))
+
+    compact = [{field: tag.get(field) for field in TAG_FIELDS} for tag in tags]
+    return compact, response.headers.get('ETag')
+
+def refresh_inventory(client, inventory, repositories=None, force=False, workers=None):
+    """Bring the cached inventory up to date with as few API calls as possible
+
+    The repository list is always fetched. A repository's tags are only refetched
+    when its last_updated timestamp has changed, and then with If-None-Match so
+    an unchanged tag list costs a single 304 response.
+    """
+    cached = inventory.get('repositories', {})
+    remote = {repo['name']: repo for repo in client.list_repositories()}
+    selected = [name for name in sorted(remote) if not repositories or name in repositories]
+
+    def refresh(name):
+        repo = remote[name]
+        entry = cached.get(name)
+        if entry and not force and entry.get('last_updated') == repo.get('last_updated'):
+            return name, entry, 'cached'
+
+        etag = entry.get('tags_etag') if entry and not force else None
+        tags, new_etag = fetch_tags(client, name, etag)
+        if tags is None:
+            return name, dict(entry, last_updated=repo.get('last_updated')), 'not modified'
+        return name, {'last_updated': repo.get('last_updated'), 'tags_etag': new_etag, 'tags': tags}, 'fetched'
+
+    results = client.map_concurrent(refresh, selected, workers)
+
+    # Repositories that no longer exist on Docker Hub drop out of the inventory
+    refreshed = {name: entry for name, entry in cached.items() if name in remote}
+    counts = {'cached': 0, 'not modified': 0, 'fetched': 0}
+    for name, entry, status in results:
+        refreshed[name] = entry
+        counts[status] += 1
+
+    inventory['repositories'] = refreshed
+    inventory['refreshed_at'] = utc_now().isoformat()
+    print(f"Inventory refreshed: {counts['fetched']} fetched, {counts['not modified']} not modified, "
+          f"{counts['cached']} unchanged, {len(refreshed)} repositories total")
+    return inventory
+
+# ---------------------------------------------------------------------------
+# Policies
+# ---------------------------------------------------------------------------
+
+def load_policies(policy_file=None, overrides=None):
+    """Return (default policy, per-repository policies) from a policy file plus CLI overrides
+
+    A policy file looks like:
+        {"default": {"keep_last": 10, "protect_semver": true},
+         "repositories": {"my-app": {"keep_newer_than_days": 90}}}
+    Repository entries are merged over the default.
+    """
+    default = dict(DEFAULT_POLICY)
+    per_repository = {}
+    if policy_file:
+        with open(policy_file) as f:
+            config = json.load(f)
+        default.update(config.get('default', {}))
+        per_repository = config.get('repositories', {})
+
+    default.update({key: value for key, value in (overrides or {}).items()
+                    if value is not None and value is not False and value != []})
+    return default, {name: dict(default, **policy) for name, policy in per_repository.items()}
+
+def validate_policy(policy):
+    unknown = set(policy) - set(DEFAULT_POLICY)
+    if unknown:
+        raise ValueError(f"Unknown policy keys: {', '.join(sorted(unknown))}")
+    if policy['keep_last'] is not None and policy['keep_last'] < 1:
+        raise ValueError("keep_last must be at least 1")
+    has_rule = (policy['keep_last'] is not None or policy['keep_newer_than_days'] is not None
+                or policy['protect_semver'] or policy['protect_patterns'] or policy['delete_pattern'])
+    if not has_rule:
+        raise ValueError("Policy has no rules and would delete every tag; "
+                         "set at least one keep/protect rule or a delete pattern")
+
+def evaluate_policy(tags, policy, now):
+    """Split tags into (to_delete, kept) under a combined policy
+
+    A tag is kept if ANY rule protects it: it is among the keep_last most recent,
+    newer than keep_newer_than_days, a semver release, matches a protect pattern,
+    or is in PROTECTED_TAGS. When delete_pattern is set, only matching tags are
+    candidates for deletion. kept maps tag name to the reasons it was kept.
+    """
+    # Most recent first; ties broken by name so the result is deterministic
+    ordered = sorted(tags, key=lambda tag: tag['name'])
+    ordered.sort(key=lambda tag: tag.get('last_updated') or '', reverse=True)
+
+    protect_patterns = [re.compile(pattern) for pattern in policy['protect_patterns']]
+    delete_pattern = re.compile(policy['delete_pattern']) if policy['delete_pattern'] else None
+    cutoff = None
+    if policy['keep_newer_than_days'] is not None:
+        cutoff = now - datetime.timedelta(days=policy['keep_newer_than_days'])
+
+    to_delete, kept = [], {}
+    for position, tag in enumerate(ordered):
+        name = tag['name']
+        reasons = []
+        if name in PROTECTED_TAGS:
+            reasons.append('protected')
+        if policy['keep_last'] is not None and position < policy['keep_last']:
+            reasons.append(f"last-{policy['keep_last']}")
+        if cutoff is not None:
+            last_updated = parse_timestamp(tag.get('last_updated'))
+            if last_updated is None:
+                reasons.append('unknown-age')
+            elif last_updated >= cutoff:
+                reasons.append(f"newer-than-{policy['keep_newer_than_days']}d")
+        if policy['protect_semver'] and SEMVER_PATTERN.match(name):
+            reasons.append('semver')
+        if any(pattern.search(name) for pattern in protect_patterns):
+            reasons.append('pattern')
+        if delete_pattern and not delete_pattern.search(name):
+            reasons.append('not-matched')
+
+        if reasons:
+            kept[name] = reasons
+        else:
+            to_delete.append(tag)
+
+    to_delete.sort(key=lambda tag: tag['name'])
+    return to_delete, kept
+
+# ---------------------------------------------------------------------------
+# Plans
+# ---------------------------------------------------------------------------
+
+def build_plan(inventory, default_policy, repository_policies, repositories=None, now=None):
+    now = now or utc_now()
+    entries = []
+
+    for name in sorted(inventory['repositories']):
+        if repositories and name not in repositories:
+            continue
+        policy = repository_policies.get(name, default_policy)
+        validate_policy(policy)
+        tags = inventory['repositories'][name]['tags']
+        to_delete, kept = evaluate_policy(tags, policy, now)
+        entries.append({
+            'repository': name,
+            'policy': policy,
+            'total_tags': len(tags),
+            'kept_tags': len(kept),
+            'delete': to_delete
+        })
+
+    # The plan id only depends on the planned deletions, so the same inventory,
+    # policies and as-of time always produce the same id
+    canonical = json.dumps([{'repository': entry['repository'], 'delete': [tag['name'] for tag in entry['delete']]}
+                            for entry in entries], sort_keys=True)
+    return {
+        'plan_id': hashlib.sha256(canonical.encode()).hexdigest()[:16],
+        'namespace': inventory['namespace'],
+        'as_of': now.isoformat(),
+        'inventory_refreshed_at': inventory.get('refreshed_at'),
+        'summary': {
+            'repositories': len(entries),
+            'tags': sum(entry['total_tags'] for entry in entries),
+            'delete': sum(len(entry['delete']) for entry in entries),
+            'bytes': sum(tag.get('full_size') or 0 for entry in entries for tag in entry['delete'])
+        },
+        'repositories': entries
+    }
+
+def print_plan_summary(plan):
+    print(f"Plan {plan['plan_id']} for {plan['namespace']} (as of {plan['as_of']}):")
+    for entry in plan['repositories']:
+        print(f"- {entry['repository']}: delete {len(entry['delete'])} of {entry['total_tags']} tags")
+    summary = plan['summary']
+    print(f"Total: delete {summary['delete']} of {summary['tags']} tags in {summary['repositories']} repositories "
+          f"({summary['bytes'] / 1_000_000:.2f} MB)")
+
+def unchanged_tags(client, repository_name, planned):
+    """Names of the planned tags that still point at the digest recorded in the plan
+
+    A tag that was re-pushed after planning now holds a different image, which
+    nobody reviewed, so it is left alone.
+    """
+    current, _ = fetch_tags(client, repository_name)
+    digests = {tag['name']: tag.get('digest') for tag in current}
+    unchanged = []
+    for tag in planned:
+        if tag['name'] not in digests:
+            continue
+        if digests[tag['name']] != tag.get('digest'):
+            print(f"Skipping {repository_name}:{tag['name']}: re-pushed since the plan was made")
+            continue
+        unchanged.append(tag['name'])
+    return unchanged
+
+def execute_plan(plan, engine, inventory_path=INVENTORY_FILE):
+    """Delete every tag in the plan, one repository at a time through the cleanup engine
+
+    A checkpoint is only resumed if it was written for this plan, and tags whose
+    digest changed since planning are skipped.
+    """
+    if plan['namespace'] != DOCKER_HUB_USERNAME:
+        print(f"Error: plan is for {plan['namespace']}, but credentials are for {DOCKER_HUB_USERNAME}")
+        return 0
+
+    total_deleted = 0
+    for entry in plan['repositories']:
+        repository_name = entry['repository']
+        if not entry['delete']:
+            continue
+        tag_names, already_deleted = [tag['name'] for tag in entry['delete']], 0
+        pending = engine.pending_plan(repository_name, plan['plan_id'])
+        if pending is not None:
+            tag_names, already_deleted = pending
+            print(f"Resuming interrupted cleanup of {repository_name}: "
+                  f"{already_deleted} already deleted, {len(tag_names)} remaining")
+
+        remaining = set(tag_names)
+        tag_names = unchanged_tags(engine.client, repository_name,
+                                   [tag for tag in entry['delete'] if tag['name'] in remaining])
+        if not tag_names:
+            continue
+
+        print(f"Deleting {len(tag_names)} tags from {repository_name}...")
+        total_deleted += engine.delete_tags(repository_name, plan['plan_id'], tag_names, already_deleted)
+
+    # Force a full refetch of the touched repositories on the next refresh, since
+    # deleting tags does not necessarily change a repository's last_updated
+    if not engine.dry_run and os.path.exists(inventory_path):
+        inventory = load_inventory(inventory_path)
+        for entry in plan['repositories']:
+            inventory['repositories'].pop(entry['repository'], None)
+        save_inventory(inventory, inventory_path)
+
+    print(f"Plan {plan['plan_id']} executed. Deleted {total_deleted} tags")
+    return total_deleted
+
+def main():
+    """Main function to parse arguments and execute commands"""
+    parser = argparse.ArgumentParser(description='Docker Hub Multi-Repository Cleanup Planner')
+    parser.add_argument('--inventory', default=INVENTORY_FILE, help=f'Inventory cache file (default: {INVENTORY_FILE})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Number of concurrent API calls (default: {DEFAULT_WORKERS})')
+    subparsers = parser.add_subparsers(dest='command', help='Commands')
+
+    # Refresh command
+    refresh_parser = subparsers.add_parser('refresh', help='Update the local tag inventory cache')
+    refresh_parser.add_argument('--repos', nargs='+', help='Only refresh these repositories')
+    refresh_parser.add_argument('--force', action='store_true', help='Refetch every repository, ignoring the cache')
+
+    # Plan command
+    plan_parser = subparsers.add_parser('plan', help='Build a deletion plan from combined policies')
+    plan_parser.add_argument('--repos', nargs='+', help='Only plan for these repositories (default: all)')
+    plan_parser.add_argument('--policy-file', help='JSON file with default and per-repository policies')
+    plan_parser.add_argument('--keep-last', type=int, help='Keep the N most recently updated tags')
+    plan_parser.add_argument('--keep-newer-than', type=int, dest='keep_newer_than_days',
+                             help='Keep tags updated within the last N days')
+    plan_parser.add_argument('--protect-semver', action='store_true', help='Keep semver release tags (1.2.3, v1.2.3)')
+    plan_parser.add_argument('--protect', action='append', default=[], dest='protect_patterns',
+                             help='Keep tags matching this regex (repeatable)')
+    plan_parser.add_argument('--delete-pattern', help='Only consider tags matching this regex for deletion')
+    plan_parser.add_argument('--as-of', help='Evaluate ages relative to this ISO date instead of now')
+    plan_parser.add_argument('--offline', action='store_true', help='Plan from the cached inventory without refreshing')
+    plan_parser.add_argument('-o', '--output', default='cleanup-plan.json', help='Plan file (default: cleanup-plan.json)')
+
+    # Execute command
+    execute_parser = subparsers.add_parser('execute', help='Execute a reviewed deletion plan')
+    execute_parser.add_argument('plan', help='Plan file produced by the plan command')
+    execute_parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                                help=f'Maximum deletions per second (default: {DEFAULT_RATE})')
+    execute_parser.add_argument('--retries', type=int, default=DEFAULT_DELETE_RETRIES,
+                                help=f'Retries per failed deletion (default: {DEFAULT_DELETE_RETRIES})')
+    execute_parser.add_argument('--checkpoint-dir', default='.', help='Directory for progress checkpoints (default: .)')
+    execute_parser.add_argument('--dry-run', action='store_true', help='Print the deletions without performing them')
+
+    args = parser.parse_args()
+    if not args.command:
+        parser.print_help()
+        return
+
+    with DockerHubClient(DOCKER_HUB_USERNAME, DOCKER_HUB_TOKEN, pool_size=args.workers) as client:
+        try:
+            if args.command == 'refresh':
+                inventory = refresh_inventory(client, load_inventory(args.inventory), args.repos,
+                                              force=args.force, workers=args.workers)
+                save_inventory(inventory, args.inventory)
+
+            elif args.command == 'plan':
+                inventory = load_inventory(args.inventory)
+                if not args.offline:
+                    inventory = refresh_inventory(client, inventory, args.repos, workers=args.workers)
+                    save_inventory(inventory, args.inventory)
+
+                overrides = {key: getattr(args, key) for key in DEFAULT_POLICY}
+                default_policy, repository_policies = load_policies(args.policy_file, overrides)
+                now = parse_timestamp(args.as_of) if args.as_of else None
+                if args.as_of and now is None:
+                    print(f"Error: invalid --as-of date: {args.as_of}")
+                    sys.exit(1)
+                if now is not None and now.tzinfo is None:
+                    now = now.replace(tzinfo=datetime.timezone.utc)
+
+                plan = build_plan(inventory, default_policy, repository_policies, args.repos, now)
+                with open(args.output, 'w') as f:
+                    json.dump(plan, f, indent=2, sort_keys=True)
+                    f.write('\n')
+                print_plan_summary(plan)
+                print(f"Plan written to {args.output}. Review it, then run: "
+                      f"python cleanup_planner.py execute {args.output}")
+
+            elif args.command == 'execute':
+                with open(args.plan) as f:
+                    plan = json.load(f)
+                print_plan_summary(plan)
+                engine = CleanupEngine(client, workers=args.workers, rate=args.rate, max_retries=args.retries,
+                                       checkpoint_dir=args.checkpoint_dir, dry_run=args.dry_run)
+                execute_plan(plan, engine, args.inventory)
+
+        except (ValueError, re.error) as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        except requests.exceptions.RequestException as e:
+            print(f"Error talking to Docker Hub: {e}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,13 @@ import requests
 import os
 import json
 import sys
+import time
 import argparse
 import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 # Load environment variables from .env file if present
@@ -18,8 +23,19 @@ load_dotenv()
 DOCKER_HUB_USERNAME = os.environ.get('DOCKER_HUB_USERNAME')
 DOCKER_HUB_TOKEN = os.environ.get('DOCKER_HUB_TOKEN')
 
-# Base API URL
-API_URL = "https://hub.docker.com/v2"
+# Base API URL (override to point the client at a local stand-in server)
+API_URL = os.environ.get('DOCKER_HUB_API_URL', "https://hub.docker.com/v2")
+
+# Connection pool, timeout and concurrency settings
+POOL_SIZE = int(os.environ.get('DOCKER_HUB_POOL_SIZE', 10))
+CONNECT_TIMEOUT = float(os.environ.get('DOCKER_HUB_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.environ.get('DOCKER_HUB_READ_TIMEOUT', 30))
+MAX_RETRIES = int(os.environ.get('DOCKER_HUB_MAX_RETRIES', 5))
+PAGE_SIZE = 100  # Maximum allowed by Docker Hub API
+
+# Responses worth retrying; 5xx are only retried for idempotent methods
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'}
 
 # Check if credentials are set
 if not DOCKER_HUB_USERNAME or not DOCKER_HUB_TOKEN:
@@ -28,35 +44,195 @@ if not DOCKER_HUB_USERNAME or not DOCKER_HUB_TOKEN:
     print("You can create a .env file with these variables or export them in your shell")
     sys.exit(1)
 
-# Headers for authentication
-headers = {
-    "Content-Type": "application/json",
-    "Authorization": f"Bearer {DOCKER_HUB_TOKEN}"
-}
+class DockerHubClient:
+    """Docker Hub API client with a pooled keep-alive session, pagination and rate-limit handling
+
+    A single instance can be shared between threads: all requests go through one
+    requests.Session whose connection pool holds up to pool_size keep-alive
+    connections, so concurrent calls reuse TCP+TLS connections instead of
+    opening a new one per request.
+    """
+
+    def __init__(self, username, token, api_url=API_URL, pool_size=POOL_SIZE,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), max_retries=MAX_RETRIES):
+        self.username = username
+        self.api_url = api_url.rstrip('/')
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {token}"
+        })
+
+        # Wall-clock time before which no request should be sent. Shared by all
+        # threads so one 429 or exhausted rate limit pauses the whole fan-out.
+        self._rate_limit_lock = threading.Lock()
+        self._paused_until = 0.0
+        self.rate_limit = {}
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _pause_until(self, timestamp):
+        with self._rate_limit_lock:
+            self._paused_until = max(self._paused_until, timestamp)
+
+    def _wait_for_rate_limit(self):
+        with self._rate_limit_lock:
+            delay = self._paused_until - time.time()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _record_rate_limit(self, response):
+        """Track X-RateLimit-* headers and pause before the limit is exceeded"""
+        limit = response.headers.get('X-RateLimit-Limit')
+        remaining = response.headers.get('X-RateLimit-Remaining')
+        reset = response.headers.get('X-RateLimit-Reset')
+        if remaining is None:
+            return
+
+        try:
+            self.rate_limit = {
+                'limit': int(limit) if limit else None,
+                'remaining': int(remaining),
+                'reset': float(reset) if reset else None
+            }
+        except ValueError:
+            return
+
+        if self.rate_limit['remaining'] <= 0 and self.rate_limit['reset']:
+            self._pause_until(self.rate_limit['reset'])
+
+    @staticmethod
+    def _retry_delay(response, attempt):
+        """Seconds to wait before retrying, from Retry-After, X-RateLimit-Reset or backoff"""
+        retry_after = response.headers.get('Retry-After')
+        if retry_after:
+            if retry_after.strip().isdigit():
+                return float(retry_after)
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+
+        reset = response.headers.get('X-RateLimit-Reset')
+        if reset:
+            try:
+                return max(0.0, float(reset) - time.time())
+            except ValueError:
+                pass
+
+        return min(2 ** attempt, 60)
+
+    def send(self, method, endpoint, data=None, params=None, headers=None, max_retries=None):
+        """Send a request, handling rate limits and retries, and return the Response
+
+        endpoint is either a path relative to api_url or an absolute URL, such as
+        the 'next' link of a paginated response. Extra headers (e.g. If-None-Match)
+        are added to the session headers. max_retries overrides the client's retry
+        count, e.g. 0 for callers that retry on their own. Raises requests
+        exceptions on failure once retries are exhausted.
+        """
+        method = method.upper()
+        url = endpoint if endpoint.startswith(('http://', 'https://')) else f"{self.api_url}{endpoint}"
+        body = (data if data else {}) if method in ('POST', 'PUT', 'PATCH') else None
+        max_retries = self.max_retries if max_retries is None else max_retries
+
+        for attempt in range(max_retries + 1):
+            self._wait_for_rate_limit()
+            response = self.session.request(method, url, json=body, params=params,
+                                            headers=headers, timeout=self.timeout)
+            self._record_rate_limit(response)
+
+            delay = self._retry_delay(response, attempt)
+            if response.status_code == 429:
+                # Pause every thread, including when this caller won't retry itself
+                self._pause_until(time.time() + delay)
+
+            retryable = response.status_code == 429 or (
+                response.status_code in RETRY_STATUS_CODES and method in IDEMPOTENT_METHODS)
+            if not retryable or attempt == max_retries:
+                break
+
+            if response.status_code == 429:
+                self._wait_for_rate_limit()
+            else:
+                time.sleep(delay)
+
+        response.raise_for_status()
+        return response
+
+    def request(self, method, endpoint, data=None, params=None):
+        """Send a request and return the decoded JSON body (or {} for empty responses)"""
+        response = self.send(method, endpoint, data=data, params=params)
+        return response.json() if response.content else {}
+
+    def paginate(self, endpoint, params=None, page_size=PAGE_SIZE):
+        """Yield every result of a paginated endpoint by following the 'next' links"""
+        params = dict(params or {}, page_size=page_size)
+        url = endpoint
+
+        while url:
+            response = self.request('get', url, params=params)
+            yield from response.get('results', [])
+            url = response.get('next')
+            # The 'next' link already carries the query string
+            params = None
+
+    def map_concurrent(self, func, items, max_workers=None):
+        """Run func over items on a thread pool sized to the connection pool, preserving order"""
+        items = list(items)
+        if not items:
+            return []
+        workers = min(max_workers or self.pool_size, len(items))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(func, items))
+
+    def list_repositories(self, namespace=None):
+        return list(self.paginate(f"/repositories/{namespace or self.username}/"))
+
+    def get_repository(self, repository_name, namespace=None):
+        return self.request('get', f"/repositories/{namespace or self.username}/{repository_name}")
+
+    def list_tags(self, repository_name, namespace=None):
+        return list(self.paginate(f"/repositories/{namespace or self.username}/{repository_name}/tags"))
+
+    def repository_inventory(self, namespace=None, include_tags=True, max_workers=None):
+        """Fetch details (and optionally all tags) for every repository concurrently"""
+        repositories = self.list_repositories(namespace)
+
+        def fetch(repo):
+            entry = {'repository': self.get_repository(repo['name'], namespace)}
+            if include_tags:
+                entry['tags'] = self.list_tags(repo['name'], namespace)
+            return repo['name'], entry
+
+        return dict(self.map_concurrent(fetch, repositories, max_workers))
+
+# Shared client used by the command functions below
+client = DockerHubClient(DOCKER_HUB_USERNAME, DOCKER_HUB_TOKEN)
 
 def call_api(method, endpoint, data=None, params=None):
     """Generic function to call the Docker Hub API with error handling"""
-    url = f"{API_URL}{endpoint}"
+    url = endpoint if endpoint.startswith(('http://', 'https://')) else f"{API_URL}{endpoint}"
     
     try:
-        if method.lower() == 'get':
-            response = requests.get(url, headers=headers, params=params)
-        elif method.lower() == 'post':
-            response = requests.post(url, headers=headers, json=data if data else {})
-        elif method.lower() == 'put':
-            response = requests.put(url, headers=headers, json=data if data else {})
-        elif method.lower() == 'delete':
-            response = requests.delete(url, headers=headers)
-        elif method.lower() == 'patch':
-            response = requests.patch(url, headers=headers, json=data if data else {})
-        else:
+        if method.lower() not in ('get', 'post', 'put', 'delete', 'patch'):
             raise ValueError(f"Unsupported method: {method}")
         
-        # Check for API errors
-        response.raise_for_status()
-        
-        # Return JSON response if content exists, otherwise empty dict
-        return response.json() if response.text else {}
+        return client.request(method, url, data=data, params=params)
     
     except requests.exceptions.HTTPError as e:
         print(f"HTTP Error: {e}")
@@ -76,12 +252,24 @@ def call_api(method, endpoint, data=None, params=None):
         print(f"Unexpected error: {e}")
         return None
 
+def call_api_paginated(endpoint, params=None):
+    """Fetch all pages of a list endpoint, returning the combined results or None on error"""
+    results = []
+    response = call_api('get', endpoint, params=dict(params or {}, page_size=PAGE_SIZE))
+    
+    while response is not None:
+        results.extend(response.get('results', []))
+        if not response.get('next'):
+            return results
+        response = call_api('get', response['next'])
+    
+    return None
+
 def list_repositories():
     """List all repositories for the user"""
-    response = call_api('get', f"/repositories/{DOCKER_HUB_USERNAME}/")
+    repositories = call_api_paginated(f"/repositories/{DOCKER_HUB_USERNAME}/")
     
-    if response:
-        repositories = response.get('results', [])
+    if repositories is not None:
         print(f"Repositories for {DOCKER_HUB_USERNAME}:")
         for repo in repositories:
             print(f"- {repo['name']}: {repo.get('description', 'No description')}")
@@ -110,10 +298,9 @@ def get_repository_details(repository_name):
 
 def list_tags(repository_name):
     """List all tags for a repository"""
-    response = call_api('get', f"/repositories/{DOCKER_HUB_USERNAME}/{repository_name}/tags")
+    tags = call_api_paginated(f"/repositories/{DOCKER_HUB_USERNAME}/{repository_name}/tags")
     
-    if response:
-        tags = response.get('results', [])
+    if tags is not None:
         print(f"Tags for {DOCKER_HUB_USERNAME}/{repository_name}:")
         for tag in tags:
             last_updated = tag.get('last_updated', 'Unknown')
@@ -188,6 +375,26 @@ def get_user_info():
         return response
     return None
 
+def show_inventory(workers=None):
+    """Fetch details and tags for every repository concurrently"""
+    try:
+        inventory = client.repository_inventory(max_workers=workers)
+    except requests.exceptions.RequestException as e:
+        print(f"Error: {e}")
+        return None
+    
+    print(f"Inventory for {DOCKER_HUB_USERNAME} ({len(inventory)} repositories):")
+    for name, entry in sorted(inventory.items()):
+        details = entry['repository']
+        tags = entry.get('tags', [])
+        print(f"- {name}: {len(tags)} tags, {details.get('pull_count', 0)} pulls")
+        print(f"  Last updated: {details.get('last_updated', 'Unknown')}")
+    
+    if client.rate_limit:
+        print(f"\nRate limit: {client.rate_limit['remaining']}/{client.rate_limit['limit']} requests remaining")
+    
+    return inventory
+
 def main():
     """Main function to parse arguments and execute commands"""
     parser = argparse.ArgumentParser(description='Docker Hub API Client')
@@ -222,6 +429,10 @@ def main():
     # User info command
     user_info_parser = subparsers.add_parser('user-info', help='Get user information')
     
+    # Inventory command
+    inventory_parser = subparsers.add_parser('inventory', help='Fetch details and tags for all repositories concurrently')
+    inventory_parser.add_argument('--workers', type=int, help=f'Number of concurrent requests (default: {POOL_SIZE})')
+    
     args = parser.parse_args()
     
     # Execute the requested command
@@ -239,6 +450,8 @@ def main():
         update_repository_description(args.repository, args.description)
     elif args.command == 'user-info':
         get_user_info()
+    elif args.command == 'inventory':
+        show_inventory(args.workers)
     else:
         parser.print_help()
 
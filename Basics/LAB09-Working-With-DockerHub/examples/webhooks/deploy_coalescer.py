@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Deduplication and coalescing of webhook-triggered deployments.
+
+Deploy triggers are keyed on (repository, environment). Instead of deploying on
+every webhook, a trigger waits for a short quiet period:
+
+- a webhook for an image that was already deployed within the dedupe window,
+  or is being deployed or waiting right now, is dropped as a duplicate, e.g. a
+  Docker Hub retry
+- further pushes during the quiet period replace the waiting trigger, so a
+  burst of pushes ends in a single deploy of the newest image
+- a trigger never runs while a deploy for the same key is still in progress;
+  it waits and runs afterwards with whatever is newest at that point
+
+Each trigger can carry the id of the queue job it came from. Jobs are handed to
+acknowledge(jobs, succeeded) only once the deploy that covers them has finished
+(or straight away for a duplicate of a finished deploy), so a trigger that was
+still waiting when the process stopped is recovered from the queue on restart.
+
+Counters for received, duplicate, superseded, executed and failed triggers are
+available from stats().
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class DeployCoalescer:
+    def __init__(self, actions, quiet_period=5.0, max_delay=30.0, dedupe_window=300.0, workers=2,
+                 acknowledge=None):
+        """actions maps an environment name to a callable(repo_name, tag)
+
+        acknowledge(jobs, succeeded), if given, is called with the job ids of
+        every trigger a finished deploy covered.
+        """
+        self.actions = actions
+        self.acknowledge = acknowledge
+        self.quiet_period = quiet_period
+        self.max_delay = max_delay
+        self.dedupe_window = dedupe_window
+
+        self._condition = threading.Condition()
+        self._pending = {}      # (repo, env) -> trigger waiting to run
+        self._running = {}      # (repo, env) -> trigger being deployed
+        self._recent = {}       # (repo, env) -> {image: time deployed}
+        self._last = {}         # (repo, env) -> last executed trigger
+        self.counters = {'received': 0, 'duplicate': 0, 'superseded': 0, 'executed': 0, 'failed': 0}
+
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='deploy')
+        self._stopping = False
+        self._scheduler = threading.Thread(target=self._schedule, name='deploy-scheduler', daemon=True)
+        self._scheduler.start()
+
+    def submit(self, repo_name, environment, tag, digest=None, pushed_at=None, job=None):
+        """Register a deploy trigger; returns 'queued', 'duplicate' or 'superseded'"""
+        if environment not in self.actions:
+            raise ValueError(f"No deploy action for environment {environment!r}")
+
+        key = (repo_name, environment)
+        # Without a digest, the tag and push time identify the image
+        image = digest or f"{tag}@{pushed_at}"
+        jobs = [job] if job is not None else []
+        now = time.monotonic()
+
+        with self._condition:
+            self.counters['received'] += 1
+            pending = self._pending.get(key)
+            running = self._running.get(key)
+
+            # A duplicate of a waiting or running deploy is acknowledged along with it
+            covering = next((trigger for trigger in (pending, running)
+                             if trigger is not None and trigger['image'] == image), None)
+            deployed_at = self._recent.get(key, {}).get(image)
+            if covering is not None or (deployed_at is not None and now - deployed_at < self.dedupe_window):
+                self.counters['duplicate'] += 1
+                logger.info(f"Duplicate deploy trigger for {repo_name} -> {environment} ({image}), skipped")
+                if covering is not None:
+                    covering['jobs'].extend(jobs)
+                    jobs = []
+                status = 'duplicate'
+
+            elif pending is not None and pushed_at is not None and pending['pushed_at'] is not None \
+                    and pushed_at < pending['pushed_at']:
+                # Keep the newest image; an older push arriving late must not win
+                pending['last_seen'] = now
+                pending['coalesced'] += 1
+                pending['jobs'].extend(jobs)
+                self.counters['superseded'] += 1
+                return 'superseded'
+
+            else:
+                trigger = {
+                    'repo': repo_name, 'environment': environment, 'tag': tag, 'image': image,
+                    'pushed_at': pushed_at, 'first_seen': now, 'last_seen': now, 'coalesced': 0, 'jobs': jobs
+                }
+                if pending is not None:
+                    trigger['first_seen'] = pending['first_seen']
+                    trigger['coalesced'] = pending['coalesced'] + 1
+                    trigger['jobs'] = pending['jobs'] + jobs
+                    self.counters['superseded'] += 1
+                    logger.info(f"Deploy trigger for {repo_name} -> {environment} superseded by {image}")
+
+                self._pending[key] = trigger
+                self._condition.notify()
+                return 'superseded' if pending is not None else 'queued'
+
+        # A duplicate of a deploy that already finished
+        if jobs and self.acknowledge:
+            self.acknowledge(jobs, True)
+        return status
+
+    def stats(self):
+        with self._condition:
+            return {
+                'counters': dict(self.counters, coalesced=self.counters['duplicate'] + self.counters['superseded']),
+                'pending': [self._describe(trigger) for trigger in self._pending.values()],
+                'running': [{'repo': repo, 'environment': env} for repo, env in self._running],
+                'last_executed': [self._describe(trigger) for trigger in self._last.values()]
+            }
+
+    def stop(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self._scheduler.join(timeout=5)
+        self._executor.shutdown(wait=True)
+
+    def _due_at(self, trigger):
+        return min(trigger['last_seen'] + self.quiet_period, trigger['first_seen'] + self.max_delay)
+
+    def _schedule(self):
+        with self._condition:
+            while not self._stopping:
+                now = time.monotonic()
+                next_due = None
+                for key, trigger in list(self._pending.items()):
+                    if key in self._running:
+                        continue
+                    due_at = self._due_at(trigger)
+                    if due_at <= now:
+                        del self._pending[key]
+                        self._running[key] = trigger
+                        self._executor.submit(self._execute, key, trigger)
+                    elif next_due is None or due_at < next_due:
+                        next_due = due_at
+                self._condition.wait(None if next_due is None else next_due - now)
+
+    def _execute(self, key, trigger):
+        repo_name, environment = key
+        try:
+            logger.info(f"Deploying {repo_name}:{trigger['tag']} to {environment} "
+                        f"({trigger['coalesced']} triggers coalesced)")
+            self.actions[environment](repo_name, trigger['tag'])
+            succeeded = True
+        except Exception as e:
+            logger.error(f"Deployment of {repo_name}:{trigger['tag']} to {environment} failed: {e}")
+            succeeded = False
+
+        with self._condition:
+            del self._running[key]
+            jobs = trigger['jobs']
+            now = time.monotonic()
+            if succeeded:
+                self.counters['executed'] += 1
+                recent = self._recent.setdefault(key, {})
+                recent[trigger['image']] = now
+                for image in [image for image, at in recent.items() if now - at >= self.dedupe_window]:
+                    del recent[image]
+            else:
+                self.counters['failed'] += 1
+            self._last[key] = dict(trigger, finished=time.time(), succeeded=succeeded)
+            # A trigger that arrived while this deploy ran may now be due
+            self._condition.notify()
+
+        if jobs and self.acknowledge:
+            self.acknowledge(jobs, succeeded)
+
+    @staticmethod
+    def _describe(trigger):
+        keys = ('repo', 'environment', 'tag', 'image', 'coalesced', 'finished', 'succeeded')
+        return {key: trigger[key] for key in keys if key in trigger}
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Append-only webhook archive with an in-memory index.
+
+Webhooks are appended as JSON lines to an active segment file. When the active
+segment grows past its size limit it is sealed: gzip-compressed and replaced by
+a new segment. Only the newest max_segments segments are kept, so the archive
+stays bounded.
+
+Each record gets a monotonically increasing id, so two pushes in the same second
+can never overwrite each other. An index of record metadata by repository, tag
+and pusher is kept in memory (rebuilt from the segments on startup), so lookups
+such as "latest push for repo X" never scan files. Only fetching a full payload
+reads from disk, and then only one segment.
+
+A record can carry the id of the queue job it came from; appending the same job
+again (e.g. one recovered after a restart) returns the existing record.
+"""
+
+import datetime
+import gzip
+import json
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r'^segment-(\d{8})\.jsonl(\.gz)?$')
+
+
+class WebhookArchive:
+    def __init__(self, archive_dir, segment_max_bytes=8 * 1024 * 1024, max_segments=50):
+        self.archive_dir = archive_dir
+        self.segment_max_bytes = segment_max_bytes
+        self.max_segments = max_segments
+        os.makedirs(archive_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._records = {}          # id -> metadata (no payload)
+        self._by_repo = {}          # repo -> [ids], oldest first
+        self._by_tag = {}           # tag -> [ids]
+        self._by_pusher = {}        # pusher -> [ids]
+        self._by_job = {}           # queue job id -> id
+        self._segments = []         # segment numbers, oldest first
+        self._next_id = 1
+        self._active = None
+        self._active_segment = None
+
+        self._load()
+
+    # -- writing ----------------------------------------------------------
+
+    def append(self, payload, job_id=None):
+        """Archive a webhook payload and return its index metadata"""
+        push_data = payload.get('push_data') or {}
+        repo_data = payload.get('repository') or {}
+
+        with self._lock:
+            if job_id is not None and job_id in self._by_job:
+                return self._public(self._records[self._by_job[job_id]])
+
+            if self._active is None or self._active.tell() >= self.segment_max_bytes:
+                self._rotate()
+
+            record = {
+                'id': self._next_id,
+                'received_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'repo': repo_data.get('repo_name', 'unknown'),
+                'tag': push_data.get('tag') or 'latest',
+                'pusher': push_data.get('pusher', 'unknown'),
+                'pushed_at': push_data.get('pushed_at'),
+                'job_id': job_id,
+                'payload': payload
+            }
+            offset = self._active.tell()
+            self._active.write(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+            self._active.flush()
+            self._next_id += 1
+
+            meta = {key: value for key, value in record.items() if key != 'payload'}
+            self._index(meta, self._active_segment, offset)
+            return meta
+
+    def _rotate(self):
+        """Seal the active segment (compress it) and open a new one"""
+        if self._active is not None:
+            self._active.close()
+            self._seal(self._active_segment)
+
+        self._active_segment = (self._segments[-1] + 1) if self._segments else 1
+        self._segments.append(self._active_segment)
+        self._active = open(self._segment_path(self._active_segment), 'ab')
+
+        while len(self._segments) > self.max_segments:
+            self._drop_segment(self._segments.pop(0))
+
+    def _seal(self, segment):
+        plain_path = self._segment_path(segment)
+        gz_path = plain_path + '.gz'
+        with open(plain_path, 'rb') as source, gzip.open(gz_path + '.tmp', 'wb') as target:
+            for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                target.write(chunk)
+        os.replace(gz_path + '.tmp', gz_path)
+        os.remove(plain_path)
+
+    def _drop_segment(self, segment):
+        for path in (self._segment_path(segment), self._segment_path(segment) + '.gz'):
+            if os.path.exists(path):
+                os.remove(path)
+
+        dropped = {record_id for record_id, meta in self._records.items() if meta['segment'] == segment}
+        for record_id in dropped:
+            job_id = self._records.pop(record_id).get('job_id')
+            self._by_job.pop(job_id, None)
+        for index in (self._by_repo, self._by_tag, self._by_pusher):
+            for key in list(index):
+                index[key] = [record_id for record_id in index[key] if record_id not in dropped]
+                if not index[key]:
+                    del index[key]
+        logger.info(f"Dropped archive segment {segment} ({len(dropped)} webhooks)")
+
+    # -- index --------------------------------------------------------------
+
+    def _index(self, meta, segment, offset):
+        meta = dict(meta, segment=segment, offset=offset)
+        record_id = meta['id']
+        self._records[record_id] = meta
+        self._by_repo.setdefault(meta['repo'], []).append(record_id)
+        self._by_tag.setdefault(meta['tag'], []).append(record_id)
+        self._by_pusher.setdefault(meta['pusher'], []).append(record_id)
+        if meta.get('job_id') is not None:
+            self._by_job[meta['job_id']] = record_id
+
+    def _load(self):
+        """Rebuild the index from the segments on disk and reopen the newest one for appending"""
+        segments = {}
+        for name in os.listdir(self.archive_dir):
+            match = SEGMENT_PATTERN.match(name)
+            if match:
+                segments.setdefault(int(match.group(1)), set()).add(bool(match.group(2)))
+
+        ordered = sorted(segments)
+        for segment in ordered:
+            # A plain file next to a .gz means sealing was interrupted; the plain file is complete
+            compressed = segments[segment] == {True}
+            if not compressed and True in segments[segment]:
+                os.remove(self._segment_path(segment) + '.gz')
+            for offset, record in self._read_segment(segment, compressed):
+                meta = {key: value for key, value in record.items() if key != 'payload'}
+                self._index(meta, segment, offset)
+                self._next_id = max(self._next_id, record['id'] + 1)
+            if not compressed and segment != ordered[-1]:
+                self._seal(segment)
+                segments[segment] = {True}
+            self._segments.append(segment)
+
+        if self._segments and segments[self._segments[-1]] != {True}:
+            self._active_segment = self._segments[-1]
+            self._truncate_torn_tail(self._segment_path(self._active_segment))
+            self._active = open(self._segment_path(self._active_segment), 'ab')
+        logger.info(f"Loaded webhook archive: {len(self._records)} webhooks in {len(self._segments)} segments")
+
+    @staticmethod
+    def _truncate_torn_tail(path):
+        """Cut off a partial last line so new records are not appended onto it"""
+        with open(path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            end = size
+            while end > 0:
+                f.seek(max(0, end - 4096))
+                block = f.read(end - max(0, end - 4096))
+                newline = block.rfind(b'\n')
+                if newline != -1:
+                    end = max(0, end - 4096) + newline + 1
+                    break
+                end = max(0, end - 4096)
+            if end != size:
+                f.truncate(end)
+
+    def _read_segment(self, segment, compressed, start=0):
+        path = self._segment_path(segment) + ('.gz' if compressed else '')
+        opener = gzip.open if compressed else open
+        with opener(path, 'rb') as f:
+            f.seek(start)
+            offset = start
+            for line in f:
+                line_offset, offset = offset, offset + len(line)
+                try:
+                    yield line_offset, json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn final line from a crash mid-write
+                    logger.warning(f"Skipping corrupt record in segment {segment} at offset {line_offset}")
+
+    def _segment_path(self, segment):
+        return os.path.join(self.archive_dir, f"segment-{segment:08d}.jsonl")
+
+    # -- queries ------------------------------------------------------------
+
+    def query(self, repo=None, tag=None, pusher=None, limit=20):
+        """Return metadata of the newest webhooks matching all given filters, newest first"""
+        with self._lock:
+            candidates = [index.get(key, []) for index, key in
+                          ((self._by_repo, repo), (self._by_tag, tag), (self._by_pusher, pusher))
+                          if key is not None]
+            ids = min(candidates, key=len) if candidates else sorted(self._records)
+
+            results = []
+            for record_id in reversed(ids):
+                meta = self._records[record_id]
+                if ((repo is None or meta['repo'] == repo) and (tag is None or meta['tag'] == tag)
+                        and (pusher is None or meta['pusher'] == pusher)):
+                    results.append(self._public(meta))
+                    if len(results) >= limit:
+                        break
+            return results
+
+    def latest(self, repo=None, tag=None, pusher=None):
+        results = self.query(repo, tag, pusher, limit=1)
+        return results[0] if results else None
+
+    def get(self, record_id):
+        """Return the full archived record, including the payload, or None
+
+        The segment is read outside the lock so appends aren't held up. If it is
+        sealed or dropped in the meantime, the lookup is repeated once with the
+        current state; a dropped record gives None.
+        """
+        for _attempt in range(2):
+            with self._lock:
+                meta = self._records.get(record_id)
+                if meta is None:
+                    return None
+                if self._active is not None:
+                    self._active.flush()
+                compressed = meta['segment'] != self._active_segment
+
+            try:
+                for _offset, record in self._read_segment(meta['segment'], compressed, meta['offset']):
+                    return record
+                return None
+            except (FileNotFoundError, EOFError, gzip.BadGzipFile):
+                continue
+        return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'webhooks': len(self._records),
+                'segments': len(self._segments),
+                'repositories': len(self._by_repo),
+                'next_id': self._next_id
+            }
+
+    def close(self):
+        with self._lock:
+            if self._active is not None:
+                self._active.close()
+                self._active = None
+
+    @staticmethod
+    def _public(meta):
+        return {key: value for key, value in meta.items() if key not in ('segment', 'offset')}
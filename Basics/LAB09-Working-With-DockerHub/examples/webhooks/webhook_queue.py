@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Bounded, durable job queue for the webhook receiver.
+
+Every accepted webhook is written to a spool directory (temp file, fsync, rename)
+before the receiver answers, so a crash or restart never loses an acknowledged
+webhook: pending spool files are recovered on startup. A fixed pool of worker
+threads takes jobs off the queue and runs the handler; jobs whose handler raises
+are moved to a failed/ directory for inspection. A handler that hands the job on
+to something slower (such as a coalesced deploy) returns DEFERRED and calls
+done() or fail() itself once that has finished.
+"""
+
+import collections
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Returned by a handler that acknowledges the job later itself
+DEFERRED = object()
+
+
+class QueueFull(Exception):
+    """Raised when the queue already holds its maximum number of jobs"""
+
+
+class DurableQueue:
+    def __init__(self, spool_dir, maxsize=1000):
+        self.spool_dir = spool_dir
+        self.failed_dir = os.path.join(spool_dir, 'failed')
+        self.maxsize = maxsize
+        os.makedirs(self.failed_dir, exist_ok=True)
+
+        self._jobs = collections.deque()
+        self._reserved = 0
+        self._condition = threading.Condition()
+        self.stats = {'enqueued': 0, 'processed': 0, 'failed': 0, 'rejected': 0, 'recovered': 0}
+
+    def __len__(self):
+        with self._condition:
+            return len(self._jobs)
+
+    def recover(self):
+        """Re-queue jobs that were spooled but not processed before the last shutdown"""
+        names = sorted(name for name in os.listdir(self.spool_dir) if name.endswith('.json'))
+        with self._condition:
+            for name in names:
+                self._jobs.append(name[:-len('.json')])
+            self.stats['recovered'] += len(names)
+            self._condition.notify_all()
+        return len(names)
+
+    def put(self, payload):
+        """Persist payload and queue it; returns the job id or raises QueueFull"""
+        with self._condition:
+            if len(self._jobs) + self._reserved >= self.maxsize:
+                self.stats['rejected'] += 1
+                raise QueueFull(f"queue is full ({self.maxsize} jobs)")
+            self._reserved += 1
+
+        # Ids sort in arrival order, so recovery preserves ordering
+        job_id = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}"
+        try:
+            path = self._path(job_id)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(payload, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            with self._condition:
+                self._reserved -= 1
+            raise
+
+        with self._condition:
+            self._reserved -= 1
+            self._jobs.append(job_id)
+            self.stats['enqueued'] += 1
+            self._condition.notify()
+        return job_id
+
+    def get(self, timeout=None):
+        """Return (job_id, payload) for the next job, or None on timeout"""
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._jobs, timeout):
+                return None
+            job_id = self._jobs.popleft()
+
+        with open(self._path(job_id)) as f:
+            return job_id, json.load(f)
+
+    def done(self, job_id):
+        os.remove(self._path(job_id))
+        with self._condition:
+            self.stats['processed'] += 1
+
+    def fail(self, job_id):
+        os.replace(self._path(job_id), os.path.join(self.failed_dir, f"{job_id}.json"))
+        with self._condition:
+            self.stats['failed'] += 1
+
+    def _path(self, job_id):
+        return os.path.join(self.spool_dir, f"{job_id}.json")
+
+
+class WorkerPool:
+    """Fixed set of daemon threads that run handler(job_id, payload) for every queued job"""
+
+    def __init__(self, job_queue, handler, workers=4):
+        self.queue = job_queue
+        self.handler = handler
+        self.workers = workers
+        self._threads = []
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return bool(self._threads)
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"webhook-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                job = self.queue.get(timeout=1)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not read queued job: {e}")
+                continue
+            if job is None:
+                continue
+
+            job_id, payload = job
+            try:
+                result = self.handler(job_id, payload)
+            except Exception as e:
+                logger.error(f"Error processing webhook job {job_id}: {e}")
+                self._settle(self.queue.fail, job_id)
+            else:
+                if result is not DEFERRED:
+                    self._settle(self.queue.done, job_id)
+
+    @staticmethod
+    def _settle(action, job_id):
+        """Run queue.done or queue.fail; a spool error (disk full, directory gone) must not kill the worker"""
+        try:
+            action(job_id)
+        except Exception as e:
+            logger.error(f"Could not mark webhook job {job_id} {action.__name__}: {e}")
@@ -4,6 +4,11 @@ import json
 import os
 import logging
 import datetime
+import threading
+
+from deploy_coalescer import DeployCoalescer
+from webhook_archive import WebhookArchive
+from webhook_queue import DEFERRED, DurableQueue, QueueFull, WorkerPool
 
 app = Flask(__name__)
 
@@ -18,6 +23,112 @@ logger = logging.getLogger(__name__)
 DATA_DIR = 'webhook_data'
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Queue settings: accepted webhooks are spooled to disk and processed by a worker pool
+QUEUE_DIR = os.path.join(DATA_DIR, 'queue')
+QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', 1000))
+WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+
+# Archive settings: webhooks are appended to compressed, rotating JSON-lines segments
+ARCHIVE_DIR = os.path.join(DATA_DIR, 'archive')
+SEGMENT_MAX_BYTES = int(os.environ.get('WEBHOOK_SEGMENT_MB', 8)) * 1024 * 1024
+MAX_SEGMENTS = int(os.environ.get('WEBHOOK_MAX_SEGMENTS', 50))
+
+# Deploy coalescing: wait for a quiet period before deploying, never longer than the max delay
+DEPLOY_QUIET_SECONDS = float(os.environ.get('DEPLOY_QUIET_SECONDS', 5))
+DEPLOY_MAX_DELAY_SECONDS = float(os.environ.get('DEPLOY_MAX_DELAY_SECONDS', 30))
+DEPLOY_DEDUPE_SECONDS = float(os.environ.get('DEPLOY_DEDUPE_SECONDS', 300))
+
+def deploy_to_production(repo_name, tag):
+    logger.info(f"Production image detected - would trigger deployment of {repo_name}:{tag} here")
+
+def deploy_to_staging(repo_name, tag):
+    logger.info(f"Staging image detected - would trigger staging deployment of {repo_name}:{tag}")
+
+def update_dev_environment(repo_name, tag):
+    logger.info(f"Latest tag updated - would trigger development environment update for {repo_name}")
+
+# Example: Trigger different actions based on tags
+TAG_ENVIRONMENTS = {
+    'prod': 'production',
+    'production': 'production',
+    'staging': 'staging',
+    'latest': 'development'
+}
+
+ENVIRONMENT_ACTIONS = {
+    'production': deploy_to_production,
+    'staging': deploy_to_staging,
+    'development': update_dev_environment
+}
+
+def parse_webhook(data):
+    """Validate a Docker Hub payload and return (repo_name, tag, pusher), or raise ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError('Payload must be a JSON object')
+    
+    push_data = data.get('push_data')
+    repo_data = data.get('repository')
+    if not isinstance(push_data, dict) or not isinstance(repo_data, dict):
+        raise ValueError("Payload must contain 'push_data' and 'repository' objects")
+    
+    repo_name = repo_data.get('repo_name')
+    if not isinstance(repo_name, str) or not repo_name:
+        raise ValueError("Payload is missing 'repository.repo_name'")
+    
+    return repo_name, push_data.get('tag') or 'latest', push_data.get('pusher', 'unknown')
+
+def process_webhook(job_id, data):
+    """Archive a queued webhook and run the action for its tag (runs on a worker thread)
+
+    A webhook that triggers a deploy stays in the queue until the coalesced
+    deploy has run, so a restart before then recovers it.
+    """
+    repo_name, tag, pusher = parse_webhook(data)
+    
+    record = archive.append(data, job_id=job_id)
+    logger.info(f"Archived webhook {record['id']} for {repo_name}:{tag}")
+    
+    environment = TAG_ENVIRONMENTS.get(tag)
+    if environment:
+        push_data = data['push_data']
+        deployments.submit(repo_name, environment, tag, digest=push_data.get('digest'),
+                           pushed_at=push_data.get('pushed_at'), job=job_id)
+        return DEFERRED
+
+def acknowledge_jobs(job_ids, succeeded):
+    """Remove the webhooks behind a finished deploy from the queue, or move them to failed/"""
+    for job_id in job_ids:
+        try:
+            if succeeded:
+                job_queue.done(job_id)
+            else:
+                job_queue.fail(job_id)
+        except OSError as e:
+            logger.error(f"Could not acknowledge webhook job {job_id}: {e}")
+
+archive = WebhookArchive(ARCHIVE_DIR, segment_max_bytes=SEGMENT_MAX_BYTES, max_segments=MAX_SEGMENTS)
+deployments = DeployCoalescer(ENVIRONMENT_ACTIONS, quiet_period=DEPLOY_QUIET_SECONDS,
+                              max_delay=DEPLOY_MAX_DELAY_SECONDS, dedupe_window=DEPLOY_DEDUPE_SECONDS,
+                              acknowledge=acknowledge_jobs)
+job_queue = DurableQueue(QUEUE_DIR, maxsize=QUEUE_SIZE)
+worker_pool = WorkerPool(job_queue, process_webhook, workers=WORKERS)
+
+_start_lock = threading.Lock()
+
+def start_workers():
+    """Recover webhooks left in the spool by a previous run and start the workers
+
+    Must run before the first webhook is enqueued, otherwise recovery would
+    queue that webhook a second time.
+    """
+    with _start_lock:
+        if worker_pool.running:
+            return
+        recovered = job_queue.recover()
+        if recovered:
+            logger.info(f"Recovered {recovered} queued webhooks from {QUEUE_DIR}")
+        worker_pool.start()
+
 @app.route('/')
 def index():
     """Simple index route to verify the service is running"""
@@ -29,64 +140,91 @@ def index():
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
-    """Endpoint to receive Docker Hub webhooks"""
-    if not request.json:
+    """Endpoint to receive Docker Hub webhooks: validate, enqueue and return 202"""
+    data = request.get_json(silent=True)
+    if data is None:
         logger.warning("Received non-JSON payload")
         return jsonify({'status': 'error', 'message': 'Payload must be JSON'}), 400
     
-    # Extract data from the webhook
-    data = request.json
-    logger.info(f"Received webhook: {json.dumps(data, indent=2)}")
+    try:
+        repo_name, tag, pusher = parse_webhook(data)
+    except ValueError as e:
+        logger.warning(f"Rejected webhook: {e}")
+        return jsonify({'status': 'error', 'message': str(e)}), 400
     
-    # Extract useful information
+    start_workers()
+    try:
+        job_id = job_queue.put(data)
+    except QueueFull:
+        logger.warning(f"Queue full, rejecting webhook for {repo_name}:{tag}")
+        return jsonify({'status': 'error', 'message': 'Webhook queue is full, retry later'}), 503, {'Retry-After': '5'}
+    except OSError as e:
+        logger.error(f"Could not spool webhook: {e}")
+        return jsonify({'status': 'error', 'message': 'Could not store webhook'}), 500
+    
+    logger.info(f"Image push: {repo_name}:{tag} by {pusher} (queued as {job_id})")
+    
+    return jsonify({
+        'status': 'accepted',
+        'job_id': job_id,
+        'message': f"Queued webhook for {repo_name}:{tag}",
+        'timestamp': datetime.datetime.now().isoformat()
+    }), 202
+
+@app.route('/queue')
+def queue_status():
+    """Report queue depth and processing counters"""
+    return jsonify({
+        'depth': len(job_queue),
+        'capacity': job_queue.maxsize,
+        'workers': worker_pool.workers,
+        'stats': job_queue.stats
+    })
+
+@app.route('/deployments')
+def deployment_status():
+    """Coalesced versus executed deploy triggers, plus pending and recent deployments"""
+    return jsonify(deployments.stats())
+
+@app.route('/webhooks')
+def list_webhooks():
+    """Newest archived webhooks, filtered by ?repo=, ?tag= and ?pusher= (answered from the index)"""
     try:
-        push_data = data.get('push_data', {})
-        repo_data = data.get('repository', {})
-        
-        pushed_at = push_data.get('pushed_at', '')
-        pusher = push_data.get('pusher', 'unknown')
-        tag = push_data.get('tag', 'latest')
-        repo_name = repo_data.get('repo_name', 'unknown')
-        
-        logger.info(f"Image push: {repo_name}:{tag} by {pusher}")
-        
-        # Save webhook data to file for inspection
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{DATA_DIR}/webhook_{timestamp}.json"
-        
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=2)
-            
-        logger.info(f"Saved webhook data to {filename}")
-        
-        # Example: Trigger different actions based on tags
-        if tag == 'prod' or tag == 'production':
-            logger.info("Production image detected - would trigger deployment here")
-            # In a real scenario, you might call a deployment function:
-            # deploy_to_production(repo_name, tag)
-        elif tag == 'staging':
-            logger.info("Staging image detected - would trigger staging deployment")
-            # deploy_to_staging(repo_name, tag)
-        elif tag == 'latest':
-            logger.info("Latest tag updated - would trigger development environment update")
-            # update_dev_environment(repo_name)
-        
-        # Always save the latest webhook for easy access
-        with open(f"{DATA_DIR}/last_webhook.json", 'w') as f:
-            json.dump(data, f, indent=2)
-            
-        return jsonify({
-            'status': 'success',
-            'message': f"Processed webhook for {repo_name}:{tag}",
-            'timestamp': datetime.datetime.now().isoformat()
-        })
-        
-    except Exception as e:
-        logger.error(f"Error processing webhook: {str(e)}")
-        return jsonify({
-            'status': 'error',
-            'message': f"Error processing webhook: {str(e)}"
-        }), 500
+        limit = min(int(request.args.get('limit', 20)), 1000)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'limit must be an integer'}), 400
+    
+    results = archive.query(
+        repo=request.args.get('repo'),
+        tag=request.args.get('tag'),
+        pusher=request.args.get('pusher'),
+        limit=limit
+    )
+    return jsonify({'count': len(results), 'webhooks': results})
+
+@app.route('/webhooks/latest')
+def latest_webhook():
+    """Latest push, e.g. /webhooks/latest?repo=username/repository"""
+    record = archive.latest(
+        repo=request.args.get('repo'),
+        tag=request.args.get('tag'),
+        pusher=request.args.get('pusher')
+    )
+    if record is None:
+        return jsonify({'status': 'error', 'message': 'No matching webhook found'}), 404
+    return jsonify(record)
+
+@app.route('/webhooks/<int:record_id>')
+def get_webhook(record_id):
+    """Full archived webhook, including the original payload"""
+    record = archive.get(record_id)
+    if record is None:
+        return jsonify({'status': 'error', 'message': f"Webhook {record_id} not found"}), 404
+    return jsonify(record)
+
+@app.route('/webhooks/stats')
+def archive_stats():
+    return jsonify(archive.stats())
 
 # Example of a separate function that could be triggered by webhooks
 def send_notification(repo_name, tag, pusher):
@@ -102,4 +240,6 @@ if __name__ == '__main__':
     # Get port from environment variable or default to 5000
     port = int(os.environ.get('PORT', 5000))
     logger.info(f"Starting Docker Hub webhook receiver on port {port}")
-    app.run(host='0.0.0.0', port=port, debug=True) 
\ No newline at end of file
+    start_workers()
+    # The reloader would run a second copy of the worker pool against the same spool
+    app.run(host='0.0.0.0', port=port, debug=True, use_reloader=False) 
\ No newline at end of file
@@ -2,39 +2,36 @@ from flask import Flask, jsonify, render_template_string
 import os
 import logging
 
+from secrets_provider import SecretsProvider
+
 app = Flask(__name__)
 
 # Configure logging - secure way without exposing secrets
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Define paths where Docker will mount our secrets
-SECRETS_PATH = '/run/secrets'
-DB_PASSWORD_FILE = os.path.join(SECRETS_PATH, 'db_password.txt')
-API_KEY_FILE = os.path.join(SECRETS_PATH, 'api_key.txt')
-JWT_SECRET_FILE = os.path.join(SECRETS_PATH, 'jwt_secret.txt')
-
-# Function to read secrets from files mounted by Docker
+# Define the path where Docker will mount our secrets
 # The files must be mounted as a volume in your docker-compose.yml
-def read_secret_file(file_path, default=''):
-    """Safely read secret from file, with error handling"""
-    try:
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as file:
-                return file.read().strip()
-        else:
-            logger.warning(f"Secret file not found: {file_path}")
-            return default
-    except Exception as e:
-        logger.error(f"Error reading secret file {file_path}: {e}")
-        return default
+SECRETS_PATH = os.environ.get('SECRETS_PATH', '/run/secrets')
+SECRETS_POLL_INTERVAL = float(os.environ.get('SECRETS_POLL_INTERVAL', 2))
 
-# Read secrets from files
-db_password = read_secret_file(DB_PASSWORD_FILE, 'db_password_not_found')
-api_key = read_secret_file(API_KEY_FILE, 'api_key_not_found')
-jwt_secret = read_secret_file(JWT_SECRET_FILE, 'jwt_secret_not_found')
+# Every *.txt file in SECRETS_PATH becomes a secret named after the file.
+# The provider reloads them when they change, so rotating a secret only
+# means replacing its file - no container restart needed.
+secrets_provider = SecretsProvider(SECRETS_PATH, poll_interval=SECRETS_POLL_INTERVAL)
+secrets_provider.start()
+
+def current_secrets():
+    """The current snapshot of secrets; read once per request so a handler sees one consistent set"""
+    snapshot = secrets_provider.snapshot
+    return (
+        snapshot.get('db_password', 'db_password_not_found'),
+        snapshot.get('api_key', 'api_key_not_found'),
+        snapshot.get('jwt_secret', 'jwt_secret_not_found')
+    )
 
 # Secure logging - doesn't expose actual secrets
+db_password, api_key, _ = current_secrets()
 logger.info("Application starting up - secrets loaded")
 logger.info(f"Database password length: {len(db_password)}")
 logger.info(f"API key found: {'Yes' if api_key != 'api_key_not_found' else 'No'}")
@@ -141,6 +138,7 @@ def index():
             <li>App running as non-root user</li>
             <li>Masked displays of sensitive data (first/last few characters only)</li>
             <li>Proper error handling for missing secrets</li>
+            <li>Rotated secrets are picked up without restarting the container</li>
         </ul>
         
         <h2>Implementation Details</h2>
@@ -154,17 +152,13 @@ def index():
         <div class="source">
             <h3>Example Secret Reading Code</h3>
             <pre>
-def read_secret_file(file_path, default=''):
-    try:
-        if os.path.exists(file_path):
-            with open(file_path, 'r') as file:
-                return file.read().strip()
-        else:
-            logger.warning(f"Secret file not found: {file_path}")
-            return default
-    except Exception as e:
-        logger.error(f"Error reading secret file {file_path}: {e}")
-        return default
+# Reads every file in /run/secrets and reloads them when they change
+secrets_provider = SecretsProvider('/run/secrets')
+secrets_provider.start()
+
+# In a request handler: one immutable snapshot, no locking
+snapshot = secrets_provider.snapshot
+db_password = snapshot.get('db_password', 'db_password_not_found')
             </pre>
         </div>
         
@@ -173,6 +167,8 @@ def read_secret_file(file_path, default=''):
     </html>
     """
     
+    db_password, api_key, jwt_secret = current_secrets()
+    
     # Safely mask secrets for display (show first 3 and last 2 chars only)
     def mask_secret(secret, default="Not available"):
         if not secret or secret.endswith('_not_found'):
@@ -201,6 +197,8 @@ def read_secret_file(file_path, default=''):
 @app.route('/api/secure')
 def secure_api():
     """Example of a secure API that doesn't expose secrets"""
+    db_password, api_key, _ = current_secrets()
+    
     # No sensitive data in response
     data = {
         'status': 'success',
@@ -220,16 +218,23 @@ def secure_api():
 @app.route('/health')
 def health():
     """Health check endpoint"""
+    snapshot = secrets_provider.snapshot
+    
     # Check if necessary secrets are available
     secrets_available = (
-        db_password != 'db_password_not_found' and
-        api_key != 'api_key_not_found'
+        snapshot.get('db_password', None) is not None and
+        snapshot.get('api_key', None) is not None
     )
+    secrets_info = {
+        'generation': snapshot.generation,
+        'loaded_at': snapshot.loaded_at,
+        'watch_mode': secrets_provider.mode
+    }
     
     if secrets_available:
-        return jsonify({'status': 'ok', 'secrets_available': True})
+        return jsonify({'status': 'ok', 'secrets_available': True, 'secrets': secrets_info})
     else:
-        return jsonify({'status': 'degraded', 'secrets_available': False}), 503
+        return jsonify({'status': 'degraded', 'secrets_available': False, 'secrets': secrets_info}), 503
 
 if __name__ == '__main__':
     # Get configuration from environment variables
@@ -0,0 +1,176 @@
+"""
+Hot-reloading provider for file-based secrets.
+
+All *.txt files in the secrets directory are read into an immutable snapshot.
+A background thread watches the directory with inotify (through ctypes, since
+the standard library has no binding) and, when a file changes, builds a new
+snapshot and swaps it in with a single reference assignment. Request handlers
+read `provider.snapshot` without taking any lock and always see one complete,
+consistent set of secrets.
+
+Where inotify is unavailable (non-Linux hosts, or bind mounts whose changes
+don't raise events, such as Docker Desktop file sharing), the directory is
+polled instead. A slow poll also runs alongside inotify as a safety net.
+"""
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import threading
+import time
+import types
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# inotify event mask: anything that can change which files exist or what they contain
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+
+
+@dataclass(frozen=True)
+class SecretsSnapshot:
+    generation: int
+    loaded_at: float
+    secrets: types.MappingProxyType = field(repr=False)
+    signature: tuple = field(repr=False, default=())
+
+    def get(self, name, default=''):
+        return self.secrets.get(name, default)
+
+
+class SecretsProvider:
+    def __init__(self, directory, poll_interval=2.0, safety_poll_interval=30.0, debounce=0.1):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.safety_poll_interval = safety_poll_interval
+        self.debounce = debounce
+        self.mode = None
+        self._thread = None
+        self._reload_lock = threading.Lock()   # serialises writers only; readers never take it
+
+        self.snapshot = SecretsSnapshot(0, time.time(), types.MappingProxyType({}))
+        self.reload()
+
+    def get(self, name, default=''):
+        return self.snapshot.get(name, default)
+
+    def _signature(self):
+        """Cheap fingerprint of the directory: (name, inode, size, mtime) of every secret file"""
+        try:
+            entries = sorted((entry for entry in os.scandir(self.directory)
+                              if entry.name.endswith('.txt') and entry.is_file()), key=lambda entry: entry.name)
+        except FileNotFoundError:
+            return ()
+        signature = []
+        for entry in entries:
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            signature.append((entry.name, stat.st_ino, stat.st_size, stat.st_mtime_ns))
+        return tuple(signature)
+
+    def reload(self, force=False):
+        """Re-read the directory and swap in a new snapshot if anything changed; returns the current generation"""
+        with self._reload_lock:
+            current = self.snapshot
+            signature = self._signature()
+            if not force and current.generation > 0 and signature == current.signature:
+                return current.generation
+
+            secrets = {}
+            for name, *_ in signature:
+                path = os.path.join(self.directory, name)
+                try:
+                    with open(path, 'r') as file:
+                        secrets[name[:-len('.txt')]] = file.read().strip()
+                except OSError as e:
+                    # Keep the previous value rather than dropping a secret that is mid-rotation
+                    logger.error(f"Error reading secret file {path}: {e}")
+                    previous = current.secrets.get(name[:-len('.txt')])
+                    if previous is not None:
+                        secrets[name[:-len('.txt')]] = previous
+
+            if current.generation > 0 and secrets == dict(current.secrets):
+                # Touched but not changed; remember the new signature, keep the generation
+                self.snapshot = SecretsSnapshot(current.generation, current.loaded_at, current.secrets, signature)
+                return current.generation
+
+            self.snapshot = SecretsSnapshot(current.generation + 1, time.time(),
+                                            types.MappingProxyType(secrets), signature)
+            logger.info(f"Secrets snapshot {self.snapshot.generation} loaded: {len(secrets)} secrets")
+            return self.snapshot.generation
+
+    # -- watching -------------------------------------------------------------
+
+    def start(self):
+        """Start watching the secrets directory in a background thread"""
+        if self._thread is not None:
+            return
+        inotify_fd = self._init_inotify()
+        self.mode = 'inotify' if inotify_fd is not None else 'polling'
+        self._thread = threading.Thread(target=self._watch, args=(inotify_fd,), name='secrets-watch', daemon=True)
+        self._thread.start()
+        logger.info(f"Watching {self.directory} for secret changes ({self.mode})")
+
+    def _init_inotify(self):
+        if not hasattr(select, 'poll') or not os.path.isdir(self.directory):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+            if fd < 0:
+                raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+            if libc.inotify_add_watch(fd, os.fsencode(self.directory), WATCH_MASK) < 0:
+                errno = ctypes.get_errno()
+                os.close(fd)
+                raise OSError(errno, 'inotify_add_watch failed')
+            return fd
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify unavailable, falling back to polling: {e}")
+            return None
+
+    def _watch(self, inotify_fd):
+        poller = None
+        if inotify_fd is not None:
+            poller = select.poll()
+            poller.register(inotify_fd, select.POLLIN)
+
+        while True:
+            try:
+                if poller is None:
+                    time.sleep(self.poll_interval)
+                    self.reload()
+                    continue
+
+                if not poller.poll(self.safety_poll_interval * 1000):
+                    self.reload()
+                    continue
+
+                # Let a burst of events (e.g. write + rename) settle, then drain them all
+                time.sleep(self.debounce)
+                self._drain(inotify_fd)
+                self.reload()
+            except Exception as e:
+                logger.error(f"Error watching secrets directory: {e}")
+                time.sleep(self.poll_interval)
+
+    @staticmethod
+    def _drain(fd):
+        while True:
+            try:
+                if not os.read(fd, 65536):
+                    return
+            except BlockingIOError:
+                return
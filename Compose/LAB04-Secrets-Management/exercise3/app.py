@@ -2,8 +2,8 @@ from flask import Flask, jsonify, render_template_string, request
 import os
 import logging
 import requests
-import time
-import json
+
+from secrets_client import SecretsClient
 
 app = Flask(__name__)
 
@@ -15,62 +15,36 @@ logger = logging.getLogger(__name__)
 SECRETS_API_URL = os.environ.get("SECRETS_API_URL", "http://secrets-api:8000")
 SECRETS_API_KEY = os.environ.get("SECRETS_API_KEY", "api_key_for_secrets_manager")
 
-# Headers for API requests
-API_HEADERS = {
-    "X-API-Key": SECRETS_API_KEY,
-    "Content-Type": "application/json"
-}
+SECRETS_CACHE_TTL = float(os.environ.get("SECRETS_CACHE_TTL", 300))
+SECRETS_STALE_TTL = float(os.environ.get("SECRETS_STALE_TTL", 600))
 
-def get_secret(secret_name, default=''):
-    """Retrieve a secret from the secrets manager API with retries"""
-    max_retries = 5
-    retry_delay = 2
+# Secrets this application needs; they are always fetched together
+SECRET_NAMES = ["db_password", "api_key", "jwt_secret"]
 
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(
-                f"{SECRETS_API_URL}/secrets/{secret_name}",
-                headers=API_HEADERS,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("exists", False):
-                    return data.get("value", default)
-                else:
-                    logger.warning(f"Secret {secret_name} not found in secrets store")
-                    return default
-            else:
-                logger.error(f"Failed to retrieve secret: {response.status_code} - {response.text}")
-                
-        except requests.RequestException as e:
-            logger.error(f"Request error retrieving secret (attempt {attempt+1}/{max_retries}): {e}")
-            
-        # Wait before retrying, except on the last attempt
-        if attempt < max_retries - 1:
-            time.sleep(retry_delay)
-    
-    logger.error(f"All attempts to retrieve secret {secret_name} failed")
-    return default
+# Shared client: pooled HTTP session, batched fetches and an in-memory cache
+secrets_client = SecretsClient(
+    SECRETS_API_URL,
+    SECRETS_API_KEY,
+    ttl=SECRETS_CACHE_TTL,
+    stale_ttl=SECRETS_STALE_TTL
+)
 
-# Initialize variables
-db_password = None
-api_key = None
-jwt_secret = None
+def get_secret(secret_name, default=''):
+    """Retrieve a secret, from the cache when possible"""
+    return secrets_client.get(secret_name, default)
 
-# Load secrets when app starts up
+def load_secrets():
+    """Return all secrets the application needs, using a single API request for any that aren't cached"""
+    values = secrets_client.get_many(SECRET_NAMES)
+    return {name: values[name] or f"{name}_not_found" for name in SECRET_NAMES}
+
+# Fetch all secrets once at startup and follow changes from the API
 with app.app_context():
-    def load_secrets():
-        global db_password, api_key, jwt_secret
-        
-        logger.info("Loading secrets from secrets manager")
-        db_password = get_secret("db_password", "db_password_not_found")
-        api_key = get_secret("api_key", "api_key_not_found")
-        jwt_secret = get_secret("jwt_secret", "jwt_secret_not_found")
-        
-        logger.info(f"Secrets loaded. DB Password available: {'Yes' if db_password != 'db_password_not_found' else 'No'}")
-        logger.info(f"API Key available: {'Yes' if api_key != 'api_key_not_found' else 'No'}")
+    logger.info("Loading secrets from secrets manager")
+    _secrets = load_secrets()
+    logger.info(f"Secrets loaded. DB Password available: {'Yes' if _secrets['db_password'] != 'db_password_not_found' else 'No'}")
+    logger.info(f"API Key available: {'Yes' if _secrets['api_key'] != 'api_key_not_found' else 'No'}")
+    secrets_client.watch()
 
 @app.route('/')
 def index():
@@ -230,39 +204,17 @@ def index():
         </ul>
         
         <h2>Implementation Details</h2>
-        <p>The application retrieves secrets with retries and error handling:</p>
+        <p>The application fetches all of its secrets in one batched request and caches them in memory.
+        Stale values are served while they are refreshed in the background, and changes are pushed
+        from the Secrets API so rotated secrets are picked up immediately:</p>
         <pre>
-def get_secret(secret_name, default=''):
-    """Retrieve a secret from the secrets manager API with retries"""
-    max_retries = 5
-    retry_delay = 2
+secrets_client = SecretsClient(SECRETS_API_URL, SECRETS_API_KEY, ttl=300, stale_ttl=600)
 
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(
-                f"{SECRETS_API_URL}/secrets/{secret_name}",
-                headers=API_HEADERS,
-                timeout=5
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get("exists", False):
-                    return data.get("value", default)
-                else:
-                    logger.warning(f"Secret {secret_name} not found")
-                    return default
-            else:
-                logger.error(f"Failed to retrieve secret: {response.status_code}")
-                
-        except requests.RequestException as e:
-            logger.error(f"Request error retrieving secret: {e}")
-            
-        # Wait before retrying
-        if attempt < max_retries - 1:
-            time.sleep(retry_delay)
-    
-    return default
+# One POST /secrets:batchGet for everything that isn't cached
+secrets = secrets_client.get_many(["db_password", "api_key", "jwt_secret"])
+
+# Follow GET /secrets:watch and refresh secrets when they change
+secrets_client.watch()
         </pre>
         
         <script>
@@ -284,9 +236,10 @@ def get_secret(secret_name, default=''):
     </html>
     """
     
-    # Load secrets if not already loaded
-    if db_password is None:
-        load_secrets()
+    secrets = load_secrets()
+    db_password = secrets['db_password']
+    api_key = secrets['api_key']
+    jwt_secret = secrets['jwt_secret']
     
     # Safely mask secrets for display
     def mask_secret(secret, default="Not available"):
@@ -315,29 +268,29 @@ def get_secret(secret_name, default=''):
 
 @app.route('/refresh-secrets')
 def refresh_secrets():
-    """Force reload of secrets"""
-    load_secrets()
-    return jsonify({"status": "success", "refreshed": ["db_password", "api_key", "jwt_secret"]})
+    """Force reload of secrets in one batched request"""
+    try:
+        secrets_client.refresh(SECRET_NAMES)
+    except (requests.RequestException, ValueError) as e:
+        logger.error(f"Failed to refresh secrets: {e}")
+        return jsonify({"status": "error", "message": "Secrets API unavailable, keeping cached secrets"}), 503
+    return jsonify({"status": "success", "refreshed": SECRET_NAMES})
 
 @app.route('/api/data')
 def api_data():
     """Example of a secure API that doesn't expose secrets"""
-    # Load secrets if not already loaded
-    if db_password is None:
-        load_secrets()
-        
+    secrets = load_secrets()
     data = {
         'status': 'success',
         'message': 'Using Redis-based secrets management',
         'credentials_available': {
-            'db_password': db_password != 'db_password_not_found',
-            'api_key': api_key != 'api_key_not_found',
-            'jwt_secret': jwt_secret != 'jwt_secret_not_found',
+            name: secrets[name] != f"{name}_not_found" for name in SECRET_NAMES
         },
         'environment': os.environ.get('APP_ENV', 'development'),
         'secrets_api': {
             'url': SECRETS_API_URL,
-            'status': check_secrets_api_status()
+            'status': check_secrets_api_status(),
+            'cache': secrets_client.cache_info()
         }
     }
     return jsonify(data)
@@ -345,7 +298,7 @@ def api_data():
 def check_secrets_api_status():
     """Check if the secrets API is available"""
     try:
-        response = requests.get(f"{SECRETS_API_URL}/health", timeout=2)
+        response = secrets_client.health()
         if response.status_code == 200:
             return "available"
         return f"error: status code {response.status_code}"
@@ -355,13 +308,10 @@ def check_secrets_api_status():
 @app.route('/health')
 def health():
     """Health check endpoint"""
-    # Load secrets if not already loaded
-    if db_password is None:
-        load_secrets()
-        
+    secrets = load_secrets()
     secrets_available = (
-        db_password != 'db_password_not_found' and
-        api_key != 'api_key_not_found'
+        secrets['db_password'] != 'db_password_not_found' and
+        secrets['api_key'] != 'api_key_not_found'
     )
     
     secrets_api_status = check_secrets_api_status()
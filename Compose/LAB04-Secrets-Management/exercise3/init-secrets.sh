@@ -19,7 +19,7 @@ max_attempts=10
 attempt=1
 while [ $attempt -le $max_attempts ]; do
     echo -e "${YELLOW}Attempt $attempt/${max_attempts}...${NC}"
-    if curl -s http://localhost:8088/health | grep -q "healthy"; then
+    if curl -sf http://localhost:8088/health | grep -q '"status":"healthy"'; then
         echo -e "${GREEN}Secrets API is ready!${NC}"
         break
     else
@@ -1,7 +1,12 @@
-from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
-import redis
+from redis import asyncio as aioredis
+from redis.exceptions import ConnectionError as RedisConnectionError
+import asyncio
+import json
 import os
+import time
 import logging
 from typing import Optional, Dict, List
 
@@ -17,14 +22,95 @@ redis_port = int(os.environ.get("REDIS_PORT", 6379))
 redis_password = os.environ.get("REDIS_PASSWORD", "secretstorepwd")
 api_key = os.environ.get("API_KEY", "api_key_for_secrets_manager")
 
-# Initialize Redis client
-redis_client = redis.Redis(
+# Secrets live under their own key prefix, with a set of names as the index,
+# so listing never has to walk unrelated keys in the database
+key_prefix = os.environ.get("SECRETS_KEY_PREFIX", "secret:")
+index_key = os.environ.get("SECRETS_INDEX_KEY", "secrets:index")
+max_batch_size = int(os.environ.get("MAX_BATCH_SIZE", 1000))
+
+# Every write and delete publishes the affected names (never values) on this
+# channel; GET /secrets:watch relays it to clients as server-sent events
+changes_channel = os.environ.get("SECRETS_CHANGES_CHANNEL", "secrets:changes")
+watch_keepalive = float(os.environ.get("WATCH_KEEPALIVE", 15))
+# Each watcher holds a Redis connection for as long as it is connected, so
+# watchers get their own pool; once it is full, new watchers get 503
+max_watchers = int(os.environ.get("MAX_WATCHERS", 100))
+
+# Connection pool tuning: handlers wait up to pool_timeout for a free
+# connection instead of failing when all max_connections are busy
+redis_max_connections = int(os.environ.get("REDIS_MAX_CONNECTIONS", 50))
+redis_pool_timeout = float(os.environ.get("REDIS_POOL_TIMEOUT", 5))
+redis_socket_timeout = float(os.environ.get("REDIS_SOCKET_TIMEOUT", 2))
+redis_health_check_interval = int(os.environ.get("REDIS_HEALTH_CHECK_INTERVAL", 30))
+
+# Initialize the async Redis client; every call is awaited, so a Redis
+# round-trip never blocks the event loop
+redis_pool = aioredis.BlockingConnectionPool(
+    host=redis_host,
+    port=redis_port,
+    password=redis_password,
+    db=0,
+    decode_responses=True,
+    max_connections=redis_max_connections,
+    timeout=redis_pool_timeout,
+    socket_timeout=redis_socket_timeout,
+    socket_connect_timeout=redis_socket_timeout,
+    socket_keepalive=True,
+    health_check_interval=redis_health_check_interval
+)
+redis_client = aioredis.Redis(connection_pool=redis_pool)
+
+# Subscriptions for /secrets:watch; a plain (non-blocking) pool refuses
+# a connection beyond max_watchers instead of waiting for one
+watch_pool = aioredis.ConnectionPool(
     host=redis_host,
     port=redis_port,
     password=redis_password,
     db=0,
-    decode_responses=True
+    decode_responses=True,
+    max_connections=max_watchers,
+    socket_connect_timeout=redis_socket_timeout,
+    socket_keepalive=True,
+    health_check_interval=redis_health_check_interval
 )
+watch_client = aioredis.Redis(connection_pool=watch_pool)
+
+redis_stats = {"errors": 0, "last_error": None, "last_ping_ms": None}
+
+def pool_stats(pool=redis_pool) -> Dict:
+    """Connection pool usage; the counts come from the pool's internal bookkeeping"""
+    in_use = len(getattr(pool, "_in_use_connections", ()))
+    idle = len(getattr(pool, "_available_connections", ()))
+    return {
+        "max_connections": pool.max_connections,
+        "in_use": in_use,
+        "idle": idle,
+        "created": in_use + idle,
+        "utilization": round(in_use / pool.max_connections, 3)
+    }
+
+def secret_key(name: str) -> str:
+    return f"{key_prefix}{name}"
+
+def check_batch_size(count: int):
+    if count > max_batch_size:
+        raise HTTPException(status_code=400, detail=f"Batch too large ({count} > {max_batch_size})")
+
+def change_event(event: str, names: List[str]) -> str:
+    return json.dumps({"event": event, "names": names})
+
+def record_redis_error(e: Exception):
+    redis_stats["errors"] += 1
+    redis_stats["last_error"] = str(e)
+
+async def store_secrets(secrets: List["Secret"]):
+    """Write secrets and index their names in one round-trip (MULTI/EXEC)"""
+    async with redis_client.pipeline(transaction=True) as pipe:
+        for secret in secrets:
+            pipe.set(secret_key(secret.name), secret.value, ex=secret.ttl or None)
+        pipe.sadd(index_key, *[secret.name for secret in secrets])
+        pipe.publish(changes_channel, change_event("set", [secret.name for secret in secrets]))
+        await pipe.execute()
 
 # Make sure API is secure with API key
 def verify_api_key(x_api_key: str = Header(...)):
@@ -46,6 +132,15 @@ class SecretResponse(BaseModel):
     exists: bool
     value: Optional[str] = None
 
+class BatchGetRequest(BaseModel):
+    names: List[str]
+
+class BatchSetRequest(BaseModel):
+    secrets: List[Secret]
+
+class BatchDeleteRequest(BaseModel):
+    names: List[str]
+
 @app.get("/")
 async def root():
     return {"message": "Secrets Manager API", "version": "1.0"}
@@ -53,24 +148,37 @@ async def root():
 @app.get("/health")
 async def health():
     try:
-        # Check Redis connection
-        redis_client.ping()
-        return {"status": "healthy", "redis_connected": True}
+        # Check Redis connection, bounded so a hung Redis can't hang the health check
+        started = time.perf_counter()
+        await asyncio.wait_for(redis_client.ping(), timeout=redis_socket_timeout)
+        redis_stats["last_ping_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return {
+            "status": "healthy",
+            "redis_connected": True,
+            "redis_ping_ms": redis_stats["last_ping_ms"],
+            "pool": pool_stats()
+        }
     except Exception as e:
         logger.error(f"Health check failed: {e}")
-        return {"status": "unhealthy", "redis_connected": False, "error": str(e)}
+        record_redis_error(e)
+        return JSONResponse(status_code=503, content={
+            "status": "unhealthy", "redis_connected": False, "error": str(e), "pool": pool_stats()
+        })
+
+@app.get("/metrics")
+async def metrics():
+    """Connection pool and Redis error metrics"""
+    return {"pool": pool_stats(), "watch_pool": pool_stats(watch_pool), "redis": redis_stats}
 
 @app.post("/secrets", status_code=201)
 async def create_secret(secret: Secret, _: str = Depends(verify_api_key)):
     """Create or update a secret in the store"""
     try:
-        if secret.ttl:
-            redis_client.setex(secret.name, secret.ttl, secret.value)
-        else:
-            redis_client.set(secret.name, secret.value)
+        await store_secrets([secret])
         logger.info(f"Secret '{secret.name}' created/updated successfully")
         return {"status": "success", "message": f"Secret '{secret.name}' stored successfully"}
     except Exception as e:
+        record_redis_error(e)
         logger.error(f"Failed to store secret: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to store secret: {str(e)}")
 
@@ -81,11 +189,12 @@ async def get_secret(name: str, x_api_key: str = Header(...)):
     verify_api_key(x_api_key)
     
     try:
-        value = redis_client.get(name)
+        value = await redis_client.get(secret_key(name))
         if value is None:
             return {"name": name, "exists": False}
         return {"name": name, "exists": True, "value": value}
     except Exception as e:
+        record_redis_error(e)
         logger.error(f"Failed to retrieve secret: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to retrieve secret: {str(e)}")
 
@@ -93,11 +202,16 @@ async def get_secret(name: str, x_api_key: str = Header(...)):
 async def delete_secret(name: str, _: str = Depends(verify_api_key)):
     """Delete a secret by name"""
     try:
-        deleted = redis_client.delete(name)
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(secret_key(name))
+            pipe.srem(index_key, name)
+            pipe.publish(changes_channel, change_event("delete", [name]))
+            deleted = (await pipe.execute())[0]
         if deleted == 0:
             return {"status": "warning", "message": f"Secret '{name}' not found"}
         return {"status": "success", "message": f"Secret '{name}' deleted successfully"}
     except Exception as e:
+        record_redis_error(e)
         logger.error(f"Failed to delete secret: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to delete secret: {str(e)}")
 
@@ -105,27 +219,111 @@ async def delete_secret(name: str, _: str = Depends(verify_api_key)):
 async def list_secrets(_: str = Depends(verify_api_key)):
     """List all secret names (not values)"""
     try:
-        # Use scan to safely iterate over all keys
-        keys = []
-        cursor = 0
-        while True:
-            cursor, partial_keys = redis_client.scan(cursor=cursor, count=100)
-            keys.extend(partial_keys)
-            if cursor == 0:
-                break
+        names = sorted(await redis_client.smembers(index_key))
         
-        return {"secrets": keys, "count": len(keys)}
+        # Secrets with a TTL expire without touching the index; prune those names
+        alive = []
+        if names:
+            async with redis_client.pipeline(transaction=False) as pipe:
+                for name in names:
+                    pipe.exists(secret_key(name))
+                alive = await pipe.execute()
+        expired = [name for name, exists in zip(names, alive) if not exists]
+        if expired:
+            await redis_client.srem(index_key, *expired)
+        
+        secrets = [name for name, exists in zip(names, alive) if exists]
+        return {"secrets": secrets, "count": len(secrets)}
     except Exception as e:
+        record_redis_error(e)
         logger.error(f"Failed to list secrets: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to list secrets: {str(e)}")
 
+@app.post("/secrets:batchGet")
+async def batch_get_secrets(batch: BatchGetRequest, _: str = Depends(verify_api_key)):
+    """Get several secrets in a single MGET"""
+    check_batch_size(len(batch.names))
+    try:
+        values = await redis_client.mget([secret_key(name) for name in batch.names]) if batch.names else []
+        secrets = [
+            {"name": name, "exists": False} if value is None else {"name": name, "exists": True, "value": value}
+            for name, value in zip(batch.names, values)
+        ]
+        return {"secrets": secrets, "count": len(secrets)}
+    except Exception as e:
+        record_redis_error(e)
+        logger.error(f"Failed to retrieve secrets: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve secrets: {str(e)}")
+
+@app.post("/secrets:batchSet", status_code=201)
+async def batch_set_secrets(batch: BatchSetRequest, _: str = Depends(verify_api_key)):
+    """Create or update several secrets, each with an optional TTL, in one transaction"""
+    check_batch_size(len(batch.secrets))
+    if not batch.secrets:
+        return {"status": "success", "stored": 0}
+    try:
+        await store_secrets(batch.secrets)
+        logger.info(f"{len(batch.secrets)} secrets created/updated successfully")
+        return {"status": "success", "stored": len(batch.secrets)}
+    except Exception as e:
+        record_redis_error(e)
+        logger.error(f"Failed to store secrets: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to store secrets: {str(e)}")
+
+@app.post("/secrets:batchDelete")
+async def batch_delete_secrets(batch: BatchDeleteRequest, _: str = Depends(verify_api_key)):
+    """Delete several secrets in one transaction"""
+    check_batch_size(len(batch.names))
+    if not batch.names:
+        return {"status": "success", "deleted": 0}
+    try:
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.delete(*[secret_key(name) for name in batch.names])
+            pipe.srem(index_key, *batch.names)
+            pipe.publish(changes_channel, change_event("delete", batch.names))
+            deleted = (await pipe.execute())[0]
+        return {"status": "success", "deleted": deleted}
+    except Exception as e:
+        record_redis_error(e)
+        logger.error(f"Failed to delete secrets: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to delete secrets: {str(e)}")
+
+@app.get("/secrets:watch")
+async def watch_secrets(request: Request, _: str = Depends(verify_api_key)):
+    """Stream change notifications (secret names, not values) as server-sent events"""
+    # Subscribe before answering, so a full watch pool is reported as 503
+    pubsub = watch_client.pubsub(ignore_subscribe_messages=True)
+    try:
+        await pubsub.subscribe(changes_channel)
+    except RedisConnectionError as e:
+        await pubsub.reset()
+        record_redis_error(e)
+        logger.warning(f"Cannot start watcher: {e}")
+        return JSONResponse(status_code=503, headers={"Retry-After": "5"},
+                            content={"detail": f"Cannot watch secrets right now: {e}"})
+    
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                message = await pubsub.get_message(timeout=watch_keepalive)
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {message['data']}\n\n"
+        finally:
+            await pubsub.reset()
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
 # Initialize default secrets when the app starts
 @app.on_event("startup")
 async def startup_event():
     logger.info("Initializing secrets manager API")
     try:
         # Check if secrets already exist
-        if not redis_client.exists("db_password") and not redis_client.exists("api_key"):
+        if not await redis_client.exists(secret_key("db_password"), secret_key("api_key")):
             # Create default secrets
             default_secrets = {
                 "db_password": "redis_secret_db_password",
@@ -133,16 +331,21 @@ async def startup_event():
                 "jwt_secret": "redis_secret_jwt_token_67890"
             }
             
-            for name, value in default_secrets.items():
-                redis_client.set(name, value)
-                logger.info(f"Created default secret: {name}")
+            await store_secrets([Secret(name=name, value=value) for name, value in default_secrets.items()])
+            logger.info(f"Created default secrets: {', '.join(default_secrets)}")
             
             logger.info("Default secrets initialized")
         else:
             logger.info("Secrets already exist, skipping initialization")
     except Exception as e:
+        record_redis_error(e)
         logger.error(f"Failed to initialize default secrets: {e}")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await redis_pool.disconnect()
+    await watch_pool.disconnect()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
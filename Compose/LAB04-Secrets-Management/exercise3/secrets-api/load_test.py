@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Load test for the secrets API.
+
+Runs a number of concurrent clients against one endpoint and reports
+throughput and latency percentiles. Run it once against the service built from
+the previous (synchronous Redis client) version and once against the current
+one, with the same settings, to compare p99 latency under concurrency:
+
+    python load_test.py --url http://localhost:8088 --concurrency 50 --requests 5000
+    python load_test.py --path /health --concurrency 100 --json > after.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+async def worker(client, method, path, body, counter, total, latencies, errors):
+    while True:
+        if counter[0] >= total:
+            return
+        counter[0] += 1
+
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, path, json=body)
+            if response.status_code >= 400:
+                errors[str(response.status_code)] = errors.get(str(response.status_code), 0) + 1
+                continue
+        except httpx.HTTPError as e:
+            errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def run(args):
+    headers = {"X-API-Key": args.api_key}
+    body = json.loads(args.body) if args.body else None
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=args.url, headers=headers, limits=limits, timeout=args.timeout) as client:
+        # Warm up connections so the measurement doesn't include connection setup
+        await asyncio.gather(*(client.request(args.method, args.path, json=body)
+                               for _ in range(min(args.concurrency, args.requests))),
+                             return_exceptions=True)
+
+        latencies, errors, counter = [], {}, [0]
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client, args.method, args.path, body, counter, args.requests, latencies, errors)
+                               for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "url": args.url + args.path,
+        "method": args.method,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies), 2) if latencies else None,
+            "p50": round(percentile(latencies, 50), 2) if latencies else None,
+            "p90": round(percentile(latencies, 90), 2) if latencies else None,
+            "p99": round(percentile(latencies, 99), 2) if latencies else None,
+            "max": round(latencies[-1], 2) if latencies else None
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the secrets API")
+    parser.add_argument("--url", default="http://localhost:8088", help="Base URL of the secrets API")
+    parser.add_argument("--path", default="/secrets/db_password", help="Endpoint to request")
+    parser.add_argument("--method", default="GET", help="HTTP method")
+    parser.add_argument("--body", help="JSON request body, e.g. for /secrets:batchGet")
+    parser.add_argument("--api-key", default=os.environ.get("API_KEY", "api_key_for_secrets_manager"),
+                        help="API key (defaults to $API_KEY)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=5000, help="Total number of requests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+
+    latency = result["latency_ms"]
+    print(f"{result['method']} {result['url']}: {result['requests']} requests, {result['concurrency']} concurrent clients")
+    print(f"  succeeded:  {result['succeeded']}  errors: {result['errors'] or 'none'}")
+    print(f"  throughput: {result['throughput_rps']} req/s in {result['elapsed_s']} s")
+    print(f"  latency ms: mean {latency['mean']}  p50 {latency['p50']}  p90 {latency['p90']}  "
+          f"p99 {latency['p99']}  max {latency['max']}")
+    if result["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Client for the Redis-backed secrets API with an in-memory cache.
+
+- One pooled requests.Session is shared by all calls
+- Secrets are fetched in batches through POST /secrets:batchGet
+- Cached values are fresh for `ttl` seconds; for a further `stale_ttl` seconds a
+  stale value is still returned immediately while it is refreshed in the
+  background (stale-while-revalidate). If the API is unreachable, the last
+  known value is kept rather than replaced by the default
+- watch() follows the API's change stream (GET /secrets:watch), so rotated or
+  deleted secrets are refreshed as soon as they change instead of on expiry
+"""
+
+import json
+import logging
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class SecretsClient:
+    def __init__(self, api_url, api_key, ttl=300.0, stale_ttl=600.0, timeout=(2, 5), max_retries=3, pool_size=10):
+        self.api_url = api_url.rstrip('/')
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timeout = timeout
+
+        # Retries back off 0.25s, 0.5s, 1s... instead of sleeping a fixed 2s per attempt
+        retry = Retry(total=max_retries, backoff_factor=0.25, status_forcelist=(502, 503, 504),
+                      allowed_methods=frozenset({'GET', 'POST'}))
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers.update({'X-API-Key': api_key, 'Content-Type': 'application/json'})
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Health checks report the API's status as it is right now, so they are never retried
+        self.health_session = requests.Session()
+
+        self._lock = threading.Lock()
+        self._cache = {}            # name -> (value or None if missing, fetched_at)
+        self._refreshing = set()    # names with a background refresh in flight
+        self._watcher = None
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'fetches': 0, 'errors': 0, 'invalidations': 0}
+
+    # -- fetching -----------------------------------------------------------
+
+    def fetch(self, names):
+        """Fetch secrets from the API in one request and cache them; returns {name: value or None}"""
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {}
+        response = self.session.post(f"{self.api_url}/secrets:batchGet", json={'names': names}, timeout=self.timeout)
+        response.raise_for_status()
+
+        now = time.monotonic()
+        values = {item['name']: item.get('value') if item.get('exists') else None
+                  for item in response.json().get('secrets', [])}
+        with self._lock:
+            self.stats['fetches'] += 1
+            for name in names:
+                self._cache[name] = (values.get(name), now)
+        return values
+
+    def health(self, timeout=2):
+        """GET the API's /health once and return the response"""
+        return self.health_session.get(f"{self.api_url}/health", timeout=timeout)
+
+    def get_many(self, names, default=None):
+        """Return {name: value} for all names, fetching everything missing or expired in one request"""
+        now = time.monotonic()
+        result, to_fetch, to_revalidate = {}, [], []
+
+        with self._lock:
+            for name in names:
+                entry = self._cache.get(name)
+                age = None if entry is None else now - entry[1]
+                if age is not None and age < self.ttl:
+                    self.stats['hits'] += 1
+                    result[name] = entry[0]
+                elif age is not None and age < self.ttl + self.stale_ttl:
+                    self.stats['stale_hits'] += 1
+                    result[name] = entry[0]
+                    if name not in self._refreshing:
+                        self._refreshing.add(name)
+                        to_revalidate.append(name)
+                else:
+                    self.stats['misses'] += 1
+                    to_fetch.append(name)
+
+        if to_revalidate:
+            threading.Thread(target=self._revalidate, args=(to_revalidate,), daemon=True).start()
+
+        if to_fetch:
+            try:
+                result.update(self.fetch(to_fetch))
+            except (requests.RequestException, ValueError) as e:
+                self._record_error(f"Failed to fetch secrets {', '.join(to_fetch)}: {e}")
+                # Fall back to the last known value, however old
+                with self._lock:
+                    for name in to_fetch:
+                        if name in self._cache:
+                            result[name] = self._cache[name][0]
+
+        return {name: default if result.get(name) is None else result[name] for name in names}
+
+    def get(self, name, default=None):
+        return self.get_many([name], default)[name]
+
+    def refresh(self, names=None):
+        """Re-fetch the given secrets (default: everything cached) in one request"""
+        with self._lock:
+            names = list(self._cache) if names is None else list(names)
+        return self.fetch(names)
+
+    def invalidate(self, names=None):
+        """Drop secrets from the cache so the next get fetches them again"""
+        with self._lock:
+            for name in (list(self._cache) if names is None else names):
+                self._cache.pop(name, None)
+            self.stats['invalidations'] += 1
+
+    def cache_info(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'cached': len(self._cache),
+                'ages': {name: round(now - fetched_at, 1) for name, (_value, fetched_at) in self._cache.items()},
+                'watching': self._watcher is not None and self._watcher.is_alive(),
+                'stats': dict(self.stats)
+            }
+
+    def _revalidate(self, names):
+        try:
+            self.fetch(names)
+        except (requests.RequestException, ValueError) as e:
+            self._record_error(f"Background refresh of {', '.join(names)} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.difference_update(names)
+
+    def _record_error(self, message):
+        logger.error(message)
+        with self._lock:
+            self.stats['errors'] += 1
+
+    # -- change notifications -------------------------------------------------
+
+    def watch(self):
+        """Start a background thread that applies change notifications from the API"""
+        if self._watcher is None or not self._watcher.is_alive():
+            self._watcher = threading.Thread(target=self._watch, name='secrets-watch', daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        delay = 1
+        while True:
+            try:
+                # The API sends a keepalive comment every few seconds, so a long read timeout means a dead stream
+                with self.session.get(f"{self.api_url}/secrets:watch", stream=True,
+                                      timeout=(self.timeout[0], 60)) as response:
+                    response.raise_for_status()
+                    # Changes made while disconnected were missed; start over from the API
+                    self._resync()
+                    delay = 1
+                    for line in response.iter_lines(decode_unicode=True):
+                        if line and line.startswith('data:'):
+                            self._apply_change(json.loads(line[len('data:'):]))
+            except (requests.RequestException, ValueError) as e:
+                logger.warning(f"Secrets change stream interrupted: {e}; reconnecting in {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    def _resync(self):
+        try:
+            self.refresh()
+        except (requests.RequestException, ValueError) as e:
+            self._record_error(f"Resync after reconnect failed: {e}")
+
+    def _apply_change(self, change):
+        with self._lock:
+            tracked = [name for name in change.get('names', []) if name in self._cache]
+        if not tracked:
+            return
+        logger.info(f"Secrets changed ({change.get('event')}): {', '.join(tracked)}")
+        try:
+            self.fetch(tracked)
+        except (requests.RequestException, ValueError) as e:
+            # Can't confirm the new values; make the next get go to the API
+            self._record_error(f"Failed to refresh changed secrets: {e}")
+            self.invalidate(tracked)
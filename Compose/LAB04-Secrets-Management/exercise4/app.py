@@ -9,7 +9,7 @@ app = Flask(__name__)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Check if get_secret is available (provided by the secrets_manager import hook)
+# Check if get_secret is available (injected by "secrets_manager.py run")
 if not hasattr(sys.modules['builtins'], 'get_secret'):
     logger.error("Function get_secret not available - was the app run through secrets_manager.py?")
     
@@ -13,6 +13,10 @@ import json
 import base64
 import subprocess
 import time
+import functools
+import threading
+import mmap
+import struct
 from typing import Dict, Optional, List, Any
 import hashlib
 import getpass
@@ -36,14 +40,113 @@ logger = logging.getLogger("secrets-manager")
 # Default locations
 DEFAULT_SECRETS_DIR = os.environ.get("SECRETS_DIR", "/app/secrets")
 DEFAULT_ENV_FILE = ".env.secrets"
+BUNDLE_FILENAME = "secrets.bundle"
 SECRET_KEY_ENV_VAR = "SECRETS_ENCRYPTION_KEY"
 
+# How long decrypted secrets stay cached in memory, in seconds
+SECRETS_CACHE_TTL = float(os.environ.get("SECRETS_CACHE_TTL", "300"))
+# How often the secrets directory is checked for changes, in seconds
+SECRETS_CHECK_INTERVAL = float(os.environ.get("SECRETS_CHECK_INTERVAL", "1"))
+
+
+class SecretCache:
+    """Memory-only cache of decrypted secrets, resolved lazily one name at a time
+    
+    Each entry records where its value came from (a fingerprint of the source
+    file or bundle record) and the directory generation it was last checked in.
+    The directory's mtime is polled at most every check_interval seconds; adding,
+    removing or atomically replacing a secret file changes it and starts a new
+    generation. Entries from an older generation are re-validated against their
+    own source, so only secrets that actually changed are decrypted again.
+    Missing names are cached too (value None) until the directory changes.
+    """
+    
+    def __init__(self, directory: str = DEFAULT_SECRETS_DIR, ttl: float = SECRETS_CACHE_TTL,
+                 check_interval: float = SECRETS_CHECK_INTERVAL):
+        self.directory = directory
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._entries: Dict[str, tuple] = {}
+        self._generation = 0
+        self._directory_mtime = None
+        self._checked_at = float('-inf')
+        self._lock = threading.Lock()
+    
+    def generation(self) -> int:
+        """Current directory generation, polling the directory mtime if the interval has passed"""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return self._generation
+            self._checked_at = now
+        
+        try:
+            mtime = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        
+        with self._lock:
+            if mtime != self._directory_mtime:
+                self._directory_mtime = mtime
+                self._generation += 1
+            return self._generation
+    
+    def lookup(self, name: str) -> Optional[tuple]:
+        """Return (value, fingerprint, generation) for an unexpired entry, or None"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            value, fingerprint, generation, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[name]
+                return None
+            return value, fingerprint, generation
+    
+    def store(self, name: str, value: Optional[str], fingerprint: Optional[tuple], generation: int) -> None:
+        with self._lock:
+            self._entries[name] = (value, fingerprint, generation, time.monotonic() + self.ttl)
+    
+    def revalidated(self, name: str, generation: int) -> None:
+        """Mark an entry as checked in the given generation without changing its value"""
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries[name] = (entry[0], entry[1], generation, entry[3])
+    
+    def invalidate(self, name: Optional[str] = None) -> None:
+        """Drop one secret (or all of them) so the next access decrypts it again"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+    
+    def configure(self, directory: str) -> None:
+        with self._lock:
+            self.directory = directory
+            self._entries.clear()
+            self._directory_mtime = None
+            self._checked_at = float('-inf')
+    
+    def names(self) -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [name for name, entry in self._entries.items() if entry[0] is not None and entry[3] > now]
+
+
 # Memory-only secrets store
-_secrets_store = {}
+_secrets_store = SecretCache()
+_default_key_warned = False
 
 
+@functools.lru_cache(maxsize=8)
 def derive_key(password: str, salt: bytes) -> bytes:
-    """Derive a secure encryption key from a password"""
+    """Derive a secure encryption key from a password
+    
+    PBKDF2 with 100,000 iterations costs ~100 ms of CPU, so derived keys are
+    memoised per process, keyed by the key material and salt.
+    """
     return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, 100000)
 
 
@@ -69,12 +172,15 @@ def decrypt_secret(encrypted: Dict[str, str], key: bytes) -> str:
 
 def get_encryption_key() -> bytes:
     """Get or generate the encryption key"""
+    global _default_key_warned
     key = os.environ.get(SECRET_KEY_ENV_VAR)
     
     if not key:
         # For demo purposes, use a fixed key if not provided
         # In production, you'd want to manage this key securely
-        logger.warning("Using default encryption key - NOT SECURE FOR PRODUCTION")
+        if not _default_key_warned:
+            logger.warning("Using default encryption key - NOT SECURE FOR PRODUCTION")
+            _default_key_warned = True
         key = "default_encryption_key_for_demo_only"
     
     # Derive a secure key from the provided value
@@ -119,6 +225,12 @@ def load_secrets_from_directory(directory: str = DEFAULT_SECRETS_DIR) -> Dict[st
                     encrypted_data = json.load(f)
                     secrets[secret_name] = decrypt_secret(encrypted_data, key)
         
+        # Finally the bundle, which takes precedence over individual files
+        bundle = open_bundle(directory)
+        if bundle is not None:
+            for secret_name in bundle.names():
+                secrets[secret_name] = bundle.get(secret_name, key)
+        
         logger.info(f"Loaded {len(secrets)} secrets")
         
     except Exception as e:
@@ -139,79 +251,475 @@ def create_encrypted_secret_file(secret_name: str, secret_value: str, directory:
     filename = f"{secret_name}.secret.json"
     file_path = os.path.join(directory, filename)
     
-    with open(file_path, 'w') as f:
+    # Write to a temp file and rename it into place, so readers never see a partial
+    # file and the directory mtime changes (which is how rotations are detected)
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w') as f:
         json.dump(encrypted, f)
     
     # Set appropriate permissions
     try:
-        os.chmod(file_path, 0o600)  # Only owner can read/write
+        os.chmod(tmp_path, 0o600)  # Only owner can read/write
     except Exception as e:
         logger.warning(f"Could not set permissions on {file_path}: {e}")
     
+    os.replace(tmp_path, file_path)
+    
     return file_path
 
 
+# Bundle layout: MAGIC, 4-byte big-endian header length, JSON header index
+# {"version": 1, "secrets": {name: {"offset", "length", "nonce"}}}, then the
+# records. Each record is AES-256-GCM ciphertext followed by its 16-byte tag,
+# with the secret name as associated data so records cannot be swapped.
+BUNDLE_MAGIC = b"SMBUNDL1"
+BUNDLE_VERSION = 1
+GCM_TAG_SIZE = 16
+
+
+def encrypt_bundle_record(name: str, value: str, key: bytes) -> tuple:
+    """Encrypt one secret for the bundle, returning (nonce, ciphertext + tag)"""
+    nonce = get_random_bytes(12)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    cipher.update(name.encode())
+    ciphertext, tag = cipher.encrypt_and_digest(value.encode())
+    return nonce, ciphertext + tag
+
+
+class SecretsBundle:
+    """Read-only, memory-mapped view of a secrets bundle
+    
+    Opening a bundle only parses the header index; get() decrypts just the
+    requested record, so lookup cost does not grow with the number of secrets.
+    """
+    
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.identity = _file_identity(os.fstat(f.fileno()))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        if self._mmap[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a secrets bundle")
+        
+        header_start = len(BUNDLE_MAGIC) + 4
+        (header_length,) = struct.unpack('>I', self._mmap[len(BUNDLE_MAGIC):header_start])
+        header = json.loads(self._mmap[header_start:header_start + header_length])
+        if header.get('version') != BUNDLE_VERSION:
+            self._mmap.close()
+            raise ValueError(f"Unsupported bundle version {header.get('version')} in {path}")
+        
+        self._index = header['secrets']
+        self._data_start = header_start + header_length
+    
+    def __contains__(self, name: str) -> bool:
+        return name in self._index
+    
+    def __len__(self) -> int:
+        return len(self._index)
+    
+    def names(self) -> List[str]:
+        return sorted(self._index)
+    
+    def raw(self, name: str) -> tuple:
+        """Return (nonce, ciphertext + tag) of a record without decrypting it"""
+        entry = self._index[name]
+        start = self._data_start + entry['offset']
+        return base64.b64decode(entry['nonce']), self._mmap[start:start + entry['length']]
+    
+    def get(self, name: str, key: bytes) -> Optional[str]:
+        """Decrypt and return a single secret, or None if the bundle does not contain it"""
+        if name not in self._index:
+            return None
+        nonce, record = self.raw(name)
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        cipher.update(name.encode())
+        return cipher.decrypt_and_verify(record[:-GCM_TAG_SIZE], record[-GCM_TAG_SIZE:]).decode('utf-8')
+    
+    def close(self) -> None:
+        self._mmap.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_bundle(path: str, records: Dict[str, tuple]) -> None:
+    """Atomically write a bundle from {name: (nonce, ciphertext + tag)}"""
+    index = {}
+    offset = 0
+    for name in sorted(records):
+        nonce, record = records[name]
+        index[name] = {'offset': offset, 'length': len(record), 'nonce': base64.b64encode(nonce).decode('utf-8')}
+        offset += len(record)
+    header = json.dumps({'version': BUNDLE_VERSION, 'secrets': index}, sort_keys=True).encode()
+    
+    tmp_path = f"{path}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(struct.pack('>I', len(header)))
+        f.write(header)
+        for name in sorted(records):
+            f.write(records[name][1])
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+_bundles: Dict[str, SecretsBundle] = {}
+_bundles_lock = threading.Lock()
+
+
+def _file_identity(stat: os.stat_result) -> tuple:
+    # The inode changes on every atomic replace, even within one mtime tick
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def open_bundle(directory: str = DEFAULT_SECRETS_DIR) -> Optional[SecretsBundle]:
+    """Return the directory's bundle, reopening it only when the file has been replaced"""
+    path = os.path.join(directory, BUNDLE_FILENAME)
+    try:
+        identity = _file_identity(os.stat(path))
+    except FileNotFoundError:
+        return None
+    
+    with _bundles_lock:
+        bundle = _bundles.get(path)
+        if bundle is None or bundle.identity != identity:
+            # Readers still holding the old bundle keep a valid mapping of the replaced file
+            bundle = _bundles[path] = SecretsBundle(path)
+        return bundle
+
+
+def put_bundle_secret(secret_name: str, secret_value: str, directory: str = DEFAULT_SECRETS_DIR) -> str:
+    """Add or replace one secret in the bundle; other records are copied without decrypting
+    
+    A <name>.secret.json left from before is removed, so the bundle holds the only copy.
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, BUNDLE_FILENAME)
+    
+    records = {}
+    bundle = open_bundle(directory)
+    if bundle is not None:
+        records = {name: bundle.raw(name) for name in bundle.names()}
+    records[secret_name] = encrypt_bundle_record(secret_name, secret_value, get_encryption_key())
+    
+    write_bundle(path, records)
+    try:
+        os.remove(os.path.join(directory, f"{secret_name}.secret.json"))
+    except FileNotFoundError:
+        pass
+    return path
+
+
+def remove_bundle_secret(secret_name: str, directory: str = DEFAULT_SECRETS_DIR) -> bool:
+    """Drop one secret from the bundle, if it is there; returns whether it was"""
+    bundle = open_bundle(directory)
+    if bundle is None or secret_name not in bundle:
+        return False
+    records = {name: bundle.raw(name) for name in bundle.names() if name != secret_name}
+    write_bundle(bundle.path, records)
+    return True
+
+
+def compact_bundle(directory: str = DEFAULT_SECRETS_DIR) -> str:
+    """Rebuild the bundle from every secret in the directory, re-encrypting each with a fresh nonce
+    
+    Legacy secrets.json / *.secret.json files are folded into the bundle, so this
+    also migrates a directory to the bundle format. Each secret is read on its
+    own; if any of them can't be, ValueError is raised and the bundle is left as it was.
+    """
+    key = get_encryption_key()
+    secrets = {}
+    failed = {}
+    # The existing bundle's names first, so a bad legacy file can never cost a bundle-only secret
+    bundle = open_bundle(directory)
+    names = bundle.names() if bundle is not None else []
+    names += [name for name in list_secret_names(directory) if name not in names]
+    for name in names:
+        try:
+            source = find_secret_source(name, directory)
+            if source is None:
+                raise FileNotFoundError("referenced but not found")
+            secrets[name] = decrypt_secret_source(name, source)
+        except Exception as e:
+            failed[name] = e
+    
+    if failed:
+        details = "; ".join(f"{name}: {error}" for name, error in sorted(failed.items()))
+        raise ValueError(f"Not compacting: {len(failed)} secrets could not be read ({details})")
+    
+    path = os.path.join(directory, BUNDLE_FILENAME)
+    write_bundle(path, {name: encrypt_bundle_record(name, value, key) for name, value in secrets.items()})
+    logger.info(f"Compacted {len(secrets)} secrets into {path}")
+    return path
+
+
+def list_secret_names(directory: str = DEFAULT_SECRETS_DIR) -> List[str]:
+    """Names of all secrets in a directory, without decrypting anything"""
+    names = set()
+    if not os.path.exists(directory):
+        return []
+    
+    index_path = os.path.join(directory, "secrets.json")
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as f:
+            names.update(json.load(f))
+    
+    for file in os.listdir(directory):
+        if file.endswith(".secret.json") and not file.startswith("_"):
+            names.add(file.rsplit(".", 2)[0])
+    
+    bundle = open_bundle(directory)
+    if bundle is not None:
+        names.update(bundle.names())
+    
+    return sorted(names)
+
+
+def _read_secrets_index(directory: str) -> Dict[str, str]:
+    index_path = os.path.join(directory, "secrets.json")
+    try:
+        with open(index_path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def find_secret_source(name: str, directory: str = DEFAULT_SECRETS_DIR) -> Optional[tuple]:
+    """Locate a single secret without decrypting anything
+    
+    Returns a fingerprint that changes whenever the secret's ciphertext changes:
+    ('bundle', path, nonce) for bundle records or ('file', path, inode, size, mtime_ns)
+    for encrypted files. Precedence matches load_secrets_from_directory: the
+    bundle, then <name>.secret.json, then the secrets.json index.
+    """
+    bundle = open_bundle(directory)
+    if bundle is not None and name in bundle:
+        nonce, _record = bundle.raw(name)
+        return ('bundle', bundle.path, nonce)
+    
+    candidates = [f"{name}.secret.json"]
+    filename = _read_secrets_index(directory).get(name)
+    if filename:
+        candidates.append(filename)
+    
+    for filename in candidates:
+        path = os.path.join(directory, filename)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        return ('file', path) + _file_identity(stat)
+    return None
+
+
+def decrypt_secret_source(name: str, source: tuple) -> str:
+    """Decrypt the secret a fingerprint from find_secret_source points to"""
+    key = get_encryption_key()
+    if source[0] == 'bundle':
+        return open_bundle(os.path.dirname(source[1])).get(name, key)
+    with open(source[1], 'r') as f:
+        return decrypt_secret(json.load(f), key)
+
+
 def get_secret(name: str, default: str = "") -> str:
-    """Get a secret from the secrets store"""
-    global _secrets_store
+    """Get a secret, decrypting only this one secret on a miss or after it changed"""
+    generation = _secrets_store.generation()
+    cached = _secrets_store.lookup(name)
     
-    if not _secrets_store:
-        _secrets_store = load_secrets_from_directory()
+    if cached is not None:
+        value, fingerprint, checked_generation = cached
+        if checked_generation == generation:
+            return default if value is None else value
+        # The directory changed since this entry was checked; only redo the work if this secret changed
+        source = find_secret_source(name, _secrets_store.directory)
+        if source == fingerprint:
+            _secrets_store.revalidated(name, generation)
+            return default if value is None else value
+    else:
+        source = find_secret_source(name, _secrets_store.directory)
     
-    return _secrets_store.get(name, default)
+    value = None
+    if source is not None:
+        try:
+            value = decrypt_secret_source(name, source)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Error loading secret '{name}': {e}")
+            return default
+    
+    _secrets_store.store(name, value, source, generation)
+    return default if value is None else value
 
 
-def run_application(app_path: str, args: List[str] = None) -> None:
-    """Run the target application with secrets available"""
-    if not os.path.exists(app_path):
-        logger.error(f"Application {app_path} not found")
-        sys.exit(1)
+def invalidate_secrets(name: Optional[str] = None) -> None:
+    """Forget cached secrets (e.g. after rotation) so they are decrypted again on next access"""
+    _secrets_store.invalidate(name)
+
+
+def benchmark(directory: str = DEFAULT_SECRETS_DIR, iterations: int = 100) -> Dict[str, float]:
+    """Measure cold versus warm cost of key derivation and get_secret, in milliseconds"""
+    def timed(func) -> float:
+        start = time.perf_counter()
+        func()
+        return (time.perf_counter() - start) * 1000
     
-    logger.info(f"Running application: {app_path}")
+    def average(func) -> float:
+        return sum(timed(func) for _ in range(iterations)) / iterations
     
-    # Prepare environment with secrets available in memory
-    env = os.environ.copy()
+    names = list_secret_names(directory)
+    name = names[0] if names else "missing"
+    _secrets_store.configure(directory)
     
-    # Make secrets available to the app via an import hook
-    # In real production code, you'd use a more robust method
-    module_code = """
-import builtins
-import os
+    derive_key.cache_clear()
+    results = {'key_derivation_cold_ms': timed(get_encryption_key),
+               'key_derivation_warm_ms': average(get_encryption_key)}
+    
+    derive_key.cache_clear()
+    invalidate_secrets()
+    results['get_secret_cold_ms'] = timed(lambda: get_secret(name))
+    results['get_secret_warm_ms'] = average(lambda: get_secret(name))
+    
+    invalidate_secrets()
+    results['get_secret_missing_cold_ms'] = timed(lambda: get_secret("__missing__"))
+    results['get_secret_missing_warm_ms'] = average(lambda: get_secret("__missing__"))
+    return results
 
-# Store original import
-original_import = builtins.__import__
 
-def get_secret(name, default=""):
-    from secrets_manager import get_secret as get_secret_impl
-    return get_secret_impl(name, default)
+def preload_secrets(directory: str = DEFAULT_SECRETS_DIR) -> Dict[str, str]:
+    """Decrypt every secret in the directory once, through the shared cache"""
+    _secrets_store.configure(directory)
+    secrets = {}
+    for name in list_secret_names(directory):
+        value = get_secret(name, None)
+        if value is not None:
+            secrets[name] = value
+    return secrets
 
-# Make get_secret available to the application
-builtins.get_secret = get_secret
 
-# Continue with normal imports
-builtins.__import__ = original_import
-"""
+def run_in_process(app_path: str, args: List[str] = None, lookup=None) -> None:
+    """Run a Python application in this interpreter with get_secret() available as a builtin
     
-    with open("_secrets_hook.py", "w") as f:
-        f.write(module_code)
+    lookup is the function the application's get_secret() calls; by default the
+    cached get_secret of this module, which already holds the decrypted secrets.
+    """
+    import builtins
+    import runpy
     
-    # Run the application with the secrets hook
-    cmd = [sys.executable, "-m", "_secrets_hook", app_path]
-    if args:
-        cmd.extend(args)
+    builtins.get_secret = lookup or get_secret
+    sys.argv = [app_path] + list(args or [])
+    sys.path.insert(0, os.path.dirname(os.path.abspath(app_path)))
+    try:
+        runpy.run_path(app_path, run_name="__main__")
+    finally:
+        del builtins.get_secret
+
+
+def _write_secrets_fd(secrets: Dict[str, str]) -> int:
+    """Put secrets in an anonymous memfd (Linux) and return a read-only descriptor to it
+    
+    The memfd lives only in memory and is sealed against further writes. Where
+    memfd_create is unavailable, a pipe is used instead; its data is consumed by
+    the first reader, and it is written from a thread since a payload larger than
+    the pipe buffer only fits once the child is reading.
+    """
+    payload = json.dumps(secrets).encode()
+    if hasattr(os, "memfd_create"):
+        fd = os.memfd_create("secrets", os.MFD_CLOEXEC | os.MFD_ALLOW_SEALING)
+        os.write(fd, payload)
+        try:
+            import fcntl
+            fcntl.fcntl(fd, fcntl.F_ADD_SEALS, fcntl.F_SEAL_WRITE | fcntl.F_SEAL_GROW | fcntl.F_SEAL_SHRINK | fcntl.F_SEAL_SEAL)
+        except (ImportError, AttributeError, OSError):
+            pass
+        return fd
+    
+    read_fd, write_fd = os.pipe()
+    
+    def feed():
+        try:
+            with os.fdopen(write_fd, 'wb') as pipe:
+                pipe.write(payload)
+        except BrokenPipeError:
+            logger.warning("Application exited before reading its secrets")
+    
+    threading.Thread(target=feed, name="secrets-pipe", daemon=True).start()
+    return read_fd
+
+
+def _read_secrets_fd(fd: int) -> Dict[str, str]:
+    """Read secrets handed over by the fork server and close the descriptor"""
+    chunks = []
+    try:
+        os.lseek(fd, 0, os.SEEK_SET)
+    except OSError:
+        pass  # pipes are not seekable
+    while True:
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+    os.close(fd)
+    return json.loads(b"".join(chunks))
+
+
+def run_fork_server(app_path: str, args: List[str] = None, directory: str = DEFAULT_SECRETS_DIR,
+                    restart: bool = False) -> int:
+    """Keep decrypted secrets in this process and start the application as a child process
+    
+    The child is a fresh interpreter that receives the secrets over an inherited
+    memfd or pipe, so it never derives the key or decrypts anything itself; the
+    master key is removed from its environment. With restart=True, a crashed
+    child is started again from the same secrets.
+    """
+    secrets = preload_secrets(directory)
+    logger.info(f"Fork server holding {len(secrets)} secrets")
+    env = {name: value for name, value in os.environ.items() if name != SECRET_KEY_ENV_VAR}
+    
+    while True:
+        fd = _write_secrets_fd(secrets)
+        cmd = [sys.executable, os.path.abspath(__file__), "_exec", "--secrets-fd", str(fd), app_path] + list(args or [])
+        try:
+            process = subprocess.Popen(cmd, pass_fds=[fd], env=env)
+        finally:
+            os.close(fd)
+        
+        try:
+            returncode = process.wait()
+        except KeyboardInterrupt:
+            logger.info("Application terminated by user")
+            process.terminate()
+            return process.wait()
+        
+        if returncode == 0 or not restart:
+            return returncode
+        logger.warning(f"Application exited with code {returncode}, restarting")
+        time.sleep(1)
+
+
+def run_application(app_path: str, args: List[str] = None, directory: str = DEFAULT_SECRETS_DIR,
+                    mode: str = "inprocess", restart: bool = False) -> None:
+    """Run the target application with secrets available"""
+    if not os.path.exists(app_path):
+        logger.error(f"Application {app_path} not found")
+        sys.exit(1)
+    
+    logger.info(f"Running application: {app_path} ({mode})")
     
     try:
-        process = subprocess.Popen(cmd)
-        process.wait()
+        if mode == "forkserver":
+            sys.exit(run_fork_server(app_path, args, directory, restart))
+        
+        # Decrypt up front so the application's first requests don't pay for it
+        preload_secrets(directory)
+        run_in_process(app_path, args)
     except KeyboardInterrupt:
         logger.info("Application terminated by user")
-    finally:
-        # Clean up
-        if os.path.exists("_secrets_hook.py"):
-            try:
-                os.remove("_secrets_hook.py")
-            except:
-                pass
 
 
 def main():
@@ -224,6 +732,7 @@ def main():
     create_parser.add_argument("name", help="Name of the secret")
     create_parser.add_argument("--value", help="Value of the secret (if not provided, will prompt)")
     create_parser.add_argument("--directory", default=DEFAULT_SECRETS_DIR, help="Secrets directory")
+    create_parser.add_argument("--bundle", action="store_true", help=f"Store the secret in {BUNDLE_FILENAME}")
     
     # List secrets command
     list_parser = subparsers.add_parser("list", help="List available secrets")
@@ -239,6 +748,25 @@ def main():
     run_parser.add_argument("application", help="Path to the application to run")
     run_parser.add_argument("args", nargs="*", help="Arguments to pass to the application")
     run_parser.add_argument("--directory", default=DEFAULT_SECRETS_DIR, help="Secrets directory")
+    run_parser.add_argument("--mode", choices=["inprocess", "forkserver"], default="inprocess",
+                            help="Run the application in this interpreter, or as a child process "
+                                 "that receives the secrets over a memfd/pipe")
+    run_parser.add_argument("--restart", action="store_true", help="Restart the application if it crashes (forkserver mode)")
+    
+    # Internal: child side of the fork server
+    exec_parser = subparsers.add_parser("_exec")
+    exec_parser.add_argument("--secrets-fd", type=int, required=True)
+    exec_parser.add_argument("application")
+    exec_parser.add_argument("args", nargs=argparse.REMAINDER)
+    
+    # Compact bundle command
+    compact_parser = subparsers.add_parser("compact", help=f"Rebuild {BUNDLE_FILENAME} from all secrets in the directory")
+    compact_parser.add_argument("--directory", default=DEFAULT_SECRETS_DIR, help="Secrets directory")
+    
+    # Benchmark command
+    bench_parser = subparsers.add_parser("benchmark", help="Measure cold and warm secret access cost")
+    bench_parser.add_argument("--directory", default=DEFAULT_SECRETS_DIR, help="Secrets directory")
+    bench_parser.add_argument("--iterations", type=int, default=100, help="Iterations for warm measurements")
     
     args = parser.parse_args()
     
@@ -247,19 +775,31 @@ def main():
         if not value:
             value = getpass.getpass(f"Enter value for secret '{args.name}': ")
         
-        create_encrypted_secret_file(args.name, value, args.directory)
+        if args.bundle:
+            put_bundle_secret(args.name, value, args.directory)
+        else:
+            create_encrypted_secret_file(args.name, value, args.directory)
+            # The bundle takes precedence, so an older copy there would hide the new file
+            if remove_bundle_secret(args.name, args.directory):
+                logger.info(f"Removed the previous value of '{args.name}' from {BUNDLE_FILENAME}")
         logger.info(f"Secret '{args.name}' created successfully")
         
     elif args.command == "list":
-        secrets = load_secrets_from_directory(args.directory)
-        if secrets:
+        names = list_secret_names(args.directory)
+        if names:
             print("Available secrets:")
-            for name in secrets.keys():
+            for name in names:
                 print(f"  - {name}")
         else:
             print("No secrets found")
             
     elif args.command == "get":
+        bundle = open_bundle(args.directory)
+        if bundle is not None and args.name in bundle:
+            # Only the requested record is decrypted
+            print(bundle.get(args.name, get_encryption_key()))
+            return
+        
         secrets = load_secrets_from_directory(args.directory)
         if args.name in secrets:
             print(secrets[args.name])
@@ -268,12 +808,24 @@ def main():
             sys.exit(1)
             
     elif args.command == "run":
-        # Load secrets from directory
-        global _secrets_store
-        _secrets_store = load_secrets_from_directory(args.directory)
+        run_application(args.application, args.args, args.directory, args.mode, args.restart)
+        
+    elif args.command == "_exec":
+        secrets = _read_secrets_fd(args.secrets_fd)
+        run_in_process(args.application, args.args,
+                       lookup=lambda name, default="": secrets.get(name, default))
+        
+    elif args.command == "compact":
+        try:
+            compact_bundle(args.directory)
+        except ValueError as e:
+            logger.error(str(e))
+            sys.exit(1)
         
-        # Run the application
-        run_application(args.application, args.args)
+    elif args.command == "benchmark":
+        results = benchmark(args.directory, args.iterations)
+        for label, value in results.items():
+            print(f"{label:<26} {value:10.4f}")
         
     else:
         parser.print_help()
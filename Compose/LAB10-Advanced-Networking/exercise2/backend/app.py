@@ -3,6 +3,7 @@ import socket
 from flask import Flask, jsonify
 import pymongo
 from pymongo.errors import ConnectionFailure
+from netprobe import NetworkProbe
 
 app = Flask(__name__)
 
@@ -11,6 +12,11 @@ mongo_host = os.environ.get('MONGO_HOST', 'db')
 mongo_port = int(os.environ.get('MONGO_PORT', 27017))
 mongo_db = os.environ.get('MONGO_DB', 'networkdemo')
 
+# Connectivity checks for /network-info, run in the background
+network_probe = NetworkProbe()
+network_probe.add_dns('frontend', 'frontend')
+network_probe.add_dns('db', mongo_host)
+
 # Sample data to return when DB is not available
 sample_data = [
     "Item 1 (Sample data - DB not connected)",
@@ -88,61 +94,33 @@ def health():
 
 @app.route('/network-info')
 def network_info():
-    hostname = socket.gethostname()
-    container_ip = socket.gethostbyname(hostname)
-    
-    # Check connectivity to other services
-    frontend_reachable = False
-    frontend_ip = "Unknown"
-    db_reachable = False
-    db_ip = "Unknown"
-    
-    try:
-        frontend_ip = socket.gethostbyname('frontend')
-        frontend_reachable = True
-    except socket.gaierror:
-        pass
-    
-    try:
-        db_ip = socket.gethostbyname(mongo_host)
-        
-        # More detailed check for DB
-        if db_connected:
-            db_reachable = True
-        else:
-            # We can resolve but not connect
-            db_reachable = False
-    except socket.gaierror:
-        pass
-    
-    # Get all network interfaces
-    import netifaces
-    interfaces = {}
-    for iface in netifaces.interfaces():
-        addrs = netifaces.ifaddresses(iface)
-        if netifaces.AF_INET in addrs:
-            interfaces[iface] = addrs[netifaces.AF_INET][0]['addr']
+    # Connectivity is checked in the background; this returns the latest results
+    snapshot = network_probe.snapshot()
+    frontend = snapshot['probes']['frontend']
+    db = snapshot['probes']['db']
     
     return jsonify({
         "container": {
             "service": "backend",
-            "hostname": hostname,
-            "ip": container_ip,
-            "interfaces": interfaces
+            "hostname": snapshot['hostname'],
+            "ip": snapshot['ip'],
+            "interfaces": snapshot['interfaces']
         },
         "connections": {
             "frontend": {
                 "hostname": "frontend",
-                "ip": frontend_ip,
-                "reachable": frontend_reachable
+                "ip": frontend.get('ip', "Unknown"),
+                "reachable": frontend['status'] == 'resolved'
             },
             "db": {
                 "hostname": mongo_host,
-                "ip": db_ip,
-                "reachable": db_reachable,
+                "ip": db.get('ip', "Unknown"),
+                # We may resolve the db but still not be connected to it
+                "reachable": db['status'] == 'resolved' and db_connected,
                 "connected": db_connected
             }
-        }
+        },
+        "snapshot_age": snapshot['age']
     })
 
 if __name__ == '__main__':
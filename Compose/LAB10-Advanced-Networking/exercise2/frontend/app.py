@@ -2,6 +2,7 @@ import os
 import socket
 import requests
 from flask import Flask, render_template, jsonify
+from netprobe import NetworkProbe
 
 app = Flask(__name__)
 
@@ -10,6 +11,11 @@ backend_host = os.environ.get('BACKEND_HOST', 'backend')
 backend_port = os.environ.get('BACKEND_PORT', '8000')
 backend_url = f"http://{backend_host}:{backend_port}"
 
+# Connectivity checks for /network-info, run in the background
+network_probe = NetworkProbe()
+network_probe.add_http('backend', backend_host, backend_port)
+network_probe.add_dns('db', 'db')
+
 @app.route('/')
 def index():
     # Get network information
@@ -60,57 +66,32 @@ def index():
 
 @app.route('/network-info')
 def network_info():
-    hostname = socket.gethostname()
-    container_ip = socket.gethostbyname(hostname)
-    
-    # Test connectivity to backend
-    backend_reachable = False
-    backend_ip = "Unknown"
-    
-    try:
-        backend_ip = socket.gethostbyname(backend_host)
-        response = requests.get(f"{backend_url}/health", timeout=1)
-        backend_reachable = response.status_code == 200
-    except (socket.gaierror, requests.RequestException):
-        pass
-    
-    # Test connectivity to db (should fail with network isolation)
-    db_reachable = False
-    db_ip = "Unknown"
-    
-    try:
-        db_ip = socket.gethostbyname('db')
-        db_reachable = True  # If we can resolve, we consider it reachable
-    except socket.gaierror:
-        pass
-    
-    # Get all network interfaces
-    import netifaces
-    interfaces = {}
-    for iface in netifaces.interfaces():
-        addrs = netifaces.ifaddresses(iface)
-        if netifaces.AF_INET in addrs:
-            interfaces[iface] = addrs[netifaces.AF_INET][0]['addr']
+    # Connectivity is checked in the background; this returns the latest results
+    snapshot = network_probe.snapshot()
+    backend = snapshot['probes']['backend']
+    db = snapshot['probes']['db']
     
     return jsonify({
         "container": {
             "service": "frontend",
-            "hostname": hostname,
-            "ip": container_ip,
-            "interfaces": interfaces
+            "hostname": snapshot['hostname'],
+            "ip": snapshot['ip'],
+            "interfaces": snapshot['interfaces']
         },
         "connections": {
             "backend": {
                 "hostname": backend_host,
-                "ip": backend_ip,
-                "reachable": backend_reachable
+                "ip": backend.get('ip', "Unknown"),
+                "reachable": backend['status'] == 'connected'
             },
             "db": {
                 "hostname": "db",
-                "ip": db_ip,
-                "reachable": db_reachable
+                "ip": db.get('ip', "Unknown"),
+                # If we can resolve, we consider it reachable (should fail with network isolation)
+                "reachable": db['status'] == 'resolved'
             }
-        }
+        },
+        "snapshot_age": snapshot['age']
     })
 
 if __name__ == '__main__':
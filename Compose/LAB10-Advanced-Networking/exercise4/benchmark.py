@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for the API gateway.
+
+Sends requests through the gateway from a number of concurrent client threads,
+each with its own keep-alive connection, and reports requests/sec and latency
+percentiles. Run it before and after a gateway change with the same settings:
+
+    python benchmark.py --url http://localhost:8080 --path /products --concurrency 20 --duration 15
+    python benchmark.py --path /users --label pooled --json >> results.jsonl
+
+Only the standard library is used, so it runs anywhere Python 3 is installed.
+"""
+
+import argparse
+import http.client
+import json
+import statistics
+import sys
+import threading
+import time
+import urllib.parse
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def client(url, method, path, body, headers, deadline, timeout, latencies, errors, lock):
+    parsed = urllib.parse.urlsplit(url)
+    connection_class = http.client.HTTPSConnection if parsed.scheme == 'https' else http.client.HTTPConnection
+    connection = None
+    local_latencies, local_errors = [], {}
+
+    while time.monotonic() < deadline:
+        if connection is None:
+            connection = connection_class(parsed.hostname, parsed.port, timeout=timeout)
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                local_errors[str(response.status)] = local_errors.get(str(response.status), 0) + 1
+            else:
+                local_latencies.append((time.perf_counter() - started) * 1000)
+            if response.getheader('Connection', '').lower() == 'close':
+                connection.close()
+                connection = None
+        except (OSError, http.client.HTTPException) as e:
+            local_errors[type(e).__name__] = local_errors.get(type(e).__name__, 0) + 1
+            connection.close()
+            connection = None
+
+    if connection is not None:
+        connection.close()
+    with lock:
+        latencies.extend(local_latencies)
+        for key, count in local_errors.items():
+            errors[key] = errors.get(key, 0) + count
+
+
+def run(args):
+    body = args.body.encode() if args.body else None
+    headers = {'Content-Type': 'application/json'} if body else {}
+    latencies, errors, lock = [], {}, threading.Lock()
+
+    started = time.monotonic()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=client, args=(args.url, args.method, args.path, body, headers,
+                                                     deadline, args.timeout, latencies, errors, lock))
+               for _ in range(args.concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        'label': args.label,
+        'url': args.url + args.path,
+        'method': args.method,
+        'concurrency': args.concurrency,
+        'duration_s': round(elapsed, 2),
+        'requests': len(latencies),
+        'errors': errors,
+        'requests_per_sec': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 2) if latencies else None,
+            'p50': round(percentile(latencies, 50), 2) if latencies else None,
+            'p90': round(percentile(latencies, 90), 2) if latencies else None,
+            'p99': round(percentile(latencies, 99), 2) if latencies else None
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark requests/sec through the API gateway')
+    parser.add_argument('--url', default='http://localhost:8080', help='Gateway base URL')
+    parser.add_argument('--path', default='/products', help='Path to request')
+    parser.add_argument('--method', default='GET', help='HTTP method')
+    parser.add_argument('--body', help='JSON request body')
+    parser.add_argument('--concurrency', type=int, default=20, help='Number of concurrent clients')
+    parser.add_argument('--duration', type=float, default=15, help='Seconds to run')
+    parser.add_argument('--timeout', type=float, default=10, help='Per-request timeout in seconds')
+    parser.add_argument('--label', default='', help='Label stored with the result, e.g. "before"')
+    parser.add_argument('--json', action='store_true', help='Print the result as one JSON line')
+    args = parser.parse_args()
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result))
+        return
+
+    latency = result['latency_ms']
+    print(f"{result['label'] or 'run'}: {result['method']} {result['url']} with {result['concurrency']} clients")
+    print(f"  {result['requests']} requests in {result['duration_s']} s = {result['requests_per_sec']} req/s, "
+          f"errors: {result['errors'] or 'none'}")
+    print(f"  latency ms: mean {latency['mean']}  p50 {latency['p50']}  p90 {latency['p90']}  p99 {latency['p99']}")
+    if result['errors']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,16 @@
 import os
 import socket
 import requests
+import urllib3
 from flask import Flask, request, jsonify, Response, stream_with_context
 
+from upstream import Upstream, PROXY_METHODS, forwardable_headers, read_timeout
+from resilience import Rejected
+from netprobe import NetworkProbe
+from response_cache import (
+    CACHEABLE_STATUSES, GATEWAY_CACHE_ENABLED, ResponseCache, SingleFlight, parse_cache_control
+)
+
 app = Flask(__name__)
 
 # Service configurations
@@ -14,6 +22,25 @@ products_service_host = os.environ.get('PRODUCTS_SERVICE_HOST', 'products-servic
 products_service_port = os.environ.get('PRODUCTS_SERVICE_PORT', '8000')
 products_service_url = f"http://{products_service_host}:{products_service_port}"
 
+# One pooled, keep-alive client per backend, balancing across its replicas
+users_upstream = Upstream('users-service', users_service_host, users_service_port)
+products_upstream = Upstream('products-service', products_service_host, products_service_port)
+
+# Connectivity checks for /network-info, run in the background
+network_probe = NetworkProbe()
+network_probe.add_http('users_service', users_service_host, users_service_port)
+network_probe.add_http('products_service', products_service_host, products_service_port)
+
+# Failures to get a response from a backend; Rejected means it was refused up front
+UPSTREAM_ERRORS = (requests.RequestException, Rejected)
+
+# Size of the chunks streamed back to the client
+PROXY_CHUNK_SIZE = 64 * 1024
+
+# Cache for GET responses from rarely-changing backends (see response_cache.py)
+response_cache = ResponseCache() if GATEWAY_CACHE_ENABLED else None
+response_flights = SingleFlight()
+
 @app.route('/')
 def index():
     hostname = socket.gethostname()
@@ -34,115 +61,228 @@ def index():
             {
                 "path": "/network-info",
                 "description": "Network information"
+            },
+            {
+                "path": "/cache",
+                "description": "Response cache statistics"
+            },
+            {
+                "path": "/upstreams",
+                "description": "Backend replicas, circuit breakers and concurrency limits"
             }
         ]
     })
 
-@app.route('/users', defaults={'path': ''})
-@app.route('/users/<path:path>')
+@app.route('/users', defaults={'path': ''}, methods=PROXY_METHODS)
+@app.route('/users/<path:path>', methods=PROXY_METHODS)
 def proxy_users(path):
     """Proxy requests to the users service"""
-    return proxy_request(f"{users_service_url}/{path}", request)
+    return proxy_request(users_upstream, f"users/{path}".rstrip('/'), request)
 
-@app.route('/products', defaults={'path': ''})
-@app.route('/products/<path:path>')
+@app.route('/products', defaults={'path': ''}, methods=PROXY_METHODS)
+@app.route('/products/<path:path>', methods=PROXY_METHODS)
 def proxy_products(path):
     """Proxy requests to the products service"""
-    return proxy_request(f"{products_service_url}/{path}", request)
+    return proxy_request(products_upstream, f"products/{path}".rstrip('/'), request)
 
-def proxy_request(url, req):
+def proxy_request(upstream, path, req):
     """Forward requests to the appropriate service"""
-    # Copy request headers
-    headers = {key: value for (key, value) in req.headers if key != 'Host'}
-    
-    # Determine request method and parameters
-    if req.method == 'GET':
-        resp = requests.get(url, headers=headers, params=req.args, stream=True)
-    elif req.method == 'POST':
-        resp = requests.post(url, headers=headers, json=req.get_json(), stream=True)
-    elif req.method == 'PUT':
-        resp = requests.put(url, headers=headers, json=req.get_json(), stream=True)
-    elif req.method == 'DELETE':
-        resp = requests.delete(url, headers=headers, stream=True)
+    headers = forward_headers(req)
+    full_path = '/' + path
+    
+    if response_cache is not None and response_cache.is_cacheable_request(req.method, full_path, req.headers):
+        return cached_proxy_request(upstream, path, req, headers)
+    
+    # Forward the raw body, whatever its content type
+    if req.content_length:
+        body = req.get_data()
+    elif req.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+        body = iter(lambda: req.stream.read(PROXY_CHUNK_SIZE), b'')
     else:
-        return jsonify({"error": "Method not supported"}), 405
+        body = None
     
-    # Stream response from service
-    response = Response(stream_with_context(resp.iter_content(chunk_size=1024)),
-                       content_type=resp.headers.get('content-type', 'application/json'))
+    try:
+        resp = upstream.request(req.method, path, params=req.query_string or None, headers=headers, data=body,
+                                timeout=read_timeout(req.method, path))
+    except UPSTREAM_ERRORS as e:
+        return upstream_error(upstream, e)
+    
+    # A successful write makes cached reads of the same collection stale
+    if response_cache is not None and req.method in ('POST', 'PUT', 'PATCH', 'DELETE') and resp.status_code < 400:
+        response_cache.invalidate(full_path)
+    
+    return stream_response(resp, req.method)
+
+def forward_headers(req):
+    """Copy request headers; requests sets Host and Content-Length itself"""
+    headers = forwardable_headers(req.headers, exclude=('Host', 'Content-Length'))
+    headers['X-Forwarded-For'] = ', '.join(filter(None, [req.headers.get('X-Forwarded-For'), req.remote_addr]))
+    headers['X-Forwarded-Host'] = req.host
+    headers['X-Forwarded-Proto'] = req.scheme
+    return headers
+
+def upstream_error(upstream, e):
+    if isinstance(e, Rejected):
+        # Fail fast rather than queue behind a failing or overloaded backend
+        response = jsonify({"error": f"{upstream.name} unavailable", "details": str(e)})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+    if isinstance(e, requests.Timeout):
+        return jsonify({"error": f"{upstream.name} timed out", "details": str(e)}), 504
+    return jsonify({"error": f"{upstream.name} unavailable", "details": str(e)}), 502
+
+def stream_response(resp, method):
+    """Stream a backend response to the client"""
+    def generate():
+        # Pass the body through as-is (still compressed, if it was), then return the connection to the pool
+        try:
+            for chunk in resp.raw.stream(PROXY_CHUNK_SIZE, decode_content=False):
+                yield chunk
+        finally:
+            resp.close()
+    
+    body = None if method == 'HEAD' else stream_with_context(generate())
+    response = Response(body, status=resp.status_code)
     
     # Copy response headers
-    for key, value in resp.headers.items():
-        if key.lower() not in ('content-encoding', 'transfer-encoding', 'content-length'):
-            response.headers[key] = value
-            
+    # (the gateway's own server sets Server and Date)
+    for key, value in forwardable_headers(resp.headers, exclude=('Server', 'Date')).items():
+        response.headers[key] = value
+    if method == 'HEAD':
+        resp.close()
+    else:
+        # Also release the backend if the body is never streamed (e.g. the client went away first)
+        response.call_on_close(resp.close)
+    
     # Add gateway info to headers
     response.headers['X-Gateway'] = socket.gethostname()
     
-    return response, resp.status_code
+    return response
 
-@app.route('/network-info')
-def network_info():
-    """Get network information about the gateway and services"""
-    hostname = socket.gethostname()
-    container_ip = socket.gethostbyname(hostname)
+def cached_proxy_request(upstream, path, req, headers):
+    """Serve a GET/HEAD from the response cache, going to the backend at most once per key at a time"""
+    key = response_cache.key('/' + path, req.query_string)
+    client_no_cache = 'no-cache' in parse_cache_control(req.headers.get('Cache-Control'))
+    entry = response_cache.lookup(key)
+    
+    if entry is not None and entry.is_fresh() and not client_no_cache:
+        response_cache.count('hit')
+        return cached_response(entry, 'HIT', req)
+    
+    try:
+        result, shared = response_flights.do(key, lambda: fetch_for_cache(upstream, path, req, headers, key, entry))
+    except UPSTREAM_ERRORS as e:
+        if entry is not None:
+            # Better a stale answer than none while the backend is down
+            response_cache.count('stale')
+            return cached_response(entry, 'STALE', req)
+        return upstream_error(upstream, e)
+    
+    if shared:
+        response_cache.count('coalesced')
+        if result['entry'] is None:
+            # The leader's response couldn't be shared; fetch our own
+            return proxy_uncached(upstream, path, req, headers)
+        return cached_response(result['entry'], 'HIT', req)
+    if result['response'] is not None:
+        return result['response']
+    return cached_response(result['entry'], result['cache_status'], req)
+
+def fetch_for_cache(upstream, path, req, headers, key, stale_entry):
+    """Fetch from the backend; returns a shareable cache entry, or a streamed response for the caller only"""
+    headers = {name: value for name, value in headers.items()
+               if name.lower() not in ('if-none-match', 'if-modified-since', 'cache-control', 'pragma')}
+    if stale_entry is not None:
+        headers.update(stale_entry.validators)
+    # Taken before the fetch, so a write that lands meanwhile keeps this response out of the cache
+    generation = response_cache.generation(key)
     
-    # Check connectivity to services
-    users_status = check_service_connectivity(users_service_host, users_service_port)
-    products_status = check_service_connectivity(products_service_host, products_service_port)
+    resp = upstream.request('GET', path, params=req.query_string or None, headers=headers)
+    if resp.status_code == 304 and stale_entry is not None:
+        resp.close()
+        return {'entry': response_cache.refreshed(key, stale_entry, resp.headers.items(), generation),
+                'cache_status': 'REVALIDATED', 'response': None}
     
-    # Get all network interfaces
-    import netifaces
-    interfaces = {}
-    for iface in netifaces.interfaces():
-        addrs = netifaces.ifaddresses(iface)
-        if netifaces.AF_INET in addrs:
-            interfaces[iface] = addrs[netifaces.AF_INET][0]['addr']
+    length = resp.headers.get('Content-Length')
+    if resp.status_code in CACHEABLE_STATUSES and length is not None and length.isdigit() and int(length) <= response_cache.max_body:
+        try:
+            body = resp.raw.read(decode_content=False)
+        except urllib3.exceptions.ReadTimeoutError as e:
+            # The backend stalled or went away mid-body; fail like a request that never got an answer
+            raise requests.ReadTimeout(e)
+        except urllib3.exceptions.HTTPError as e:
+            raise requests.ConnectionError(e)
+        finally:
+            resp.close()
+        entry = response_cache.build_entry(resp.status_code, list(resp.headers.items()), body)
+        if entry is not None:
+            response_cache.store(key, entry, generation)
+            response_cache.count('miss')
+            return {'entry': entry, 'cache_status': 'MISS', 'response': None}
+        # Not storable (e.g. Cache-Control: private): answer this caller only
+        response = Response(b'' if req.method == 'HEAD' else body, status=resp.status_code)
+        for name, value in forwardable_headers(resp.headers, exclude=('Server', 'Date')).items():
+            response.headers[name] = value
+        response.headers['X-Cache'] = 'BYPASS'
+        response.headers['X-Gateway'] = socket.gethostname()
+        return {'entry': None, 'cache_status': 'BYPASS', 'response': response}
+    
+    response = stream_response(resp, req.method)
+    response.headers['X-Cache'] = 'BYPASS'
+    return {'entry': None, 'cache_status': 'BYPASS', 'response': response}
+
+def proxy_uncached(upstream, path, req, headers):
+    try:
+        resp = upstream.request(req.method, path, params=req.query_string or None, headers=headers)
+    except UPSTREAM_ERRORS as e:
+        return upstream_error(upstream, e)
+    response = stream_response(resp, req.method)
+    response.headers['X-Cache'] = 'BYPASS'
+    return response
+
+def cached_response(entry, cache_status, req):
+    """Build a response from a cache entry, answering 304 if the client already has it"""
+    if response_cache.not_modified(entry, req.headers.get('If-None-Match')):
+        response = Response(status=304)
+        for name, value in response_cache.response_headers(entry, cache_status):
+            if name.lower() in ('etag', 'cache-control', 'age', 'x-cache', 'last-modified'):
+                response.headers[name] = value
+    else:
+        response = Response(b'' if req.method == 'HEAD' else entry.body, status=entry.status)
+        for name, value in response_cache.response_headers(entry, cache_status):
+            response.headers[name] = value
+    response.headers['X-Gateway'] = socket.gethostname()
+    return response
+
+@app.route('/cache', methods=['GET'])
+def cache_info():
+    """Response cache statistics"""
+    if response_cache is None:
+        return jsonify({"enabled": False})
+    return jsonify(dict(response_cache.info(), enabled=True))
+
+@app.route('/upstreams', methods=['GET'])
+def upstreams_info():
+    """Backend replicas, their health and load, and each backend's circuit breaker and concurrency limit"""
+    return jsonify({upstream.name: upstream.describe() for upstream in (users_upstream, products_upstream)})
+
+@app.route('/network-info')
+def network_info():
+    """Get network information about the gateway and services (refreshed in the background)"""
+    snapshot = network_probe.snapshot()
     
     return jsonify({
         "service": "gateway",
-        "hostname": hostname,
-        "ip": container_ip,
-        "interfaces": interfaces,
+        "hostname": snapshot['hostname'],
+        "ip": snapshot['ip'],
+        "interfaces": snapshot['interfaces'],
         "connectivity": {
-            "users_service": users_status,
-            "products_service": products_status
-        }
+            "users_service": snapshot['probes']['users_service'],
+            "products_service": snapshot['probes']['products_service']
+        },
+        "snapshot_age": snapshot['age']
     })
 
-def check_service_connectivity(host, port):
-    """Check if a service is reachable"""
-    try:
-        # Try to resolve hostname
-        ip = socket.gethostbyname(host)
-        
-        # Try to connect to service
-        try:
-            response = requests.get(f"http://{host}:{port}/health", timeout=1)
-            if response.status_code == 200:
-                return {
-                    "status": "connected",
-                    "ip": ip,
-                    "details": response.json()
-                }
-            else:
-                return {
-                    "status": "error",
-                    "ip": ip,
-                    "error": f"HTTP {response.status_code}"
-                }
-        except requests.RequestException as e:
-            return {
-                "status": "unreachable",
-                "ip": ip,
-                "error": str(e)
-            }
-    except socket.gaierror:
-        return {
-            "status": "dns_error",
-            "error": f"Cannot resolve hostname: {host}"
-        }
-
 @app.route('/health')
 def health():
     hostname = socket.gethostname()
@@ -0,0 +1,516 @@
+"""
+Asynchronous (ASGI) implementation of the API gateway.
+
+Serves the same routes as app.py, but on an event loop: request and response
+bodies are streamed in both directions in large chunks without being buffered
+or decoded, and a slow backend only holds a coroutine instead of a worker
+thread, so one process can keep thousands of requests in flight. Requests are
+balanced across backend replicas and guarded by circuit breakers and
+concurrency limits the same way (see balancer.py and resilience.py).
+
+Run with:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+or start the gateway container with GATEWAY_SERVER=asgi.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from contextlib import asynccontextmanager
+
+import anyio
+import httpx
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from balancer import (
+    IDEMPOTENT_METHODS, RETRYABLE_STATUSES, UPSTREAM_HEALTH_INTERVAL, UPSTREAM_HEALTH_TIMEOUT, ReplicaPool,
+    attempts_allowed
+)
+from netprobe import NetworkProbe
+from resilience import Rejected, UpstreamGuard
+from response_cache import CACHEABLE_STATUSES, GATEWAY_CACHE_ENABLED, ResponseCache, parse_cache_control
+from upstream import (
+    PROXY_METHODS, UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_MAX_CONNECTIONS, UPSTREAM_POOL_SIZE,
+    UPSTREAM_READ_TIMEOUT, forwardable_headers, read_timeout
+)
+
+logger = logging.getLogger(__name__)
+
+# Service configurations
+users_service_host = os.environ.get('USERS_SERVICE_HOST', 'users-service')
+users_service_port = os.environ.get('USERS_SERVICE_PORT', '8000')
+users_service_url = f"http://{users_service_host}:{users_service_port}"
+
+products_service_host = os.environ.get('PRODUCTS_SERVICE_HOST', 'products-service')
+products_service_port = os.environ.get('PRODUCTS_SERVICE_PORT', '8000')
+products_service_url = f"http://{products_service_host}:{products_service_port}"
+
+# Size of the chunks streamed in each direction
+PROXY_CHUNK_SIZE = 64 * 1024
+
+# Cache for GET responses from rarely-changing backends (see response_cache.py)
+response_cache = ResponseCache() if GATEWAY_CACHE_ENABLED else None
+# key -> future for the backend fetch in flight, so concurrent misses share one request
+cache_flights = {}
+
+
+def create_client(base_url):
+    """One async client per backend; a request waits for a free connection rather than failing"""
+    return httpx.AsyncClient(
+        base_url=base_url,
+        limits=httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS, max_keepalive_connections=UPSTREAM_POOL_SIZE),
+        timeout=httpx.Timeout(connect=UPSTREAM_CONNECT_TIMEOUT, read=UPSTREAM_READ_TIMEOUT,
+                              write=UPSTREAM_READ_TIMEOUT, pool=UPSTREAM_READ_TIMEOUT),
+        follow_redirects=False
+    )
+
+
+upstreams = {}
+# Replicas of each backend, resolved from DNS and health-checked in the background
+pools = {
+    'users-service': ReplicaPool('users-service', users_service_host, users_service_port),
+    'products-service': ReplicaPool('products-service', products_service_host, products_service_port)
+}
+# Circuit breaker and concurrency limit per backend
+guards = {name: UpstreamGuard(name) for name in pools}
+# Connectivity checks for /network-info, run in a background thread
+network_probe = NetworkProbe()
+network_probe.add_http('users_service', users_service_host, users_service_port)
+network_probe.add_http('products_service', products_service_host, products_service_port)
+# Failures to get a response from a backend; Rejected means it was refused up front
+UPSTREAM_ERRORS = (httpx.TransportError, Rejected)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    upstreams['users-service'] = create_client(users_service_url)
+    upstreams['products-service'] = create_client(products_service_url)
+    health_task = asyncio.create_task(health_loop())
+    await run_in_threadpool(network_probe.start)
+    try:
+        yield
+    finally:
+        health_task.cancel()
+        await asyncio.gather(*(client.aclose() for client in upstreams.values()))
+        upstreams.clear()
+
+
+async def health_loop():
+    """Re-resolve each backend and check its replicas' /health endpoints"""
+    while True:
+        for name, result in zip(pools, await asyncio.gather(*(check_replicas(name) for name in pools),
+                                                            return_exceptions=True)):
+            if isinstance(result, Exception):
+                logger.error(f"{name}: health check failed: {result}")
+        await asyncio.sleep(UPSTREAM_HEALTH_INTERVAL)
+
+
+async def check_replicas(name):
+    pool = pools[name]
+    if pool.needs_resolve():
+        await run_in_threadpool(pool.resolve)
+
+    async def check(replica):
+        try:
+            response = await upstreams[name].get(f"{replica.url}/health", headers={'Host': pool.host_header},
+                                                 timeout=UPSTREAM_HEALTH_TIMEOUT)
+            healthy = response.status_code == 200
+        except httpx.HTTPError:
+            healthy = False
+        pool.set_health(replica, healthy)
+
+    await asyncio.gather(*(check(replica) for replica in pool.replicas()))
+
+
+async def send_upstream(name, method, path, params=None, headers=None, content=None, timeout=None):
+    """Send a request to the backend and return the streamed response.
+
+    Raises resilience.Rejected without contacting the backend while its
+    circuit is open or its concurrency limit is reached. timeout overrides
+    the read timeout for this request.
+    """
+    guard = guards[name]
+    ticket = guard.admit()
+    started = time.monotonic()
+    try:
+        upstream = await send_to_replicas(name, method, path, params, headers, content, timeout)
+    except httpx.TransportError:
+        guard.finish(ticket, False, time.monotonic() - started)
+        raise
+    except BaseException:
+        guard.cancel(ticket)
+        raise
+    # A request given a longer timeout is expected to be slow; that isn't held against the backend
+    latency = time.monotonic() - started if timeout is None else 0.0
+    on_close(upstream, lambda: guard.finish(ticket, upstream.status_code not in RETRYABLE_STATUSES, latency))
+    return upstream
+
+
+async def send_to_replicas(name, method, path, params, headers, content, timeout=None):
+    """Send to one replica after another until one answers.
+
+    Connection errors, timeouts and 502/503/504 answers count against the
+    replica; idempotent requests with a replayable body are then retried on
+    another replica.
+    """
+    pool, client = pools[name], upstreams[name]
+    if not pool.replicas():
+        await run_in_threadpool(pool.resolve)
+
+    headers = dict(headers or {}, Host=pool.host_header)
+    attempts = attempts_allowed(method, content is None or isinstance(content, bytes))
+    if timeout is not None:
+        timeout = httpx.Timeout(connect=UPSTREAM_CONNECT_TIMEOUT, read=timeout, write=timeout, pool=UPSTREAM_READ_TIMEOUT)
+    else:
+        timeout = httpx.USE_CLIENT_DEFAULT
+    tried = []
+    while True:
+        replica = pool.choose(exclude=tried)
+        if replica is None:
+            raise httpx.ConnectError(f"No replicas of {pool.host} available")
+        tried.append(replica)
+        last_attempt = len(tried) >= attempts or len(tried) >= len(pool.replicas())
+
+        pool.acquire(replica)
+        try:
+            upstream = await client.send(
+                client.build_request(method, f"{replica.url}/{path}", params=params, headers=headers, content=content,
+                                     timeout=timeout),
+                stream=True
+            )
+        except httpx.TransportError:
+            pool.release(replica, False)
+            if last_attempt:
+                raise
+            continue
+        except BaseException:
+            pool.release(replica, None)
+            raise
+
+        failed = upstream.status_code in RETRYABLE_STATUSES
+        if failed and not last_attempt:
+            await upstream.aclose()
+            pool.release(replica, False)
+            continue
+        # The replica counts the request as outstanding until its body has been streamed
+        on_close(upstream, lambda: pool.release(replica, not failed))
+        return upstream
+
+
+def on_close(upstream, callback):
+    """Call callback once, when the response is closed"""
+    aclose = upstream.aclose
+    called = False
+
+    async def aclose_and_call():
+        nonlocal called
+        try:
+            await aclose()
+        finally:
+            if not called:
+                called = True
+                callback()
+
+    upstream.aclose = aclose_and_call
+
+
+async def index(request):
+    hostname = socket.gethostname()
+    return JSONResponse({
+        "service": "API Gateway",
+        "hostname": hostname,
+        "endpoints": [
+            {
+                "path": "/users",
+                "description": "User service endpoints",
+                "service": users_service_url
+            },
+            {
+                "path": "/products",
+                "description": "Product service endpoints",
+                "service": products_service_url
+            },
+            {
+                "path": "/network-info",
+                "description": "Network information"
+            },
+            {
+                "path": "/cache",
+                "description": "Response cache statistics"
+            },
+            {
+                "path": "/upstreams",
+                "description": "Backend replicas, circuit breakers and concurrency limits"
+            }
+        ]
+    })
+
+
+async def proxy_users(request):
+    """Proxy requests to the users service"""
+    path = request.path_params.get('path', '')
+    return await proxy_request('users-service', f"users/{path}".rstrip('/'), request)
+
+
+async def proxy_products(request):
+    """Proxy requests to the products service"""
+    path = request.path_params.get('path', '')
+    return await proxy_request('products-service', f"products/{path}".rstrip('/'), request)
+
+
+async def proxy_request(name, path, request):
+    """Forward a request to a backend, streaming both bodies"""
+    headers = forward_headers(request)
+    full_path = '/' + path
+
+    if response_cache is not None and response_cache.is_cacheable_request(request.method, full_path, request.headers):
+        return await cached_proxy_request(name, path, request, headers)
+
+    content = None
+    length = request.headers.get('content-length', '')
+    if request.method in IDEMPOTENT_METHODS and length.isdigit() and int(length) <= PROXY_CHUNK_SIZE:
+        # Small enough to buffer, so the request can be retried on another replica
+        content = await request.body()
+    elif length or 'transfer-encoding' in request.headers:
+        content = request.stream()
+
+    try:
+        upstream = await send_upstream(name, request.method, path, params=request.url.query or None,
+                                       headers=headers, content=content, timeout=read_timeout(request.method, path))
+    except UPSTREAM_ERRORS as e:
+        return upstream_error(name, e)
+
+    # A successful write makes cached reads of the same collection stale
+    if response_cache is not None and request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and upstream.status_code < 400:
+        await cache_call(response_cache.invalidate, full_path)
+
+    return await stream_response(upstream, request.method)
+
+
+def forward_headers(request):
+    """Host is set by httpx; Content-Length is kept so fixed-size bodies aren't sent chunked"""
+    headers = forwardable_headers(request.headers, exclude=('Host',))
+    client_ip = request.client.host if request.client else ''
+    headers['X-Forwarded-For'] = ', '.join(filter(None, [request.headers.get('X-Forwarded-For'), client_ip]))
+    headers['X-Forwarded-Host'] = request.headers.get('Host', '')
+    headers['X-Forwarded-Proto'] = request.url.scheme
+    return headers
+
+
+def upstream_error(name, e):
+    if isinstance(e, Rejected):
+        # Fail fast rather than queue behind a failing or overloaded backend
+        return JSONResponse({"error": f"{name} unavailable", "details": str(e)}, status_code=503,
+                            headers={'Retry-After': str(e.retry_after)})
+    if isinstance(e, httpx.TimeoutException):
+        return JSONResponse({"error": f"{name} timed out", "details": str(e)}, status_code=504)
+    return JSONResponse({"error": f"{name} unavailable", "details": str(e)}, status_code=502)
+
+
+def response_headers(upstream, extra=()):
+    # Copy response headers (the gateway's own server sets Server and Date)
+    headers = forwardable_headers(upstream.headers, exclude=('Server', 'Date'))
+    headers.update(extra)
+    # Add gateway info to headers
+    headers['X-Gateway'] = socket.gethostname()
+    return headers
+
+
+async def stream_response(upstream, method, extra_headers=()):
+    """Stream a backend response to the client"""
+    headers = response_headers(upstream, extra_headers)
+
+    if method == 'HEAD':
+        await upstream.aclose()
+        return Response(status_code=upstream.status_code, headers=headers)
+
+    # Pass the body through as-is (still compressed, if it was), then release the connection.
+    # Starlette skips background tasks when the body fails, so the task is only a backstop
+    return StreamingResponse(
+        stream_body(upstream),
+        status_code=upstream.status_code,
+        headers=headers,
+        background=BackgroundTask(upstream.aclose)
+    )
+
+
+async def stream_body(upstream):
+    """Yield the raw body, releasing the connection however streaming ends (done, failed or cancelled)"""
+    try:
+        async for chunk in upstream.aiter_raw(PROXY_CHUNK_SIZE):
+            yield chunk
+    finally:
+        with anyio.CancelScope(shield=True):
+            await upstream.aclose()
+
+
+async def cache_call(fn, *args):
+    """Memory-only cache calls are cheap; calls that may reach Redis run off the event loop"""
+    if response_cache.remote is None:
+        return fn(*args)
+    return await run_in_threadpool(fn, *args)
+
+
+async def cached_proxy_request(name, path, request, headers):
+    """Serve a GET/HEAD from the response cache, going to the backend at most once per key at a time"""
+    key = response_cache.key('/' + path, request.url.query)
+    client_no_cache = 'no-cache' in parse_cache_control(request.headers.get('Cache-Control'))
+    entry = await cache_call(response_cache.lookup, key)
+
+    if entry is not None and entry.is_fresh() and not client_no_cache:
+        response_cache.count('hit')
+        return cached_response(entry, 'HIT', request)
+
+    flight = cache_flights.get(key)
+    leader = flight is None
+    if leader:
+        flight = cache_flights[key] = asyncio.get_running_loop().create_future()
+        try:
+            flight.set_result(await fetch_for_cache(name, path, request, headers, key, entry))
+        except asyncio.CancelledError:
+            flight.cancel()
+            raise
+        except Exception as e:
+            flight.set_exception(e)
+            flight.exception()  # mark as retrieved when nobody is waiting
+        finally:
+            del cache_flights[key]
+
+    try:
+        result = await asyncio.shield(flight)
+    except asyncio.CancelledError:
+        if not flight.cancelled():
+            raise
+        # The leader's client went away; fetch our own
+        return await proxy_uncached(name, path, request, headers)
+    except UPSTREAM_ERRORS as e:
+        if entry is not None:
+            # Better a stale answer than none while the backend is down
+            response_cache.count('stale')
+            return cached_response(entry, 'STALE', request)
+        return upstream_error(name, e)
+
+    if not leader:
+        response_cache.count('coalesced')
+        if result['entry'] is None:
+            # The leader's response couldn't be shared; fetch our own
+            return await proxy_uncached(name, path, request, headers)
+        return cached_response(result['entry'], 'HIT', request)
+    if result['response'] is not None:
+        return result['response']
+    return cached_response(result['entry'], result['cache_status'], request)
+
+
+async def fetch_for_cache(name, path, request, headers, key, stale_entry):
+    """Fetch from the backend; returns a shareable cache entry, or a streamed response for the caller only"""
+    headers = {header: value for header, value in headers.items()
+               if header.lower() not in ('if-none-match', 'if-modified-since', 'cache-control', 'pragma', 'content-length')}
+    if stale_entry is not None:
+        headers.update(stale_entry.validators)
+    # Taken before the fetch, so a write that lands meanwhile keeps this response out of the cache
+    generation = await cache_call(response_cache.generation, key)
+
+    upstream = await send_upstream(name, 'GET', path, params=request.url.query or None, headers=headers)
+    if upstream.status_code == 304 and stale_entry is not None:
+        await upstream.aclose()
+        entry = await cache_call(response_cache.refreshed, key, stale_entry, list(upstream.headers.items()), generation)
+        return {'entry': entry, 'cache_status': 'REVALIDATED', 'response': None}
+
+    length = upstream.headers.get('Content-Length')
+    if upstream.status_code in CACHEABLE_STATUSES and length is not None and length.isdigit() and int(length) <= response_cache.max_body:
+        try:
+            body = b''.join([chunk async for chunk in upstream.aiter_raw()])
+        finally:
+            await upstream.aclose()
+        entry = response_cache.build_entry(upstream.status_code, list(upstream.headers.items()), body)
+        if entry is not None:
+            await cache_call(response_cache.store, key, entry, generation)
+            response_cache.count('miss')
+            return {'entry': entry, 'cache_status': 'MISS', 'response': None}
+        # Not storable (e.g. Cache-Control: private): answer this caller only
+        response = Response(b'' if request.method == 'HEAD' else body, status_code=upstream.status_code,
+                            headers=response_headers(upstream, {'X-Cache': 'BYPASS'}))
+        return {'entry': None, 'cache_status': 'BYPASS', 'response': response}
+
+    response = await stream_response(upstream, request.method, {'X-Cache': 'BYPASS'})
+    return {'entry': None, 'cache_status': 'BYPASS', 'response': response}
+
+
+async def proxy_uncached(name, path, request, headers):
+    try:
+        upstream = await send_upstream(name, request.method, path, params=request.url.query or None,
+                                       headers=headers)
+    except UPSTREAM_ERRORS as e:
+        return upstream_error(name, e)
+    return await stream_response(upstream, request.method, {'X-Cache': 'BYPASS'})
+
+
+def cached_response(entry, cache_status, request):
+    """Build a response from a cache entry, answering 304 if the client already has it"""
+    headers = dict(response_cache.response_headers(entry, cache_status))
+    headers['X-Gateway'] = socket.gethostname()
+    if response_cache.not_modified(entry, request.headers.get('If-None-Match')):
+        kept = {name: value for name, value in headers.items()
+                if name.lower() in ('etag', 'cache-control', 'age', 'x-cache', 'last-modified', 'x-gateway')}
+        return Response(status_code=304, headers=kept)
+    return Response(b'' if request.method == 'HEAD' else entry.body, status_code=entry.status, headers=headers)
+
+
+async def cache_info(request):
+    """Response cache statistics"""
+    if response_cache is None:
+        return JSONResponse({"enabled": False})
+    return JSONResponse(dict(response_cache.info(), enabled=True))
+
+
+async def upstreams_info(request):
+    """Backend replicas, their health and load, and each backend's circuit breaker and concurrency limit"""
+    return JSONResponse({name: dict(pool.describe(), **guards[name].describe()) for name, pool in pools.items()})
+
+
+async def network_info(request):
+    """Get network information about the gateway and services (refreshed in the background)"""
+    snapshot = network_probe.snapshot()
+
+    return JSONResponse({
+        "service": "gateway",
+        "hostname": snapshot['hostname'],
+        "ip": snapshot['ip'],
+        "interfaces": snapshot['interfaces'],
+        "connectivity": {
+            "users_service": snapshot['probes']['users_service'],
+            "products_service": snapshot['probes']['products_service']
+        },
+        "snapshot_age": snapshot['age']
+    })
+
+
+async def health(request):
+    hostname = socket.gethostname()
+    return JSONResponse({
+        "status": "healthy",
+        "service": "gateway",
+        "hostname": hostname
+    })
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/users', proxy_users, methods=PROXY_METHODS),
+        Route('/users/{path:path}', proxy_users, methods=PROXY_METHODS),
+        Route('/products', proxy_products, methods=PROXY_METHODS),
+        Route('/products/{path:path}', proxy_products, methods=PROXY_METHODS),
+        Route('/network-info', network_info),
+        Route('/cache', cache_info),
+        Route('/upstreams', upstreams_info),
+        Route('/health', health)
+    ],
+    lifespan=lifespan
+)
@@ -0,0 +1,176 @@
+"""
+Health-aware load balancing across the replicas of a backend service.
+
+When a service is scaled (docker compose up --scale products-service=3),
+Docker's DNS returns one A record per container. ReplicaPool resolves all of
+them and re-resolves periodically, so replicas that are added or removed are
+picked up without restarting the gateway.
+
+- Each request goes to the less loaded of two randomly chosen replicas
+  ("power of two choices" on outstanding requests)
+- Active health checks mark a replica down when its /health endpoint fails,
+  and up again when it recovers
+- Passive detection ejects a replica after UPSTREAM_EJECT_AFTER consecutive
+  failures (connection errors, timeouts, 502/503/504); the ejection time
+  doubles each time it happens again, up to UPSTREAM_MAX_EJECT_TIME
+- If every replica is down, all of them are tried anyway rather than failing
+  every request outright
+
+The pool only keeps state; the gateway does the HTTP calls, re-resolves and
+runs the health checks in the background, and reports outcomes with
+acquire()/release() and set_health().
+"""
+
+import logging
+import os
+import random
+import socket
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_DNS_REFRESH = float(os.environ.get('UPSTREAM_DNS_REFRESH', 10))
+UPSTREAM_HEALTH_INTERVAL = float(os.environ.get('UPSTREAM_HEALTH_INTERVAL', 5))
+UPSTREAM_HEALTH_TIMEOUT = float(os.environ.get('UPSTREAM_HEALTH_TIMEOUT', 1))
+UPSTREAM_EJECT_AFTER = int(os.environ.get('UPSTREAM_EJECT_AFTER', 3))
+UPSTREAM_EJECT_TIME = float(os.environ.get('UPSTREAM_EJECT_TIME', 10))
+UPSTREAM_MAX_EJECT_TIME = float(os.environ.get('UPSTREAM_MAX_EJECT_TIME', 120))
+# Extra attempts on other replicas for idempotent requests
+UPSTREAM_RETRIES = int(os.environ.get('UPSTREAM_RETRIES', 2))
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+# Responses that mean "this replica can't serve requests right now"
+RETRYABLE_STATUSES = {502, 503, 504}
+
+
+class Replica:
+    def __init__(self, address, port):
+        self.address = address
+        self.port = port
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def url(self):
+        return f"http://{self.address}:{self.port}"
+
+    def available(self, now):
+        return self.healthy and now >= self.ejected_until
+
+    def describe(self, now):
+        return {
+            'address': f"{self.address}:{self.port}",
+            'healthy': self.healthy,
+            'ejected_for': round(max(0.0, self.ejected_until - now), 1),
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures
+        }
+
+
+class ReplicaPool:
+    def __init__(self, name, host, port, dns_refresh=UPSTREAM_DNS_REFRESH):
+        self.name = name
+        self.host = host
+        self.port = int(port)
+        # Requests go to replica IPs, but the backend should still see its service name
+        self.host_header = f"{host}:{port}"
+        self.dns_refresh = dns_refresh
+        self._replicas = {}          # address -> Replica
+        self._lock = threading.Lock()
+        self._resolved_at = 0.0
+
+    def resolve(self):
+        """Look up every A record for the service and update the replica set"""
+        try:
+            infos = socket.getaddrinfo(self.host, self.port, socket.AF_INET, socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            logger.warning(f"Cannot resolve {self.host}: {e}; keeping {len(self._replicas)} known replicas")
+            return
+        addresses = {info[4][0] for info in infos}
+
+        with self._lock:
+            for address in addresses - set(self._replicas):
+                self._replicas[address] = Replica(address, self.port)
+                logger.info(f"{self.name}: added replica {address}")
+            for address in set(self._replicas) - addresses:
+                del self._replicas[address]
+                logger.info(f"{self.name}: removed replica {address}")
+            self._resolved_at = time.monotonic()
+
+    def needs_resolve(self):
+        return not self._replicas or time.monotonic() - self._resolved_at >= self.dns_refresh
+
+    def replicas(self):
+        with self._lock:
+            return list(self._replicas.values())
+
+    def choose(self, exclude=()):
+        """Pick a replica: the less loaded of two random available ones, or None"""
+        now = time.monotonic()
+        with self._lock:
+            candidates = [replica for replica in self._replicas.values() if replica not in exclude]
+            available = [replica for replica in candidates if replica.available(now)]
+            # Panic mode: with nothing available, trying a replica beats failing outright
+            pool = available or candidates
+            if not pool:
+                return None
+            if len(pool) == 1:
+                return pool[0]
+            first, second = random.sample(pool, 2)
+            return first if first.outstanding <= second.outstanding else second
+
+    def acquire(self, replica):
+        with self._lock:
+            replica.outstanding += 1
+            replica.requests += 1
+
+    def release(self, replica, success):
+        """Record the outcome of a request; repeated failures eject the replica for a while.
+
+        success=None (e.g. the client went away) only releases the slot.
+        """
+        with self._lock:
+            replica.outstanding -= 1
+            if success is None:
+                return
+            if success:
+                replica.consecutive_failures = 0
+                replica.ejections = 0
+                return
+            replica.failures += 1
+            replica.consecutive_failures += 1
+            if replica.consecutive_failures >= UPSTREAM_EJECT_AFTER:
+                eject_for = min(UPSTREAM_EJECT_TIME * (2 ** replica.ejections), UPSTREAM_MAX_EJECT_TIME)
+                replica.ejections += 1
+                replica.consecutive_failures = 0
+                replica.ejected_until = time.monotonic() + eject_for
+                logger.warning(f"{self.name}: ejected replica {replica.address} for {eject_for:.0f}s")
+
+    def set_health(self, replica, healthy):
+        with self._lock:
+            if replica.healthy != healthy:
+                logger.warning(f"{self.name}: replica {replica.address} is {'healthy' if healthy else 'unhealthy'}")
+            replica.healthy = healthy
+
+    def describe(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'host': self.host,
+                'port': self.port,
+                'replicas': [replica.describe(now) for replica in self._replicas.values()]
+            }
+
+
+def attempts_allowed(method, replayable_body):
+    """How many replicas a request may be tried on; only idempotent requests are retried"""
+    if method in IDEMPOTENT_METHODS and replayable_body:
+        return 1 + UPSTREAM_RETRIES
+    return 1
@@ -0,0 +1,204 @@
+"""
+Circuit breaker and adaptive concurrency limit for each backend service.
+
+A slow backend (e.g. products-service waiting on a slow MongoDB) would
+otherwise have requests pile up in the gateway until every worker is stuck
+waiting on it. Instead, requests to that backend are refused straight away
+with 503 and a Retry-After header, and the other backends keep working.
+
+Circuit breaker:
+- Closed: outcomes are counted over the last UPSTREAM_BREAKER_WINDOW seconds.
+  Once there are UPSTREAM_BREAKER_MIN_REQUESTS calls, the breaker opens if
+  the share of failures (connection errors, timeouts, 502/503/504) or of slow
+  calls (slower than UPSTREAM_BREAKER_SLOW_CALL) reaches its threshold
+- Open: every request is refused for UPSTREAM_BREAKER_OPEN_TIME seconds
+- Half-open: a few probe requests are let through; if they all succeed the
+  breaker closes, if one fails it opens again. Only the probes count: a
+  request admitted before the breaker opened doesn't decide whether it closes
+
+Concurrency limit (AIMD): at most `limit` requests are in flight to a backend.
+The limit grows by one while responses are fast and the limit is actually
+being used, and shrinks by UPSTREAM_LIMIT_BACKOFF whenever a response is slow
+or fails, so it settles around what the backend can handle right now.
+"""
+
+import collections
+import math
+import os
+import threading
+import time
+
+UPSTREAM_BREAKER_WINDOW = int(os.environ.get('UPSTREAM_BREAKER_WINDOW', 10))
+UPSTREAM_BREAKER_MIN_REQUESTS = int(os.environ.get('UPSTREAM_BREAKER_MIN_REQUESTS', 20))
+UPSTREAM_BREAKER_FAILURE_RATE = float(os.environ.get('UPSTREAM_BREAKER_FAILURE_RATE', 0.5))
+UPSTREAM_BREAKER_SLOW_CALL = float(os.environ.get('UPSTREAM_BREAKER_SLOW_CALL', 2))
+UPSTREAM_BREAKER_SLOW_RATE = float(os.environ.get('UPSTREAM_BREAKER_SLOW_RATE', 0.5))
+UPSTREAM_BREAKER_OPEN_TIME = float(os.environ.get('UPSTREAM_BREAKER_OPEN_TIME', 10))
+UPSTREAM_BREAKER_PROBES = int(os.environ.get('UPSTREAM_BREAKER_PROBES', 3))
+
+UPSTREAM_LIMIT_INITIAL = int(os.environ.get('UPSTREAM_LIMIT_INITIAL', 20))
+UPSTREAM_LIMIT_MIN = int(os.environ.get('UPSTREAM_LIMIT_MIN', 1))
+UPSTREAM_LIMIT_MAX = int(os.environ.get('UPSTREAM_LIMIT_MAX', 1000))
+UPSTREAM_LIMIT_LATENCY = float(os.environ.get('UPSTREAM_LIMIT_LATENCY', 1))
+UPSTREAM_LIMIT_BACKOFF = float(os.environ.get('UPSTREAM_LIMIT_BACKOFF', 0.9))
+
+
+class Rejected(Exception):
+    """The request was refused without contacting the backend"""
+
+    def __init__(self, name, reason, retry_after):
+        super().__init__(f"{name}: {reason}")
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name):
+        self.name = name
+        self.state = self.CLOSED
+        self._opened_at = 0.0
+        # Bumped every time the breaker opens, so probes from an earlier half-open period are told apart
+        self._cycle = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        # One bucket per second: [second, calls, failures, slow calls]
+        self._buckets = collections.deque()
+        self._lock = threading.Lock()
+
+    def before_request(self):
+        """Raise Rejected, or return a probe token (None for an ordinary request) for record() or cancel()"""
+        with self._lock:
+            if self.state == self.OPEN:
+                remaining = self._opened_at + UPSTREAM_BREAKER_OPEN_TIME - time.monotonic()
+                if remaining > 0:
+                    raise Rejected(self.name, 'circuit open', remaining)
+                self.state = self.HALF_OPEN
+                self._probes_in_flight = 0
+                self._probe_successes = 0
+            if self.state == self.HALF_OPEN:
+                if self._probes_in_flight + self._probe_successes >= UPSTREAM_BREAKER_PROBES:
+                    raise Rejected(self.name, 'circuit half-open', 1)
+                self._probes_in_flight += 1
+                return self._cycle
+            return None
+
+    def record(self, probe, success, latency):
+        slow = latency >= UPSTREAM_BREAKER_SLOW_CALL
+        with self._lock:
+            if probe is not None:
+                if not self._is_current_probe(probe):
+                    return
+                self._probes_in_flight -= 1
+                if not success or slow:
+                    self._open()
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= UPSTREAM_BREAKER_PROBES:
+                        self.state = self.CLOSED
+                        self._buckets.clear()
+                return
+            if self.state != self.CLOSED:
+                # Admitted before the breaker opened; the window it belonged to is gone
+                return
+
+            calls, failures, slow_calls = self._add(not success, slow)
+            if calls >= UPSTREAM_BREAKER_MIN_REQUESTS and (
+                    failures / calls >= UPSTREAM_BREAKER_FAILURE_RATE or
+                    slow_calls / calls >= UPSTREAM_BREAKER_SLOW_RATE):
+                self._open()
+
+    def cancel(self, probe):
+        """The request never reached the backend; give back its half-open probe slot"""
+        with self._lock:
+            if probe is not None and self._is_current_probe(probe):
+                self._probes_in_flight -= 1
+
+    def _is_current_probe(self, probe):
+        return self.state == self.HALF_OPEN and probe == self._cycle
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._cycle += 1
+        self._buckets.clear()
+
+    def _add(self, failed, slow):
+        """Count one call and return the totals over the window"""
+        now = int(time.monotonic())
+        while self._buckets and self._buckets[0][0] <= now - UPSTREAM_BREAKER_WINDOW:
+            self._buckets.popleft()
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0, 0])
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        bucket[2] += failed
+        bucket[3] += slow
+        return tuple(sum(b[i] for b in self._buckets) for i in (1, 2, 3))
+
+    def describe(self):
+        with self._lock:
+            calls, failures, slow_calls = (sum(b[i] for b in self._buckets) for i in (1, 2, 3))
+            return {'state': self.state, 'calls': calls, 'failures': failures, 'slow_calls': slow_calls}
+
+
+class ConcurrencyLimiter:
+    def __init__(self, name):
+        self.name = name
+        self.limit = float(UPSTREAM_LIMIT_INITIAL)
+        self.in_flight = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                self.rejected += 1
+                raise Rejected(self.name, f"concurrency limit ({int(self.limit)}) reached", 1)
+            self.in_flight += 1
+
+    def release(self, success, latency):
+        """success=None (the request never completed) only frees the slot"""
+        with self._lock:
+            busy = self.in_flight * 2 >= self.limit
+            self.in_flight -= 1
+            if success is None:
+                return
+            if not success or latency >= UPSTREAM_LIMIT_LATENCY:
+                self.limit = max(UPSTREAM_LIMIT_MIN, self.limit * UPSTREAM_LIMIT_BACKOFF)
+            elif busy:
+                self.limit = min(UPSTREAM_LIMIT_MAX, self.limit + 1)
+
+    def describe(self):
+        with self._lock:
+            return {'limit': int(self.limit), 'in_flight': self.in_flight, 'rejected': self.rejected}
+
+
+class UpstreamGuard:
+    """Admission control for one backend: circuit breaker first, then the concurrency limit"""
+
+    def __init__(self, name):
+        self.breaker = CircuitBreaker(name)
+        self.limiter = ConcurrencyLimiter(name)
+
+    def admit(self):
+        """Raise Rejected, or reserve a slot and return a ticket to give it back with finish() or cancel()"""
+        probe = self.breaker.before_request()
+        try:
+            self.limiter.acquire()
+        except Rejected:
+            self.breaker.cancel(probe)
+            raise
+        return probe
+
+    def finish(self, ticket, success, latency):
+        self.limiter.release(success, latency)
+        self.breaker.record(ticket, success, latency)
+
+    def cancel(self, ticket):
+        self.limiter.release(None, 0)
+        self.breaker.cancel(ticket)
+
+    def describe(self):
+        return {'breaker': self.breaker.describe(), 'concurrency': self.limiter.describe()}
@@ -0,0 +1,450 @@
+"""
+HTTP response cache for the gateway.
+
+Responses to GET requests under the cacheable path prefixes are stored in an
+in-memory LRU and, when GATEWAY_CACHE_REDIS_URL is set, in a shared Redis tier
+that all gateway replicas read from. Entries are keyed on method, path and
+normalised query string.
+
+- Freshness comes from the backend's Cache-Control (s-maxage, max-age,
+  no-cache, no-store, private); responses without one are fresh for
+  GATEWAY_CACHE_DEFAULT_TTL seconds
+- Stale entries are revalidated with If-None-Match / If-Modified-Since when the
+  backend supplied an ETag or Last-Modified, so an unchanged body isn't resent
+- Every cached response carries an ETag (the backend's or a hash of the body),
+  so clients can revalidate against the gateway and get 304 Not Modified
+- Concurrent misses for the same key are coalesced: one request goes to the
+  backend and the others wait for its result (SingleFlight)
+- A successful POST, PUT, PATCH or DELETE invalidates everything cached under
+  the same collection, e.g. POST /products drops /products and
+  /products/category/...; with Redis, the invalidation is published so every
+  gateway replica drops the collection from its memory tier too
+- Each invalidation bumps the collection's generation. Callers take
+  generation(key) before fetching from the backend and pass it to store(), which
+  discards the response if the collection was invalidated in the meantime
+"""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+
+logger = logging.getLogger(__name__)
+
+GATEWAY_CACHE_ENABLED = os.environ.get('GATEWAY_CACHE_ENABLED', 'true').lower() == 'true'
+GATEWAY_CACHE_PATHS = [path.strip() for path in os.environ.get('GATEWAY_CACHE_PATHS', '/products').split(',') if path.strip()]
+GATEWAY_CACHE_DEFAULT_TTL = float(os.environ.get('GATEWAY_CACHE_DEFAULT_TTL', 30))
+GATEWAY_CACHE_MAX_ENTRIES = int(os.environ.get('GATEWAY_CACHE_MAX_ENTRIES', 1000))
+GATEWAY_CACHE_MAX_BODY = int(os.environ.get('GATEWAY_CACHE_MAX_BODY', 1024 * 1024))
+GATEWAY_CACHE_REDIS_URL = os.environ.get('GATEWAY_CACHE_REDIS_URL', '')
+# How long a stale entry is kept around for conditional revalidation
+GATEWAY_CACHE_STALE_TTL = float(os.environ.get('GATEWAY_CACHE_STALE_TTL', 300))
+
+CACHEABLE_STATUSES = {200}
+# Response headers that are specific to one exchange and not stored
+UNCACHED_HEADERS = {'date', 'server', 'age', 'x-cache', 'x-gateway', 'set-cookie'}
+
+
+def parse_cache_control(value):
+    """Parse a Cache-Control header into {directive: value or True}"""
+    directives = {}
+    for part in (value or '').split(','):
+        name, _, argument = part.strip().partition('=')
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else True
+    return directives
+
+
+def normalise_query(query):
+    """Sort query parameters so ?a=1&b=2 and ?b=2&a=1 share a cache entry"""
+    if isinstance(query, bytes):
+        query = query.decode('latin-1')
+    pairs = urllib.parse.parse_qsl(query or '', keep_blank_values=True)
+    return urllib.parse.urlencode(sorted(pairs))
+
+
+def collection_of(path):
+    """The first path segment, e.g. /products for /products/category/Furniture"""
+    return '/' + path.strip('/').split('/', 1)[0]
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    status: int
+    headers: tuple             # ((name, value), ...)
+    body: bytes = field(repr=False)
+    stored_at: float
+    ttl: float
+    etag: str                  # served to clients
+    validators: tuple = ()     # ((header, value), ...) for revalidating with the backend
+
+    def age(self, now=None):
+        return max(0.0, (now or time.time()) - self.stored_at)
+
+    def is_fresh(self, now=None):
+        return self.age(now) < self.ttl
+
+    def to_json(self):
+        data = {key: getattr(self, key) for key in ('status', 'stored_at', 'ttl', 'etag')}
+        data['headers'] = [list(header) for header in self.headers]
+        data['validators'] = [list(validator) for validator in self.validators]
+        data['body'] = base64.b64encode(self.body).decode('ascii')
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw):
+        data = json.loads(raw)
+        return cls(
+            status=data['status'], headers=tuple(tuple(header) for header in data['headers']),
+            body=base64.b64decode(data['body']), stored_at=data['stored_at'], ttl=data['ttl'],
+            etag=data['etag'], validators=tuple(tuple(validator) for validator in data['validators'])
+        )
+
+
+class MemoryStore:
+    """Thread-safe LRU of cache entries, bounded by entry count"""
+
+    def __init__(self, max_entries=GATEWAY_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_collection(self, collection):
+        with self._lock:
+            for key in [key for key in self._entries if key_collection(key) == collection]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisStore:
+    """Shared cache tier; a set per collection records its keys for invalidation.
+
+    Deleting a collection also increments its generation counter and publishes
+    the collection's name, so other replicas can drop their memory copies.
+    """
+
+    def __init__(self, url, prefix='gateway-cache:'):
+        import redis
+        self.url = url
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.prefix = prefix
+        self.channel = prefix + 'invalidations'
+
+    def _generation_key(self, collection):
+        return self.prefix + 'generation:' + collection
+
+    def generation(self, collection):
+        return int(self.client.get(self._generation_key(collection)) or 0)
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return CacheEntry.from_json(raw) if raw else None
+
+    def set(self, key, entry, generation=None):
+        """Store entry, unless its collection's generation is no longer generation; returns whether it was stored"""
+        import redis
+        expire = max(1, int(entry.ttl + GATEWAY_CACHE_STALE_TTL))
+        with self.client.pipeline(transaction=True) as pipe:
+            try:
+                if generation is not None:
+                    generation_key = self._generation_key(key_collection(key))
+                    pipe.watch(generation_key)
+                    if int(pipe.get(generation_key) or 0) != generation:
+                        return False
+                    pipe.multi()
+                pipe.set(self.prefix + key, entry.to_json(), ex=expire)
+                pipe.sadd(self.prefix + 'collection:' + key_collection(key), key)
+                pipe.execute()
+            except redis.WatchError:
+                return False
+        return True
+
+    def delete_collection(self, collection):
+        index = self.prefix + 'collection:' + collection
+        keys = self.client.smembers(index)
+        pipe = self.client.pipeline(transaction=True)
+        if keys:
+            pipe.delete(*[self.prefix + key.decode() for key in keys])
+        pipe.delete(index)
+        pipe.incr(self._generation_key(collection))
+        pipe.publish(self.channel, collection)
+        pipe.execute()
+
+    def subscribe(self, on_invalidate):
+        """Call on_invalidate(collection) from a background thread for every published invalidation.
+
+        on_invalidate(None) is called after every (re)connect, since
+        invalidations may have been missed while disconnected.
+        """
+        import redis
+        # No read timeout: the subscription is idle until something changes
+        client = redis.Redis.from_url(self.url, socket_connect_timeout=0.5, socket_keepalive=True)
+
+        def listen():
+            while True:
+                try:
+                    pubsub = client.pubsub(ignore_subscribe_messages=True)
+                    pubsub.subscribe(self.channel)
+                    on_invalidate(None)
+                    for message in pubsub.listen():
+                        on_invalidate(message['data'].decode())
+                except Exception as e:
+                    logger.warning(f"Redis cache invalidation feed failed: {e}; reconnecting")
+                    time.sleep(1)
+
+        threading.Thread(target=listen, name='cache-invalidations', daemon=True).start()
+
+
+def key_collection(key):
+    return collection_of(key.split(' ', 2)[1])
+
+
+class ResponseCache:
+    def __init__(self, paths=GATEWAY_CACHE_PATHS, default_ttl=GATEWAY_CACHE_DEFAULT_TTL,
+                 max_body=GATEWAY_CACHE_MAX_BODY, redis_url=GATEWAY_CACHE_REDIS_URL):
+        self.paths = paths
+        self.default_ttl = default_ttl
+        self.max_body = max_body
+        self.memory = MemoryStore()
+        # Invalidations seen by this process: per collection, plus an epoch for "everything"
+        self._generations = {}
+        self._epoch = 0
+        self._generation_lock = threading.Lock()
+        self.stats = {'hit': 0, 'miss': 0, 'revalidated': 0, 'stale': 0, 'stored': 0, 'discarded': 0,
+                      'invalidated': 0, 'coalesced': 0, 'remote_errors': 0}
+        self._stats_lock = threading.Lock()
+        self.remote = None
+        if redis_url:
+            try:
+                self.remote = RedisStore(redis_url)
+            except ImportError:
+                logger.warning("GATEWAY_CACHE_REDIS_URL is set but the redis package is not installed; memory cache only")
+            else:
+                self.remote.subscribe(self._invalidate_memory)
+
+    # -- request side -------------------------------------------------------------
+
+    def is_cacheable_request(self, method, path, headers):
+        """Only shared, anonymous GET/HEAD requests under a cacheable prefix are served from the cache"""
+        if method not in ('GET', 'HEAD') or 'authorization' in {name.lower() for name in headers.keys()}:
+            return False
+        return any(path == prefix or path.startswith(prefix.rstrip('/') + '/') for prefix in self.paths)
+
+    @staticmethod
+    def key(path, query):
+        # HEAD is answered from the GET entry
+        return f"GET {path} {normalise_query(query)}"
+
+    def generation(self, key):
+        """Token to take before fetching from the backend and hand to store() afterwards"""
+        collection = key_collection(key)
+        with self._generation_lock:
+            local = (self._epoch, self._generations.get(collection, 0))
+        remote = None
+        if self.remote is not None:
+            try:
+                remote = self.remote.generation(collection)
+            except Exception as e:
+                self.count('remote_errors')
+                logger.warning(f"Redis cache generation lookup failed: {e}")
+        return local, remote
+
+    def _remember(self, key, entry, local_generation):
+        """Put entry in the memory tier unless the collection was invalidated since local_generation"""
+        with self._generation_lock:
+            if local_generation != (self._epoch, self._generations.get(key_collection(key), 0)):
+                return False
+            self.memory.set(key, entry)
+            return True
+
+    def lookup(self, key):
+        entry = self.memory.get(key)
+        if entry is None and self.remote is not None:
+            local_generation, _ = self.generation(key)
+            try:
+                entry = self.remote.get(key)
+            except Exception as e:
+                self.count('remote_errors')
+                logger.warning(f"Redis cache lookup failed: {e}")
+            if entry is not None:
+                self._remember(key, entry, local_generation)
+        if entry is not None and entry.age() > entry.ttl + GATEWAY_CACHE_STALE_TTL:
+            return None
+        return entry
+
+    # -- response side ------------------------------------------------------------
+
+    def build_entry(self, status, headers, body):
+        """Turn a backend response into a CacheEntry, or None if it must not be stored"""
+        if status not in CACHEABLE_STATUSES or len(body) > self.max_body:
+            return None
+        header_map = {name.lower(): value for name, value in headers}
+        if 'set-cookie' in header_map or 'content-encoding' in header_map or 'vary' in header_map:
+            return None
+
+        cache_control = parse_cache_control(header_map.get('cache-control'))
+        if 'no-store' in cache_control or 'private' in cache_control:
+            return None
+        ttl = self.default_ttl
+        for directive in ('s-maxage', 'max-age'):
+            if directive in cache_control:
+                try:
+                    ttl = float(cache_control[directive])
+                except ValueError:
+                    ttl = 0.0
+                break
+        if 'no-cache' in cache_control:
+            ttl = 0.0
+
+        validators = tuple((request_header, header_map[response_header]) for response_header, request_header in
+                           (('etag', 'If-None-Match'), ('last-modified', 'If-Modified-Since'))
+                           if response_header in header_map)
+        etag = header_map.get('etag') or f'W/"{hashlib.sha1(body).hexdigest()}"'
+        stored_headers = tuple((name, value) for name, value in headers if name.lower() not in UNCACHED_HEADERS)
+        return CacheEntry(status, stored_headers, body, time.time(), ttl, etag, validators)
+
+    def store(self, key, entry, generation=None):
+        """Store entry; with the generation() taken before the fetch, skip it if the collection changed since"""
+        local_generation, remote_generation = generation if generation is not None else (None, None)
+        if self.remote is not None:
+            try:
+                if not self.remote.set(key, entry, remote_generation):
+                    self.count('discarded')
+                    return
+            except Exception as e:
+                self.count('remote_errors')
+                logger.warning(f"Redis cache store failed: {e}")
+        if local_generation is None:
+            self.memory.set(key, entry)
+        elif not self._remember(key, entry, local_generation):
+            self.count('discarded')
+            return
+        self.count('stored')
+
+    def refreshed(self, key, entry, headers, generation=None):
+        """Backend answered 304 to a revalidation: the stored body is fresh again"""
+        header_map = {name.lower(): value for name, value in headers}
+        cache_control = parse_cache_control(header_map.get('cache-control'))
+        ttl = entry.ttl
+        for directive in ('s-maxage', 'max-age'):
+            if directive in cache_control:
+                try:
+                    ttl = float(cache_control[directive])
+                except ValueError:
+                    pass
+                break
+        entry = replace(entry, stored_at=time.time(), ttl=ttl)
+        self.store(key, entry, generation)
+        self.count('revalidated')
+        return entry
+
+    def _invalidate_memory(self, collection):
+        """Drop a collection (None: everything) from the memory tier and bump its generation"""
+        with self._generation_lock:
+            if collection is None:
+                self._epoch += 1
+                self.memory.clear()
+            else:
+                self._generations[collection] = self._generations.get(collection, 0) + 1
+                self.memory.delete_collection(collection)
+
+    def invalidate(self, path):
+        """Drop every cached response in the collection that path belongs to, on every replica"""
+        collection = collection_of(path)
+        self._invalidate_memory(collection)
+        if self.remote is not None:
+            try:
+                self.remote.delete_collection(collection)
+            except Exception as e:
+                self.count('remote_errors')
+                logger.warning(f"Redis cache invalidation failed: {e}")
+        self.count('invalidated')
+
+    @staticmethod
+    def not_modified(entry, if_none_match):
+        """True if the client's If-None-Match matches the entry's ETag"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        # Weak comparison (RFC 9110 section 13.1.2)
+        tags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return entry.etag.removeprefix('W/') in tags
+
+    def response_headers(self, entry, status):
+        """Headers to send with a cached response; status is HIT, STALE or REVALIDATED"""
+        headers = [(name, value) for name, value in entry.headers if name.lower() != 'etag']
+        headers.append(('ETag', entry.etag))
+        headers.append(('Age', str(int(entry.age()))))
+        headers.append(('X-Cache', status))
+        return headers
+
+    def count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def info(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {'entries': len(self.memory), 'redis': self.remote is not None, 'paths': self.paths, 'stats': stats}
+
+
+class SingleFlight:
+    """Coalesce concurrent calls for the same key: one caller runs fn, the others wait for its result"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Returns (result, shared); shared is True for callers that waited on another's call"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = {'event': threading.Event(), 'result': None, 'error': None}
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            call['event'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result'], True
+
+        try:
+            call['result'] = fn()
+            return call['result'], False
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['event'].set()
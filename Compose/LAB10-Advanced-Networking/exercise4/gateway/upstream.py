@@ -0,0 +1,207 @@
+"""
+Pooled HTTP clients for the gateway's backend services.
+
+Each backend gets its own requests.Session with a bounded connection pool, so
+proxied requests reuse keep-alive connections instead of opening a new TCP
+connection every time. Connect and read timeouts keep a slow or dead backend
+from holding a gateway worker indefinitely.
+
+Requests are spread over all replicas of the service (see balancer.py), and
+idempotent requests that fail on one replica are retried on another. A
+circuit breaker and a concurrency limit (see resilience.py) refuse requests
+up front while the backend is failing or overloaded.
+"""
+
+import logging
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from balancer import (
+    RETRYABLE_STATUSES, UPSTREAM_HEALTH_INTERVAL, UPSTREAM_HEALTH_TIMEOUT, ReplicaPool, attempts_allowed
+)
+from resilience import UpstreamGuard
+
+logger = logging.getLogger(__name__)
+
+UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 20))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 2))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 10))
+# Bulk imports only answer once every document has been written
+UPSTREAM_BULK_TIMEOUT = float(os.environ.get('UPSTREAM_BULK_TIMEOUT', 300))
+# Upper bound on concurrent connections per backend for the asynchronous gateway (asgi_app.py)
+UPSTREAM_MAX_CONNECTIONS = int(os.environ.get('UPSTREAM_MAX_CONNECTIONS', 1000))
+
+# Headers that describe a single connection and must not be forwarded (RFC 9110 section 7.6.1)
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailer', 'trailers', 'transfer-encoding', 'upgrade'
+}
+
+PROXY_METHODS = ['GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS']
+
+
+def forwardable_headers(headers, exclude=()):
+    """Drop hop-by-hop headers, including any named in the Connection header"""
+    connection = {token.strip().lower() for token in headers.get('Connection', '').split(',') if token.strip()}
+    skip = HOP_BY_HOP_HEADERS | connection | {name.lower() for name in exclude}
+    return {key: value for key, value in headers.items() if key.lower() not in skip}
+
+
+def read_timeout(method, path):
+    """UPSTREAM_BULK_TIMEOUT for a bulk import (POST .../bulk), None (the default) for anything else"""
+    if method == 'POST' and path.rstrip('/').rsplit('/', 1)[-1] == 'bulk':
+        return UPSTREAM_BULK_TIMEOUT
+    return None
+
+
+class Upstream:
+    def __init__(self, name, host, port, pool_size=UPSTREAM_POOL_SIZE,
+                 connect_timeout=UPSTREAM_CONNECT_TIMEOUT, read_timeout=UPSTREAM_READ_TIMEOUT):
+        self.name = name
+        self.base_url = f"http://{host}:{port}"
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool = ReplicaPool(name, host, port)
+        self.guard = UpstreamGuard(name)
+        self._health_thread = None
+        self._health_lock = threading.Lock()
+
+        # No automatic retries here: request() decides what may be sent twice.
+        # One connection pool is kept per replica address.
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=pool_size, max_retries=0)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Forward exactly what the client sent; don't add requests' default Accept-Encoding etc.
+        self.session.headers.clear()
+
+    def request(self, method, path, params=None, headers=None, data=None, timeout=None):
+        """Send a request to the backend and return the streamed response.
+
+        Raises resilience.Rejected without contacting the backend while its
+        circuit is open or its concurrency limit is reached. timeout overrides
+        the read timeout for this request.
+        """
+        ticket = self.guard.admit()
+        started = time.monotonic()
+        try:
+            resp = self._send(method, path, params, headers, data, timeout)
+        except requests.RequestException:
+            self.guard.finish(ticket, False, time.monotonic() - started)
+            raise
+        except BaseException:
+            self.guard.cancel(ticket)
+            raise
+        # A request given a longer timeout is expected to be slow; that isn't held against the backend
+        latency = time.monotonic() - started if timeout is None else 0.0
+        self._on_close(resp, lambda: self.guard.finish(ticket, resp.status_code not in RETRYABLE_STATUSES, latency))
+        return resp
+
+    def _send(self, method, path, params, headers, data, timeout):
+        """Send to one replica after another until one answers.
+
+        Connection errors, timeouts and 502/503/504 answers count against the
+        replica; idempotent requests with a replayable body are then retried on
+        another replica.
+        """
+        self.start_health_checks()
+        if not self.pool.replicas():
+            self.pool.resolve()
+
+        headers = dict(headers or {}, Host=self.pool.host_header)
+        attempts = attempts_allowed(method, data is None or isinstance(data, (bytes, str)))
+        tried = []
+        while True:
+            replica = self.pool.choose(exclude=tried)
+            if replica is None:
+                raise requests.ConnectionError(f"No replicas of {self.pool.host} available")
+            tried.append(replica)
+            last_attempt = len(tried) >= attempts or len(tried) >= len(self.pool.replicas())
+
+            self.pool.acquire(replica)
+            try:
+                resp = self.session.request(
+                    method,
+                    f"{replica.url}/{path.lstrip('/')}",
+                    params=params,
+                    headers=headers,
+                    data=data,
+                    stream=True,
+                    allow_redirects=False,
+                    timeout=(self.timeout[0], timeout) if timeout else self.timeout
+                )
+            except requests.RequestException as e:
+                self.pool.release(replica, False)
+                if last_attempt:
+                    raise
+                logger.warning(f"{self.name}: {method} /{path} failed on {replica.address} ({e}); retrying")
+                continue
+            except BaseException:
+                self.pool.release(replica, None)
+                raise
+
+            failed = resp.status_code in RETRYABLE_STATUSES
+            if failed and not last_attempt:
+                resp.close()
+                self.pool.release(replica, False)
+                logger.warning(f"{self.name}: {method} /{path} got {resp.status_code} from {replica.address}; retrying")
+                continue
+            # The replica counts the request as outstanding until its body has been streamed
+            self._on_close(resp, lambda: self.pool.release(replica, not failed))
+            return resp
+
+    @staticmethod
+    def _on_close(resp, callback):
+        """Call callback once, when the response is closed"""
+        close = resp.close
+        called = False
+
+        def close_and_call():
+            nonlocal called
+            try:
+                close()
+            finally:
+                if not called:
+                    called = True
+                    callback()
+
+        resp.close = close_and_call
+
+    def start_health_checks(self):
+        """Start the background DNS refresh and /health checks (once, on first use)"""
+        if self._health_thread is not None:
+            return
+        with self._health_lock:
+            if self._health_thread is None:
+                self._health_thread = threading.Thread(target=self._health_loop, name=f"{self.name}-health",
+                                                       daemon=True)
+                self._health_thread.start()
+
+    def _health_loop(self):
+        while True:
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"{self.name}: health check failed: {e}")
+            time.sleep(UPSTREAM_HEALTH_INTERVAL)
+
+    def check_health(self):
+        if self.pool.needs_resolve():
+            self.pool.resolve()
+        for replica in self.pool.replicas():
+            try:
+                resp = self.session.get(f"{replica.url}/health", headers={'Host': self.pool.host_header},
+                                        timeout=UPSTREAM_HEALTH_TIMEOUT)
+                healthy = resp.status_code == 200
+            except requests.RequestException:
+                healthy = False
+            self.pool.set_health(replica, healthy)
+
+    def describe(self):
+        return dict(self.pool.describe(), **self.guard.describe())
+
+    def __repr__(self):
+        return f"Upstream({self.name!r}, {self.base_url!r})"
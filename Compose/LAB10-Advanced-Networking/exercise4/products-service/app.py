@@ -6,6 +6,13 @@ from pymongo.errors import ConnectionFailure
 from bson.objectid import ObjectId
 from bson.json_util import dumps
 import json
+import re
+from netprobe import NetworkProbe
+from bulk import BulkError, bulk_insert, read_documents
+from listing import (
+    NDJSON_MIMETYPE, STREAM_BATCH_SIZE, ListingError, document_id, find_page, generate_ndjson,
+    next_page_headers, page_of_samples, parse_listing, split_page
+)
 
 app = Flask(__name__)
 
@@ -16,6 +23,12 @@ mongo_db = os.environ.get('MONGO_DB', 'microservices')
 mongo_user = os.environ.get('MONGO_USER', '')
 mongo_password = os.environ.get('MONGO_PASSWORD', '')
 
+# Connectivity checks for /network-info, run in the background
+users_service_host = 'users-service'
+network_probe = NetworkProbe()
+network_probe.add_dns('database', mongo_host)
+network_probe.add_dns('users_service', users_service_host)
+
 # Sample data when DB is not available
 sample_products = [
     {"_id": "1", "name": "Laptop", "price": 999.99, "category": "Electronics", "in_stock": True},
@@ -41,9 +54,13 @@ try:
     db = db_client[mongo_db]
     products_collection = db.products
     
-    # Create indexes
+    # Create indexes: equality fields first, then the sort/range field, so /products/query
+    # can filter and sort in the index (category lookups use the prefix of the first one)
+    products_collection.create_index([("category", pymongo.ASCENDING), ("price", pymongo.ASCENDING)])
+    products_collection.create_index([("in_stock", pymongo.ASCENDING), ("price", pymongo.ASCENDING)])
+    products_collection.create_index("price")
     products_collection.create_index("name")
-    products_collection.create_index("category")
+    products_collection.create_index([("name", pymongo.TEXT), ("category", pymongo.TEXT)], name="products_text")
     
     # Insert sample data if collection is empty
     if products_collection.count_documents({}) == 0:
@@ -72,25 +89,50 @@ def index():
             "host": mongo_host
         },
         "endpoints": [
-            {"path": "/products", "method": "GET", "description": "Get all products"},
+            {"path": "/products", "method": "GET",
+             "description": "List products, a page at a time (?limit=, ?after=, ?fields=, ?format=ndjson)"},
             {"path": "/products/<id>", "method": "GET", "description": "Get product by ID"},
             {"path": "/products", "method": "POST", "description": "Create a new product"},
+            {"path": "/products/bulk", "method": "POST",
+             "description": "Create many products from a JSON array or an NDJSON stream"},
             {"path": "/products/category/<category>", "method": "GET", "description": "Get products by category"},
+            {"path": "/products/query", "method": "GET",
+             "description": "Filter and sort products (?min_price=, ?max_price=, ?in_stock=, ?category=, "
+                            "?name_prefix=, ?q=, ?sort=, ?explain=true)"},
             {"path": "/health", "method": "GET", "description": "Service health check"}
         ]
     })
 
 @app.route('/products', methods=['GET'])
 def get_products():
-    """Get all products"""
+    """List products in _id order, one page at a time (see listing.py)"""
+    try:
+        listing = parse_listing(request.args)
+    except ListingError as e:
+        return jsonify({"error": str(e)}), 400
+    
     if db_connected:
         try:
-            products = list(products_collection.find())
-            return Response(dumps(products), mimetype='application/json')
+            return listing_response(find_page(products_collection, {}, listing), listing)
         except Exception as e:
             return jsonify({"error": str(e), "products": sample_products})
     else:
-        return jsonify({"products": sample_products, "note": "Using sample data - DB not connected"})
+        return listing_response(page_of_samples(sample_products, listing), listing,
+                                sample_note="Using sample data - DB not connected")
+
+def listing_response(documents, listing, sample_note=None, next_page=True):
+    """Stream documents as NDJSON, or answer with one JSON page and a link to the next"""
+    if listing.ndjson:
+        return Response(generate_ndjson(documents), mimetype=NDJSON_MIMETYPE)
+    
+    page, next_after = split_page(documents, listing)
+    if not next_page:
+        next_after = None
+    body = page if sample_note is None else {"products": page, "note": sample_note}
+    response = Response(dumps(body), mimetype='application/json')
+    for name, value in next_page_headers(request.path, request.args, next_after).items():
+        response.headers[name] = value
+    return response
 
 @app.route('/products/<product_id>', methods=['GET'])
 def get_product(product_id):
@@ -121,20 +163,173 @@ def get_product(product_id):
 
 @app.route('/products/category/<category>', methods=['GET'])
 def get_products_by_category(category):
-    """Get products by category"""
+    """Get products by category, paginated like /products"""
+    try:
+        listing = parse_listing(request.args)
+    except ListingError as e:
+        return jsonify({"error": str(e)}), 400
+    
     if db_connected:
         try:
-            products = list(products_collection.find({"category": category}))
-            if products:
-                return Response(dumps(products), mimetype='application/json')
-            else:
-                return jsonify({"products": [], "message": "No products found in this category"})
+            documents = find_page(products_collection, {"category": category}, listing)
+            if not listing.ndjson and listing.after is None:
+                documents = list(documents)
+                if not documents:
+                    return jsonify({"products": [], "message": "No products found in this category"})
+            return listing_response(documents, listing)
         except Exception as e:
             return jsonify({"error": str(e)}), 500
     else:
         # Use sample data
         filtered_products = [p for p in sample_products if p["category"].lower() == category.lower()]
-        return jsonify({"products": filtered_products, "note": "Using sample data - DB not connected"})
+        return listing_response(page_of_samples(filtered_products, listing), listing,
+                                sample_note="Using sample data - DB not connected")
+
+# Fields /products/query can sort on; "relevance" orders text search (?q=) results by score
+SORT_FIELDS = {"name", "price", "category", "in_stock", "_id"}
+
+def parse_product_query(args):
+    """Build a MongoDB filter and sort from the query string; raises ValueError on bad input"""
+    query = {}
+    
+    price = {}
+    for param, operator in (("min_price", "$gte"), ("max_price", "$lte")):
+        if args.get(param):
+            try:
+                price[operator] = float(args[param])
+            except ValueError:
+                raise ValueError(f"{param} must be a number")
+    if price:
+        query["price"] = price
+    
+    if args.get("in_stock"):
+        if args["in_stock"].lower() not in ("true", "false"):
+            raise ValueError("in_stock must be true or false")
+        query["in_stock"] = args["in_stock"].lower() == "true"
+    
+    if args.get("category"):
+        query["category"] = args["category"]
+    
+    # An anchored, case-sensitive prefix can be answered from the name index
+    if args.get("name_prefix"):
+        query["name"] = {"$regex": "^" + re.escape(args["name_prefix"])}
+    
+    if args.get("q"):
+        query["$text"] = {"$search": args["q"]}
+    
+    sort = []
+    for key in filter(None, (key.strip() for key in args.get("sort", "").split(","))):
+        if key == "relevance":
+            if not args.get("q"):
+                raise ValueError("sort=relevance needs a text search (q)")
+            sort.append(("score", {"$meta": "textScore"}))
+            continue
+        field = key.lstrip("-")
+        if field not in SORT_FIELDS:
+            raise ValueError(f"Cannot sort on {field}; use one of {', '.join(sorted(SORT_FIELDS))} or relevance")
+        sort.append((field, pymongo.DESCENDING if key.startswith("-") else pymongo.ASCENDING))
+    
+    return query, sort
+
+def index_usage(node, indexes=None, stages=None):
+    """Collect the stages and index names from an explain plan, whatever its shape"""
+    indexes = set() if indexes is None else indexes
+    stages = [] if stages is None else stages
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append(node["stage"])
+        if "indexName" in node:
+            indexes.add(node["indexName"])
+        for value in node.values():
+            index_usage(value, indexes, stages)
+    elif isinstance(node, list):
+        for value in node:
+            index_usage(value, indexes, stages)
+    return indexes, stages
+
+def explain_summary(cursor):
+    plan = cursor.explain()
+    winning_plan = plan["queryPlanner"]["winningPlan"]
+    indexes, stages = index_usage(winning_plan)
+    stats = plan.get("executionStats", {})
+    return {
+        "indexes_used": sorted(indexes),
+        "stages": stages,
+        "collection_scan": "COLLSCAN" in stages,
+        "in_memory_sort": "SORT" in stages,
+        "returned": stats.get("nReturned"),
+        "keys_examined": stats.get("totalKeysExamined"),
+        "docs_examined": stats.get("totalDocsExamined"),
+        "execution_ms": stats.get("executionTimeMillis"),
+        "winning_plan": winning_plan
+    }
+
+def query_samples(query, sort, listing, args):
+    """Apply a product query to the sample data"""
+    products = list(sample_products)
+    price = query.get("price", {})
+    if "$gte" in price:
+        products = [p for p in products if p["price"] >= price["$gte"]]
+    if "$lte" in price:
+        products = [p for p in products if p["price"] <= price["$lte"]]
+    if "in_stock" in query:
+        products = [p for p in products if p["in_stock"] == query["in_stock"]]
+    if "category" in query:
+        products = [p for p in products if p["category"] == query["category"]]
+    if args.get("name_prefix"):
+        products = [p for p in products if p["name"].startswith(args["name_prefix"])]
+    if args.get("q"):
+        words = args["q"].lower().split()
+        products = [p for p in products if any(word in f"{p['name']} {p['category']}".lower() for word in words)]
+    if not sort:
+        return page_of_samples(products, listing)
+    
+    for field, direction in reversed(sort):
+        if field != "score":
+            products.sort(key=lambda p: p[field], reverse=direction == pymongo.DESCENDING)
+    if listing.fields:
+        products = [{key: value for key, value in p.items() if key == "_id" or key in listing.fields}
+                    for p in products]
+    return products if listing.limit is None else products[:listing.limit + (0 if listing.ndjson else 1)]
+
+@app.route('/products/query', methods=['GET'])
+def query_products():
+    """Filter and sort products in MongoDB, using the compound indexes created at startup"""
+    try:
+        query, sort = parse_product_query(request.args)
+        listing = parse_listing(request.args)
+    except (ValueError, ListingError) as e:
+        return jsonify({"error": str(e)}), 400
+    if sort and listing.after is not None:
+        return jsonify({"error": "after can only be used with the default _id order"}), 400
+    explain = request.args.get("explain", "").lower() == "true"
+    
+    if not db_connected:
+        if explain:
+            return jsonify({"error": "explain needs the database - DB not connected"}), 503
+        return listing_response(query_samples(query, sort, listing, request.args), listing,
+                                sample_note="Using sample data - DB not connected", next_page=not sort)
+    
+    try:
+        filters = dict(query)
+        if listing.after is not None:
+            filters["_id"] = {"$gt": document_id(listing.after)}
+        projection = dict.fromkeys(listing.fields, 1) if listing.fields else {}
+        if "$text" in query:
+            projection["score"] = {"$meta": "textScore"}
+        cursor = products_collection.find(filters, projection or None)
+        cursor = cursor.sort(sort or [("_id", pymongo.ASCENDING)]).batch_size(STREAM_BATCH_SIZE)
+        if listing.limit is not None:
+            cursor = cursor.limit(listing.limit + (0 if listing.ndjson else 1))
+        
+        if explain:
+            return Response(dumps({"filter": query, "sort": sort, "explain": explain_summary(cursor)}),
+                            mimetype='application/json')
+        return listing_response(cursor, listing, next_page=not sort)
+    except pymongo.errors.OperationFailure as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/products', methods=['POST'])
 def create_product():
@@ -146,13 +341,9 @@ def create_product():
     
     if db_connected:
         try:
-            # Check required fields
-            if not all(k in product_data for k in ("name", "price", "category")):
-                return jsonify({"error": "Missing required fields"}), 400
-            
-            # Set default for in_stock if not provided
-            if "in_stock" not in product_data:
-                product_data["in_stock"] = True
+            error = validate_product(product_data)
+            if error:
+                return jsonify({"error": error}), 400
             
             result = products_collection.insert_one(product_data)
             
@@ -173,6 +364,36 @@ def create_product():
             "note": "Using sample data - DB not connected"
         }), 201
 
+def validate_product(product_data):
+    """Return an error message, or None after filling in defaults"""
+    # Check required fields
+    if not all(k in product_data for k in ("name", "price", "category")):
+        return "Missing required fields"
+    
+    # Set default for in_stock if not provided
+    if "in_stock" not in product_data:
+        product_data["in_stock"] = True
+    return None
+
+@app.route('/products/bulk', methods=['POST'])
+def create_products_bulk():
+    """Create many products from a JSON array or an NDJSON stream, in unordered chunks (see bulk.py)"""
+    try:
+        items = read_documents(request)
+    except BulkError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Without a database the documents are only validated
+    result = bulk_insert(products_collection if db_connected else None, items, validate_product)
+    body = result.to_dict()
+    if not db_connected:
+        body["note"] = "Using sample data - DB not connected"
+    
+    if result.aborted:
+        return jsonify(body), 500
+    # 207: some documents were written and some weren't
+    return jsonify(body), 201 if result.failed == 0 else 207
+
 # Helper for JSON serialization of ObjectId
 class Response(Flask.response_class):
     @classmethod
@@ -183,57 +404,30 @@ class Response(Flask.response_class):
 
 @app.route('/network-info')
 def network_info():
-    """Get network information"""
-    hostname = socket.gethostname()
-    container_ip = socket.gethostbyname(hostname)
-    
-    # Check DB connectivity
-    db_ip = None
-    db_reachable = False
-    
-    try:
-        db_ip = socket.gethostbyname(mongo_host)
-        db_reachable = db_connected
-    except socket.gaierror:
-        pass
-        
-    # Try to connect to users-service
-    users_service_host = 'users-service'
-    users_service_reachable = False
-    users_service_ip = None
-    
-    try:
-        users_service_ip = socket.gethostbyname(users_service_host)
-        users_service_reachable = True
-    except socket.gaierror:
-        pass
-    
-    # Get network interfaces
-    import netifaces
-    interfaces = {}
-    for iface in netifaces.interfaces():
-        addrs = netifaces.ifaddresses(iface)
-        if netifaces.AF_INET in addrs:
-            interfaces[iface] = addrs[netifaces.AF_INET][0]['addr']
+    """Get network information (refreshed in the background)"""
+    snapshot = network_probe.snapshot()
+    db = snapshot['probes']['database']
+    users_service = snapshot['probes']['users_service']
     
     return jsonify({
         "service": "products-service",
-        "hostname": hostname,
-        "ip": container_ip,
-        "interfaces": interfaces,
+        "hostname": snapshot['hostname'],
+        "ip": snapshot['ip'],
+        "interfaces": snapshot['interfaces'],
         "connectivity": {
             "database": {
                 "host": mongo_host,
-                "ip": db_ip,
-                "reachable": db_reachable,
+                "ip": db.get('ip'),
+                "reachable": db['status'] == 'resolved' and db_connected,
                 "connected": db_connected
             },
             "users_service": {
                 "host": users_service_host,
-                "ip": users_service_ip,
-                "reachable": users_service_reachable
+                "ip": users_service.get('ip'),
+                "reachable": users_service['status'] == 'resolved'
             }
-        }
+        },
+        "snapshot_age": snapshot['age']
     })
 
 @app.route('/health')
@@ -0,0 +1,141 @@
+"""
+Bulk inserts for large imports.
+
+A bulk endpoint takes many documents in one HTTP request, either as a JSON
+array or as an NDJSON stream (Content-Type: application/x-ndjson, one document
+per line), and writes them with insert_many(ordered=False) in chunks of
+BULK_CHUNK_SIZE. An NDJSON body is read line by line, so at most one chunk is
+held in memory however large the import is.
+
+Invalid documents and failed writes (such as a duplicate key) are reported by
+their position in the request and don't stop the rest of the batch:
+
+    {"received": 3, "inserted": 2, "failed": 1,
+     "errors": [{"index": 1, "error": "Email already exists"}]}
+
+Only a database error that fails a whole chunk (e.g. the connection is lost)
+stops the import; the response then says so in "aborted". Everything before
+that chunk has been written; since the chunk is unordered, any of its documents
+may or may not have been, so they are counted as "unknown" rather than failed.
+
+The same file is used by users-service and products-service.
+"""
+
+import json
+import os
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', 1000))
+# Errors listed in the response; beyond this only the count is reported
+BULK_MAX_ERRORS = int(os.environ.get('BULK_MAX_ERRORS', 1000))
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+DUPLICATE_KEY = 11000
+
+
+class BulkError(ValueError):
+    """The request body can't be read as a batch of documents (answered with 400)"""
+
+
+def read_documents(request):
+    """Yield (index, document, error) for each item of a JSON array or NDJSON body"""
+    if request.mimetype == NDJSON_MIMETYPE:
+        return _read_ndjson(request.stream)
+
+    documents = request.get_json(silent=True)
+    if not isinstance(documents, list):
+        raise BulkError(f"Expected a JSON array or an {NDJSON_MIMETYPE} body")
+    return ((index, document, None) for index, document in enumerate(documents))
+
+
+def _read_ndjson(stream):
+    index = 0
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield index, json.loads(line), None
+        except ValueError as e:
+            yield index, None, f"Invalid JSON: {e}"
+        index += 1
+
+
+class BulkResult:
+    def __init__(self):
+        self.received = 0
+        self.inserted = 0
+        self.failed = 0
+        self.unknown = 0
+        self.errors = []
+        self.aborted = None
+
+    def error(self, index, message, unknown=False):
+        """unknown: the document may or may not have been written"""
+        if unknown:
+            self.unknown += 1
+        else:
+            self.failed += 1
+        if len(self.errors) < BULK_MAX_ERRORS:
+            self.errors.append({"index": index, "error": message})
+
+    def to_dict(self):
+        result = {"received": self.received, "inserted": self.inserted, "failed": self.failed,
+                  "errors": sorted(self.errors, key=lambda error: error["index"])}
+        if self.failed + self.unknown > len(self.errors):
+            result["errors_truncated"] = True
+        if self.aborted:
+            result["aborted"] = self.aborted
+            result["unknown"] = self.unknown
+        return result
+
+
+def bulk_insert(collection, items, validate, duplicate_message="Duplicate key", chunk_size=BULK_CHUNK_SIZE):
+    """Validate and insert documents in unordered chunks.
+
+    validate(document) returns an error message, or None after preparing the
+    document for insertion (e.g. setting defaults). collection may be None to
+    only validate, e.g. when the database isn't available.
+    """
+    result = BulkResult()
+    chunk = []  # (index, document)
+
+    for index, document, error in items:
+        result.received += 1
+        if error is None:
+            error = validate(document) if isinstance(document, dict) else "Expected a JSON object"
+        if error is not None:
+            result.error(index, error)
+            continue
+        chunk.append((index, document))
+        if len(chunk) >= chunk_size:
+            _insert_chunk(collection, chunk, result, duplicate_message)
+            chunk = []
+            if result.aborted:
+                return result
+
+    if chunk:
+        _insert_chunk(collection, chunk, result, duplicate_message)
+    return result
+
+
+def _insert_chunk(collection, chunk, result, duplicate_message):
+    if collection is None:
+        result.inserted += len(chunk)
+        return
+    try:
+        collection.insert_many([document for _, document in chunk], ordered=False)
+        result.inserted += len(chunk)
+    except BulkWriteError as e:
+        # Unordered: everything that could be written was; report the rest by request position
+        result.inserted += e.details.get('nInserted', 0)
+        for write_error in e.details.get('writeErrors', []):
+            message = duplicate_message if write_error.get('code') == DUPLICATE_KEY else write_error.get('errmsg')
+            result.error(chunk[write_error['index']][0], message)
+    except PyMongoError as e:
+        # Unordered: part of the chunk may have been committed before the error
+        result.aborted = str(e)
+        for index, _ in chunk:
+            result.error(index, "Unknown: the import was aborted while writing this chunk; it may have been written",
+                         unknown=True)
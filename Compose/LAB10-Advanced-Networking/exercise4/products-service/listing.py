@@ -0,0 +1,133 @@
+"""
+Paginated, projected and streamed collection listings.
+
+Instead of loading a whole collection into memory and serialising it in one
+go, a listing returns one page at a time, ordered by _id:
+
+    GET /products?limit=50                      first 50 documents
+    GET /products?limit=50&after=<last _id>     the next 50 (keyset pagination)
+    GET /products?fields=name,price             only these fields (and _id)
+    GET /products?format=ndjson                 every document, one JSON document per line,
+                                                streamed as the cursor yields them
+
+JSON pages are capped at MAX_PAGE_SIZE documents; when there are more, the
+response carries a Link: <...>; rel="next" header and X-Next-After with the
+cursor for the next page. NDJSON responses aren't capped (pass limit to cap
+them), and memory use stays flat however many documents are streamed.
+
+The same file is used by users-service and products-service.
+"""
+
+import os
+import re
+from collections import namedtuple
+from urllib.parse import urlencode
+
+from bson.json_util import dumps
+from bson.objectid import ObjectId
+
+DEFAULT_PAGE_SIZE = int(os.environ.get('DEFAULT_PAGE_SIZE', 100))
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 1000))
+# Documents fetched from MongoDB per round trip while streaming
+STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', 500))
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z0-9_]+)*$')
+
+Listing = namedtuple('Listing', ['limit', 'after', 'fields', 'ndjson'])
+
+
+class ListingError(ValueError):
+    """Invalid listing parameters (answered with 400)"""
+
+
+def parse_listing(args):
+    """Read limit, after, fields and format from the query string"""
+    # Only the query string picks the format, so a URL always means the same
+    # representation to caches keyed on it (such as the gateway's)
+    ndjson = args.get('format') == 'ndjson'
+
+    limit = args.get('limit')
+    if limit is None:
+        limit = None if ndjson else DEFAULT_PAGE_SIZE
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ListingError("limit must be an integer")
+        if limit < 1:
+            raise ListingError("limit must be at least 1")
+        if not ndjson:
+            limit = min(limit, MAX_PAGE_SIZE)
+
+    fields = None
+    if args.get('fields'):
+        fields = [field.strip() for field in args['fields'].split(',') if field.strip()]
+        invalid = [field for field in fields if not FIELD_NAME.match(field)]
+        if invalid:
+            raise ListingError(f"Invalid field names: {', '.join(invalid)}")
+
+    return Listing(limit, args.get('after'), fields, ndjson)
+
+
+def document_id(value):
+    """IDs are ObjectIds when they look like one, plain strings otherwise"""
+    return ObjectId(value) if ObjectId.is_valid(value) else value
+
+
+def find_page(collection, query, listing):
+    """Cursor over the listing's documents, in _id order; JSON pages fetch one extra to detect a next page"""
+    if listing.after is not None:
+        query = {'$and': [query, {'_id': {'$gt': document_id(listing.after)}}]} if query else \
+            {'_id': {'$gt': document_id(listing.after)}}
+    projection = dict.fromkeys(listing.fields, 1) if listing.fields else None
+
+    cursor = collection.find(query, projection).sort('_id', 1).batch_size(STREAM_BATCH_SIZE)
+    if listing.limit is not None:
+        cursor = cursor.limit(listing.limit + (0 if listing.ndjson else 1))
+    return cursor
+
+
+def page_of_samples(samples, listing):
+    """Apply the same listing to in-memory sample documents"""
+    documents = sorted(samples, key=lambda document: str(document['_id']))
+    if listing.after is not None:
+        documents = [document for document in documents if str(document['_id']) > listing.after]
+    if listing.fields:
+        documents = [{key: value for key, value in document.items() if key == '_id' or key in listing.fields}
+                     for document in documents]
+    if listing.limit is not None:
+        documents = documents[:listing.limit + (0 if listing.ndjson else 1)]
+    return documents
+
+
+def split_page(documents, listing):
+    """(page, cursor for the next page or None) from the limit + 1 documents fetched"""
+    documents = list(documents)
+    if len(documents) <= listing.limit:
+        return documents, None
+    page = documents[:listing.limit]
+    return page, str(page[-1]['_id'])
+
+
+def next_page_headers(path, args, next_after):
+    """Link and X-Next-After headers pointing at the next page"""
+    if next_after is None:
+        return {}
+    params = dict(args.items())
+    params['after'] = next_after
+    return {
+        'Link': f'<{path}?{urlencode(params)}>; rel="next"',
+        'X-Next-After': next_after
+    }
+
+
+def generate_ndjson(documents):
+    """Serialise documents one per line as they are read"""
+    try:
+        for document in documents:
+            yield dumps(document) + '\n'
+    except Exception as e:
+        # The status line has already been sent; report the failure in-band
+        yield dumps({"error": str(e)}) + '\n'
@@ -0,0 +1,155 @@
+"""
+Cached connectivity diagnostics for the /network-info endpoint.
+
+Resolving names, enumerating network interfaces and calling each dependency's
+/health endpoint one after another made /network-info take seconds when
+dependencies were down. NetworkProbe does that work in a background thread
+instead: probes run concurrently, DNS answers and the interface list are
+cached for a short time, and the endpoint just returns the latest snapshot.
+
+    network_probe = NetworkProbe()
+    network_probe.add_http('backend', 'backend', 8000)   # resolve + GET /health
+    network_probe.add_dns('db', 'db')                     # resolve only
+
+    snapshot = network_probe.snapshot()
+
+The same file is copied into each service directory, since every service is
+built from its own directory.
+"""
+
+import concurrent.futures
+import http.client
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+import netifaces
+
+logger = logging.getLogger(__name__)
+
+NETWORK_PROBE_INTERVAL = float(os.environ.get('NETWORK_PROBE_INTERVAL', 5))
+NETWORK_PROBE_TIMEOUT = float(os.environ.get('NETWORK_PROBE_TIMEOUT', 1))
+NETWORK_DNS_TTL = float(os.environ.get('NETWORK_DNS_TTL', 10))
+NETWORK_INTERFACES_TTL = float(os.environ.get('NETWORK_INTERFACES_TTL', 60))
+
+
+def list_interfaces():
+    """IPv4 address of each network interface"""
+    interfaces = {}
+    for iface in netifaces.interfaces():
+        addrs = netifaces.ifaddresses(iface)
+        if netifaces.AF_INET in addrs:
+            interfaces[iface] = addrs[netifaces.AF_INET][0]['addr']
+    return interfaces
+
+
+class NetworkProbe:
+    def __init__(self, interval=NETWORK_PROBE_INTERVAL, timeout=NETWORK_PROBE_TIMEOUT,
+                 dns_ttl=NETWORK_DNS_TTL, interfaces_ttl=NETWORK_INTERFACES_TTL):
+        self.interval = interval
+        self.timeout = timeout
+        self.dns_ttl = dns_ttl
+        self.interfaces_ttl = interfaces_ttl
+        self._targets = {}          # name -> (host, port, path); port is None for DNS-only probes
+        self._dns = {}              # host -> (expires, ip, error)
+        self._interfaces = {}
+        self._interfaces_expire = 0.0
+        self._snapshot = None       # (taken, results)
+        self._refresh_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix='netprobe')
+
+    def add_dns(self, name, host):
+        """Report whether host resolves"""
+        self._targets[name] = (host, None, None)
+
+    def add_http(self, name, host, port, path='/health'):
+        """Report whether host resolves and answers GET path with 200"""
+        self._targets[name] = (host, int(port), path)
+
+    def start(self):
+        """Take the first snapshot, then keep refreshing in the background (once)"""
+        with self._start_lock:
+            if self._thread is not None:
+                return
+            self.refresh()
+            self._thread = threading.Thread(target=self._run, name='netprobe', daemon=True)
+            self._thread.start()
+
+    def snapshot(self):
+        """Latest results: hostname, ip, interfaces, probes (by name) and their age in seconds.
+
+        The first call takes the first snapshot; later calls never block.
+        """
+        if self._thread is None:
+            self.start()
+        taken, results = self._snapshot
+        return dict(results, age=round(time.monotonic() - taken, 3))
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Network probe failed: {e}")
+
+    def refresh(self):
+        with self._refresh_lock:
+            now = time.monotonic()
+            if now >= self._interfaces_expire:
+                self._interfaces = list_interfaces()
+                self._interfaces_expire = now + self.interfaces_ttl
+
+            hostname = socket.gethostname()
+            hosts = {hostname} | {host for host, _, _ in self._targets.values()}
+            expired = [host for host in hosts if host not in self._dns or self._dns[host][0] <= now]
+            for host, (ip, error) in zip(expired, self._executor.map(self._resolve, expired)):
+                self._dns[host] = (now + self.dns_ttl, ip, error)
+
+            names = list(self._targets)
+            results = self._executor.map(lambda name: self._probe(*self._targets[name]), names)
+            self._snapshot = (time.monotonic(), {
+                'hostname': hostname,
+                'ip': self._dns[hostname][1],
+                'interfaces': self._interfaces,
+                'probes': dict(zip(names, results))
+            })
+
+    @staticmethod
+    def _resolve(host):
+        try:
+            return socket.gethostbyname(host), None
+        except socket.gaierror:
+            return None, f"Cannot resolve hostname: {host}"
+
+    def _probe(self, host, port, path):
+        _, ip, error = self._dns[host]
+        if ip is None:
+            return {"status": "dns_error", "error": error}
+        if port is None:
+            return {"status": "resolved", "ip": ip}
+
+        started = time.monotonic()
+        connection = http.client.HTTPConnection(ip, port, timeout=self.timeout)
+        try:
+            connection.request('GET', path, headers={'Host': f"{host}:{port}"})
+            response = connection.getresponse()
+            body = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            return {"status": "unreachable", "ip": ip, "error": str(e) or type(e).__name__}
+        finally:
+            connection.close()
+
+        latency_ms = round((time.monotonic() - started) * 1000, 1)
+        if response.status != 200:
+            return {"status": "error", "ip": ip, "error": f"HTTP {response.status}", "latency_ms": latency_ms}
+        try:
+            details = json.loads(body)
+        except ValueError:
+            details = None
+        return {"status": "connected", "ip": ip, "details": details, "latency_ms": latency_ms}
@@ -6,6 +6,12 @@ from pymongo.errors import ConnectionFailure
 from bson.objectid import ObjectId
 from bson.json_util import dumps
 import json
+from netprobe import NetworkProbe
+from bulk import BulkError, bulk_insert, read_documents
+from listing import (
+    NDJSON_MIMETYPE, ListingError, find_page, generate_ndjson, next_page_headers, page_of_samples,
+    parse_listing, split_page
+)
 
 app = Flask(__name__)
 
@@ -16,6 +22,10 @@ mongo_db = os.environ.get('MONGO_DB', 'microservices')
 mongo_user = os.environ.get('MONGO_USER', '')
 mongo_password = os.environ.get('MONGO_PASSWORD', '')
 
+# Connectivity checks for /network-info, run in the background
+network_probe = NetworkProbe()
+network_probe.add_dns('database', mongo_host)
+
 # Sample data when DB is not available
 sample_users = [
     {"_id": "1", "name": "John Doe", "email": "john@example.com", "role": "admin"},
@@ -71,24 +81,44 @@ def index():
             "host": mongo_host
         },
         "endpoints": [
-            {"path": "/users", "method": "GET", "description": "Get all users"},
+            {"path": "/users", "method": "GET",
+             "description": "List users, a page at a time (?limit=, ?after=, ?fields=, ?format=ndjson)"},
             {"path": "/users/<id>", "method": "GET", "description": "Get user by ID"},
             {"path": "/users", "method": "POST", "description": "Create a new user"},
+            {"path": "/users/bulk", "method": "POST",
+             "description": "Create many users from a JSON array or an NDJSON stream"},
             {"path": "/health", "method": "GET", "description": "Service health check"}
         ]
     })
 
 @app.route('/users', methods=['GET'])
 def get_users():
-    """Get all users"""
+    """List users in _id order, one page at a time (see listing.py)"""
+    try:
+        listing = parse_listing(request.args)
+    except ListingError as e:
+        return jsonify({"error": str(e)}), 400
+    
     if db_connected:
         try:
-            users = list(users_collection.find())
-            return Response(dumps(users), mimetype='application/json')
+            return listing_response(find_page(users_collection, {}, listing), listing)
         except Exception as e:
             return jsonify({"error": str(e), "users": sample_users})
     else:
-        return jsonify({"users": sample_users, "note": "Using sample data - DB not connected"})
+        return listing_response(page_of_samples(sample_users, listing), listing,
+                                sample_note="Using sample data - DB not connected")
+
+def listing_response(documents, listing, sample_note=None):
+    """Stream documents as NDJSON, or answer with one JSON page and a link to the next"""
+    if listing.ndjson:
+        return Response(generate_ndjson(documents), mimetype=NDJSON_MIMETYPE)
+    
+    page, next_after = split_page(documents, listing)
+    body = page if sample_note is None else {"users": page, "note": sample_note}
+    response = Response(dumps(body), mimetype='application/json')
+    for name, value in next_page_headers(request.path, request.args, next_after).items():
+        response.headers[name] = value
+    return response
 
 @app.route('/users/<user_id>', methods=['GET'])
 def get_user(user_id):
@@ -127,9 +157,9 @@ def create_user():
     
     if db_connected:
         try:
-            # Check required fields
-            if not all(k in user_data for k in ("name", "email")):
-                return jsonify({"error": "Missing required fields"}), 400
+            error = validate_user(user_data)
+            if error:
+                return jsonify({"error": error}), 400
             
             result = users_collection.insert_one(user_data)
             
@@ -152,6 +182,33 @@ def create_user():
             "note": "Using sample data - DB not connected"
         }), 201
 
+def validate_user(user_data):
+    """Return an error message, or None if the user can be inserted"""
+    # Check required fields
+    if not all(k in user_data for k in ("name", "email")):
+        return "Missing required fields"
+    return None
+
+@app.route('/users/bulk', methods=['POST'])
+def create_users_bulk():
+    """Create many users from a JSON array or an NDJSON stream, in unordered chunks (see bulk.py)"""
+    try:
+        items = read_documents(request)
+    except BulkError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    # Without a database the documents are only validated
+    result = bulk_insert(users_collection if db_connected else None, items, validate_user,
+                         duplicate_message="Email already exists")
+    body = result.to_dict()
+    if not db_connected:
+        body["note"] = "Using sample data - DB not connected"
+    
+    if result.aborted:
+        return jsonify(body), 500
+    # 207: some documents were written and some weren't
+    return jsonify(body), 201 if result.failed == 0 else 207
+
 # Helper for JSON serialization of ObjectId
 class Response(Flask.response_class):
     @classmethod
@@ -162,41 +219,24 @@ class Response(Flask.response_class):
 
 @app.route('/network-info')
 def network_info():
-    """Get network information"""
-    hostname = socket.gethostname()
-    container_ip = socket.gethostbyname(hostname)
-    
-    # Check DB connectivity
-    db_ip = None
-    db_reachable = False
-    
-    try:
-        db_ip = socket.gethostbyname(mongo_host)
-        db_reachable = db_connected
-    except socket.gaierror:
-        pass
-    
-    # Get network interfaces
-    import netifaces
-    interfaces = {}
-    for iface in netifaces.interfaces():
-        addrs = netifaces.ifaddresses(iface)
-        if netifaces.AF_INET in addrs:
-            interfaces[iface] = addrs[netifaces.AF_INET][0]['addr']
+    """Get network information (refreshed in the background)"""
+    snapshot = network_probe.snapshot()
+    db = snapshot['probes']['database']
     
     return jsonify({
         "service": "users-service",
-        "hostname": hostname,
-        "ip": container_ip,
-        "interfaces": interfaces,
+        "hostname": snapshot['hostname'],
+        "ip": snapshot['ip'],
+        "interfaces": snapshot['interfaces'],
         "connectivity": {
             "database": {
                 "host": mongo_host,
-                "ip": db_ip,
-                "reachable": db_reachable,
+                "ip": db.get('ip'),
+                "reachable": db['status'] == 'resolved' and db_connected,
                 "connected": db_connected
             }
-        }
+        },
+        "snapshot_age": snapshot['age']
     })
 
 @app.route('/health')